@@ -4,719 +4,219 @@
 # Systems Supported: Windows, Mac, Linux
 
 
-import serial
-import serial.tools.list_ports
-import pyautogui
-import mouse
 import time
-import keyboard
-from screeninfo import get_monitors
-import tkinter as tk
-import threading
-from flask import Flask, request, jsonify
+launched = time.perf_counter()  # startup times are measured from here, see hid_controller/startup.py
 
+import serial
+import threading
+from hid_controller import protocol
+from hid_controller.connection import open_microprocessor_port
+from hid_controller.engine import ForwardingEngine
+from hid_controller.latency import LatencyTracker
+from hid_controller.motion_rate import MotionRateController
+from hid_controller.recorder import InputRecorder
+from hid_controller.reliable import ReliableSender
+from hid_controller.request_pipeline import RequestPipeline
+from hid_controller.serial_reader import SerialReader
+from hid_controller.serial_writer import SerialWriter
+from hid_controller.startup import StartupTimer
+from hid_controller.supervised_serial import SupervisedSerial
+from hid_controller.targets import Target
+from hid_controller.text_sender import TextSender
+
+# Lets microprocessor_port be "sim://" for the software tx.ino/rx.ino, see hid_controller/simulator.py
+serial.protocol_handler_packages.append("hid_controller")
 
-device_width= 2560
-device_height= 1440
 
 # Target computer's screen dimensions (e.g., MacBook Air M2 Retina)
-target_width = 1728  # Width of the target computer's screen
-target_height = 1117  # Height of the target computer's screen
+target_width = 2560  # Width of the target computer's screen
+target_height = 1600  # Height of the target computer's screen
 
 mouse_compensator_factor = 1.5
+mouse_sensitivity = 2  # Gain on top of the screen ratio, tx.ino used to double the coordinates
 # Configuration
 host_system = "windows"  # Options: "windows", "linux", "mac"
 target_system = "windows"  # Options: "windows", "linux", "mac"
-microprocessor_port = None  # Set to None to auto-detect the port
+microprocessor_port = None  # Set to None to auto-detect the port, "sim://" or a simulator pty to run without boards
+serial_baud_rate = 1000000
+serial_protocol = protocol.PROTOCOL_BINARY  # Options: PROTOCOL_BINARY (compact frames), PROTOCOL_ASCII (text lines, for older tx.ino builds)
+mouse_forwarding_mode = "event"  # Options: "event" (driven by mouse.hook move events), "poll" (legacy 20 ms loop)
+record_input_path = None  # Set to a file name to log hook events and sent frames, replay with python -m hid_controller.recorder
 SERVER_PORT = 5000
-ser = None # Serial port object for the microcontroller
-# Global variables
-mouse_left_click = False
-mouse_right_click = False
-mouse_left_released = False
-mouse_right_released = False
-allow_target_mouse_switching = True
 log_microcontroller_messages = True
 log_operational_messages = True
 log_mouse_movement = False
 log_key_presses = False
-web_request = False
-# Track sent mouse actions
-mlc_sent = False  # Left click sent
-mrc_sent = False  # Right click sent
-mlcr_sent = False  # Left click released sent
-mrcr_sent = False  # Right click released sent
-special_keys_pressed = set()  # Initialize the set
-isSpecialKeyPressed = False
-keyboard_wait = False
-
-off_system = False
-
-
-monitors = get_monitors()
-right_monitor = max(monitors, key=lambda m: m.x)
-
-# Host computer's screen dimensions
-host_width = right_monitor.width
-host_height = right_monitor.height
-
-# Target computer's screen dimensions (e.g., MacBook Air M2 Retina)
-target_width = 2560  # Width of the target computer's screen
-target_height = 1600  # Height of the target computer's screen
-
+web_request_timeout = 30  # Seconds an API call waits for its action before answering with the ticket
 edge_threshold = 40 # measured in pixels
-off_system = False
-last_keys_pressed = set()  # Initialize the set
-
-
-key_mapping = {
-    "windows": {
-        "ctrl": "ctrl",
-        "alt": "alt",
-        "win": "cmd",  # Treat Win on Windows as Cmd on Mac
-        "shift": "shift",
-        "delete": "delete",
-        "backspace": "backspace",
-        "enter": "enter",
-        "home": "home",
-        "end": "end",
-        "pageup": "page up",
-        "pagedown": "page down",
-        "esc": "esc",
-        "tab": "tab",
-        "space": "space",
-        "cmd": "win",  # Treat CMD on Mac as Win on Windows
-        "left windows": "cmd",
-    },
-    "mac": {
-        "ctrl": "ctrl",
-        "option": "alt",  # Treat Option on Mac as Alt on Windows/Linux
-        "cmd": "cmd",
-        "shift": "shift",
-        "delete": "backspace",  # Mac delete is equivalent to backspace
-        "fn+delete": "delete",
-        "return": "enter",
-        "home": "home",
-        "end": "end",
-        "pageup": "page up",
-        "pagedown": "page down",
-        "esc": "esc",
-        "tab": "tab",
-        "space": "space",
-        "super": "cmd",  # Treat Super on Linux as CMD on Mac
-    },
-    "linux": {
-        "ctrl": "ctrl",
-        "alt": "alt",
-        "super": "super",
-        "shift": "shift",
-        "delete": "delete",
-        "backspace": "backspace",
-        "enter": "enter",
-        "home": "home",
-        "end": "end",
-        "pageup": "page up",
-        "pagedown": "page down",
-        "esc": "esc",
-        "tab": "tab",
-        "space": "space",
-        "cmd": "super"  # Treat CMD on Mac as Super on Linux
-    }
-}
-
-special_key_map = {
-    "shift": "KEY_LEFT_SHIFT",
-    "ctrl": "KEY_LEFT_CTRL",
-    "alt": "KEY_LEFT_ALT",
-    "space": "KEY_SPACE",
-    "enter": "KEY_RETURN",
-    "backspace": "KEY_BACKSPACE",
-    "tab": "KEY_TAB",
-    "esc": "KEY_ESC",
-    "up": "KEY_UP_ARROW",
-    "down": "KEY_DOWN_ARROW",
-    "left": "KEY_LEFT_ARROW",
-    "right": "KEY_RIGHT_ARROW",
-    "capslock": "KEY_CAPS_LOCK",
-    "delete": "KEY_DELETE",
-    "home": "KEY_HOME",
-    "end": "KEY_END",
-    "page up": "KEY_PAGE_UP",
-    "page down": "KEY_PAGE_DOWN",
-    "insert": "KEY_INSERT",
-    "print screen": "KEY_PRINT_SCREEN",
-    "pause": "KEY_PAUSE",
-    "cmd": "KEY_LEFT_GUI",
-    "win": "KEY_LEFT_GUI",
-    "super": "KEY_LEFT_GUI",
-    "option": "KEY_LEFT_ALT",
-    "right gui": "KEY_RIGHT_GUI",
-    "right shift": "KEY_RIGHT_SHIFT",
-    "right alt": "KEY_RIGHT_ALT",
-    "right control": "KEY_RIGHT_CTRL",
-    "left gui": "KEY_LEFT_GUI",
-}
-
-# Arduino-specific mapping using Keyboard.h
-special_key_map = {
-    "shift": "KEY_LEFT_SHIFT",
-    "ctrl": "KEY_LEFT_CTRL",
-    "alt": "KEY_LEFT_ALT",
-    "space": "KEY_SPACE",
-    "enter": "KEY_RETURN",
-    "backspace": "KEY_BACKSPACE",
-    "tab": "KEY_TAB",
-    "esc": "KEY_ESC",
-    "up": "KEY_UP_ARROW",
-    "down": "KEY_DOWN_ARROW",
-    "left": "KEY_LEFT_ARROW",
-    "right": "KEY_RIGHT_ARROW",
-    "capslock": "KEY_CAPS_LOCK",
-    "delete": "KEY_DELETE",
-    "home": "KEY_HOME",
-    "end": "KEY_END",
-    "page up": "KEY_PAGE_UP",
-    "page down": "KEY_PAGE_DOWN",
-    "insert": "KEY_INSERT",
-    "print screen": "KEY_PRINT_SCREEN",
-    "pause": "KEY_PAUSE",
-    "cmd": "KEY_LEFT_GUI",
-    "win": "KEY_LEFT_GUI",
-    "super": "KEY_LEFT_GUI",
-    "option": "KEY_LEFT_ALT",
-    "right gui": "KEY_RIGHT_GUI",
-    "right shift": "KEY_RIGHT_SHIFT",
-    "right alt": "KEY_RIGHT_ALT",
-    "right control": "KEY_RIGHT_CTRL",
-    "left gui": "KEY_LEFT_GUI",
-}
-
-# Create a Tkinter root window
-root = tk.Tk()
-root.overrideredirect(True)  # Remove window decorations (title bar, etc.)
-root.attributes("-topmost", True)  # Keep the window on top
-root.geometry(f"10x10+{right_monitor.x + right_monitor.width - 20}+{right_monitor.y + right_monitor.height - 20}")  # Position the window
-
-
-# Create a label to display the icon (a simple colored square in this example)
-icon_label = tk.Label(root, bg="red")
-icon_label.pack(fill=tk.BOTH, expand=True)
-
-
-app = Flask(__name__)
-
-def start_flask():
-    app.run(host="0.0.0.0", port=SERVER_PORT)
-
-
-@app.route('/keypress', methods=['POST'])
-def keypress():
-    global off_system, web_request
-    old_off_system = off_system
-    try:
-        key = request.json.get('key')
-        if key:
-            # Create a KeyboardEvent with a dummy scan_code
-            key_event = keyboard.KeyboardEvent(event_type='down', name=key, scan_code=0, time=time.time(), device=None, is_keypad=False)
-            web_request = True
-            off_system = True
-            handleKeys(key_event)
-            off_system = old_off_system
-            # web_request = False
-            time.sleep(0.1)
-            return jsonify({"status": "success", "key": key}), 200
-        return jsonify({"status": "error", "message": "No key provided"}), 400
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-    
-@app.route('/multikeypress', methods=['POST'])
-def multikeypress():
-    global off_system, web_request
-    old_off_system = off_system
-    try:
-        string = request.json.get('content')
-        # for each character in the string
-        for key in string:
-            # Create a KeyboardEvent with a dummy scan_code
-            key_event = keyboard.KeyboardEvent(event_type='down', name=key, scan_code=0, time=time.time(), device=None, is_keypad=False)
-            web_request = True
-            off_system = True
-            handleKeys(key_event)
-            off_system = old_off_system
-            # web_request = False
-        return jsonify({"status": "success", "string": string}), 200
-
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-    
-@app.route('/turnoff-keyboard-mouse', methods=['POST'])
-def turnoff_keyboard_mouse():
-    global allow_target_mouse_switching
-    try:
-        allow_target_mouse_switching = False
-        return jsonify({"status": "success"}), 200
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-    
-@app.route('/turnon-keyboard-mouse', methods=['POST'])
-def turnon_keyboard_mouse():
-    global allow_target_mouse_switching
-    try:
-        allow_target_mouse_switching = True
-        return jsonify({"status": "success"}), 200
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-
-@app.route('/mouse_click', methods=['POST'])
-def mouse_click():
-    try:
-        button = request.json.get('button')
-        action = request.json.get('action')
-        if button and action:
-            if button == 'left':
-                if action == 'down':
-                    on_left_click()
-                elif action == 'up':
-                    on_left_release()
-            elif button == 'right':
-                if action == 'down':
-                    on_right_click()
-                elif action == 'up':
-                    on_right_release()
-            else:
-                return jsonify({"status": "error", "message": "Invalid button"}), 400
-            return jsonify({"status": "success", "button": button, "action": action}), 200
-        return jsonify({"status": "error", "message": "No button or action provided"}), 400
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-
-# Define an array of keys that don't require the Shift key
-keys_without_shift = [
-    "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p",
-    "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "1", "2", "3", "4", "5", "6",
-    "7", "8", "9", "0", "`", "-", "=", "[", "]", ";", "'", ",", ".", "/", "\\",
-    "A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P",
-    "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z", "!", "@", "#", "$", "%", "^",
-    "&", "*", "(", ")", "_", "+", "{", "}", "|", ":", '"', "<", ">", "?"
-    
+layout_refresh_interval = 5  # Seconds between checks for added, removed or moved monitors
+switch_settle_time = 0.1  # Seconds moves from before the cursor was parked are ignored for at most
+motion_frame_bytes = protocol.mouse_frame_size(serial_protocol)
+radio_frame_time = 0.0005  # Seconds per 32 byte nRF24L01 frame incl. auto-ack at 2Mbps
+radio_frames_per_event = 1  # payload_t only sends its used bytes, see protocol.pack_payload
+
+# Target computers, one rx.ino each (see hid_controller/targets.py). The first one is the
+# target above, over the right edge of the rightmost monitor. Add one per extra rx.ino, e.g.
+#   Target("laptop", 0o11, "mac", 1728, 1117, "left", host_system),
+#   Target("tv", 0o21, "linux", 1920, 1080, "top", host_system, monitor=0),  # top edge of the first monitor
+targets = [
+    Target("main", protocol.RX_NODE, target_system, target_width, target_height, "right", host_system),
 ]
-keys_with_shift = ["~", "!", "@", "#", "$", "%", "^", "&", "*", "(", ")", "_", "+", "{", "}", "|", ":", '"', "<", ">", "?"]
-special_keys = [
-    "shift",
-    "ctrl",
-    "alt",
-    "space",
-    "enter",
-    "backspace",
-    "tab",
-    "esc",
-    "up",
-    "down",
-    "left",
-    "right",
-    "capslock",
-    "delete",
-    "home",
-    "end",
-    "page up",
-    "page down",
-    "insert",
-    "print screen",
-    "pause",
-    "cmd",
-    "win",
-    "super",
-    "option",
-    "right gui",
-    "right shift",
-    "right alt",
-    "right control",
-    "left gui",
-    "left shift",
-    "left alt",
-    "left control",
-    "left windows",
-    "right windows",
-]
-
-
-def check_position():
-    global off_system, log_mouse_movement, log_operational_messages
-    try:
-        x, y = mouse.get_position()
-
-        if log_mouse_movement:
-            print(f"Mouse position: x={x}, y={y} | Off-system: {off_system}")
-
-        # Check if the cursor is on the right monitor
-        if right_monitor.y <= y <= right_monitor.y + right_monitor.height:
-            # Check if the cursor is near the right edge of the right monitor
-            if (
-                x >= right_monitor.x + right_monitor.width - edge_threshold
-                and not off_system
-            ):
-                if allow_target_mouse_switching:
-                    off_system = True
-                    connect_keyboard_listeners(True)
-                    show_icon()  # Show the icon when switching to the target system
-                    if log_operational_messages:
-                        print("Switching to target system...")
-
-                    mouse.move(right_monitor.x - 10000, y)  # Move cursor off-screen
-                    time.sleep(0.1)
-
-            elif x <= right_monitor.x + edge_threshold and off_system:
-                off_system = False
-                remove_keyboard_listeners()
-                hide_icon()  # Hide the icon when switching back to the host system
-                if log_operational_messages:
-                    print("Switching back to host system...")
-
-                move_to_relative(right_monitor.width - 2, y - right_monitor.y)
-                time.sleep(0.2)
 
-        if off_system and allow_target_mouse_switching:
-            if log_mouse_movement:
-                print(f"Sending x={x}, y={y}")
-            scale_factor_width = target_width / (device_width * mouse_compensator_factor)
-            scale_factor_height = target_height / (device_height * mouse_compensator_factor)
-            x = scale_factor_width * x
-            y = scale_factor_height * y
-            ser.write(f"M{x},{y}\n".encode())
-
-    except Exception as e:
-        print(f"Error occurred in loop: {e}")
-    
-    root.update_idletasks()  # Update Tkinter window
-    root.update()  # Process Tkinter events
-
-def find_microprocessor_port():
-    ports = list(serial.tools.list_ports.comports())
-    for port in ports:
-        # print(port.description)
-        if (
-            any(
-                keyword in port.description
-                for keyword in [
-                    "Leonardo",
-                    "Pro Micro",
-                    "Uno",
-                    "Mega",
-                    "Arduino",
-                    "USB Serial Device",  # Add comma here
-                    "Microsoft Natural Ergonomic Keyboard 4000",
-                ]
-            )
-            # or port.device == "COM24"
-        ):
-            print("Starting COMs with" + port.device)
-            return port.device
-    return None
-
-def scale_movement(value, host_max, target_max):
-    """Scale movement from host screen size to target screen size."""
-    return int((value / host_max) * target_max)
-
-def move_to_relative(x, y):
-    absolute_x = right_monitor.x + x
-    absolute_y = right_monitor.y + y
-    mouse.move(absolute_x, absolute_y)
-
-    if log_mouse_movement:
-        print(f"Moved cursor to relative x={x}, y={y} on rightmost monitor")
-
-def on_left_click():
-    global mlc_sent, mlcr_sent, mouse_left_click, mouse_left_released  # Global declaration
-
-    mouse_left_click = True
-    mlcr_sent = False
-    mlc_sent = True
-    mouse_left_released = False
-    ser.write(f"C,1\n".encode())
-    if log_key_presses:
-        print("Left mouse button pressed")
-
-def on_right_click():
-    global mrc_sent, mrcr_sent, mouse_right_click, mouse_right_released  # Global declaration
-    
-    mouse_right_click = True
-    mrcr_sent = False
-    mouse_right_released = False
-    mrc_sent = True
-    ser.write(f"C,3\n".encode())
-    if log_key_presses:
-        print("Right mouse button clicked")
-
-def on_left_release():
-    global mlc_sent, mlcr_sent, mouse_left_click, mouse_left_released  # Global declaration
-    # if not mlcr_sent:
-    mouse_left_released = True
-    mlc_sent = False
-    mouse_left_click = False
-    mlcr_sent = True
-    ser.write(f"C,2\n".encode())
-    if log_key_presses:
-        print("Left mouse button released")
-
-def on_right_release():
-    global mrc_sent, mrcr_sent, mouse_right_click, mouse_right_released  # Global declaration
-    # if not mrcr_sent:
-    mouse_right_released = True
-    mrc_sent = False
-    mouse_right_click = False
-    mrcr_sent = True
-    ser.write(f"C,4\n".encode())
-    if log_key_presses:
-        print("Right mouse button released")
-
-def show_icon():
-    root.deiconify()  # Show the window
-
-def hide_icon():
-    root.withdraw()  # Hide the window
-
-def connect_keyboard_listeners(prevent_system_output=False):
-    global off_system
-    if off_system:
-        prevent_system_output = True
-    keyboard.unhook(keyboard.on_press(handleKeys))
-    keyboard.on_press(handleKeys, suppress=prevent_system_output)
-
-def map_key_to_arduino(input_os, target_os, key_pressed):
-    # Normalize the key name to lowercase
-    key_pressed_lowered = key_pressed.lower()
-
-    # Step 1: Convert the key from the input OS to a general target key
-    if input_os not in key_mapping:
-        return key_pressed  # Unsupported OS
-
-    target_key_intermediate = key_mapping[input_os].get(key_pressed_lowered, key_pressed_lowered)
-
-    # Step 2: Convert the intermediate key to the target OS key
-    if target_os not in key_mapping:
-        return key_pressed  # Unsupported OS
-
-    target_key_final = key_mapping[target_os].get(target_key_intermediate, target_key_intermediate)
-
-    # Step 3: Map the final target key to an Arduino key code
-    arduino_key_code = special_key_map.get(target_key_final.lower())
-
-    if arduino_key_code:
-        return arduino_key_code
-    else:
-        return target_key_final  # No mapping found, return the intermediate key as a fallback
-  
-def send_Keys(handleSpecialKeys):
-    global special_keys_pressed, isSpecialKeyPressed, target_system, keyboard_wait
-    try:
-        if not special_keys_pressed:
-            print("No key pressed")
-            return
-        isSpecialKeyPressed = False
-        keyboard_wait = False
-        keys_to_send = set()
-
-        # map special_key = special_key_map[key.name] for each key in special_keys_pressed or return character
-        for key in special_keys_pressed:
-            if key in special_keys:
-                special_key_mapped = map_key_to_arduino(host_system, target_system, key)
-                if special_key_mapped is None:
-                    special_key_mapped = key
-                keys_to_send.add(special_key_mapped)
-                break
-            else:
-                keys_to_send.add(key)
-
-
-        # add back in any missing single characters to the list of keys to send
-        for key in special_keys_pressed:
-            if key not in keys_to_send and len(key) == 1:
-                keys_to_send.add(key)
-        # always make sure the keys to send are in the order of longest keys first
-        keys_to_send = sorted(keys_to_send, key=len, reverse=True)
+# Set up by main()
+engine = None  # The ForwardingEngine, see hid_controller/engine.py
+source = None  # Its mouse and keyboard hooks
+ser = None # Serial port object for the microcontroller
+serial_writer = None # Writer thread that owns ser, everything else only enqueues frames
+serial_reader = None # Reader thread for the acks tx.ino sends back
+motion_rate = None # Paces mouse movement by what tx.ino reports about the radio link
+request_pipeline = RequestPipeline() # Runs API actions in order per client, off the Flask threads
+latency_tracker = LatencyTracker() # Per stage input lag histograms, served by /stats
+startup = StartupTimer(launched) # Time to each startup stage and to the first forwarded frame, served by /stats
+
+
+def motion_write_slot():
+    """Seconds one motion update occupies the serial and radio link."""
+    serial_time = motion_frame_bytes * 10 / serial_baud_rate  # 8N1 framing
+    return serial_time + radio_frames_per_event * radio_frame_time
+
+def encode_motion(dx, dy):
+    return protocol.encode_mouse_deltas(protocol.split_delta(dx, dy), serial_protocol)
+
+def encode_wheel(vertical, horizontal):
+    return protocol.encode_wheel(vertical, horizontal, serial_protocol)
+
+def encode_route(node):
+    return protocol.encode_route(node, serial_protocol)
+
+def handleMicrocontrollerLine(line):
+    if log_microcontroller_messages:
+        print(f"Microcontroller: {line}")
+
+def create_engine(monitors, sink=None, cursor=None, indicator=None, recorder=None):
+    """A ForwardingEngine with the configuration above."""
+    forwarding_engine = ForwardingEngine(
+        targets, monitors, sink=sink, cursor=cursor, indicator=indicator, serial_protocol=serial_protocol,
+        host_system=host_system, edge_threshold=edge_threshold, mouse_sensitivity=mouse_sensitivity,
+        mouse_compensator_factor=mouse_compensator_factor, switch_settle_time=switch_settle_time,
+        latency=latency_tracker, recorder=recorder,
+    )
+    forwarding_engine.log_mouse_movement = log_mouse_movement
+    forwarding_engine.log_key_presses = log_key_presses
+    forwarding_engine.log_operational_messages = log_operational_messages
+    return forwarding_engine
+
+def create_writer(port, tracer=None):
+    # With a single target every frame goes to RX_NODE, route frames are only needed for more
+    return SerialWriter(port, encode_motion, motion_interval=motion_write_slot(), encode_wheel=encode_wheel, tracer=tracer,
+                        encode_route=encode_route if len(targets) > 1 else None)
 
-        if len(keys_to_send) == 1:
-            key = next(iter(special_keys_pressed))
-            if key in special_keys:
-                key = map_key_to_arduino(host_system, target_system, key)
-                ser.write(f"S,{key}\n".encode())
-            else:
-                ser.write(f"K,{key}\n".encode())
-            if log_key_presses:
-                print(f"Special Key pressed: {key}")
-        else:
-            ser.write(f"X,{','.join(keys_to_send)}\n".encode())
-            if log_key_presses:
-                print(f"Multiple keys pressed: {','.join(keys_to_send)}")
+def start_flask():
+    from hid_controller.web import create_app
 
-        special_keys_pressed.clear()
+    create_app(engine, request_pipeline, source, web_request_timeout, startup, ser, motion_rate).run(host="0.0.0.0", port=SERVER_PORT)
 
-    except Exception as e:
-        print(f"Error while sending keys: {e}")
-        
-def handleSpecialKeys(key):
-    # print('special keys')
-    global keyboard_wait, special_keys, off_system, isSpecialKeyPressed, special_keys_pressed
-    if off_system or web_request:
-        if key.name in special_keys:
-                if key.event_type == keyboard.KEY_DOWN:
-                    # if we didnt already press the special key
-                    if key.name not in special_keys_pressed:
-                        # add it to our array of key combinations
-                        if log_key_presses:
-                            print(f"Special Key Added To Combo: {key.name}")
-                
-                        special_keys_pressed.add(key.name)
-                        # track that we have pressed a special key so that all regular keys get added to combo
-                        isSpecialKeyPressed = True
-                        if log_key_presses:
-                            print(f"Special Key pressed DOWN: {key.name}")
-                        if web_request:
-                            send_Keys(handleSpecialKeys)
-                        else:
-                            keyboard.hook_key(key.name, handleSpecialKeys)
-                if key.event_type == keyboard.KEY_UP and key.name in special_keys_pressed:
-                    if log_key_presses:
-                        print(f"Special Key released: {key.name}")
-                    send_Keys(handleSpecialKeys)
-                    connect_keyboard_listeners(True)
-
-def handleKeys(key):
-    global target_system, keyboard_wait, off_system, isSpecialKeyPressed, special_keys_pressed,keys_without_shift, keys_with_shift
-    # print('handle keys called')
-    print(key.name)
-    if key.name in special_keys:
-        handleSpecialKeys(key)
-    if off_system or web_request:
-        character = key.name
-        # handle key combinations
-        if isSpecialKeyPressed:
-            print(f"Regular Key Added To Combo: {key.name}")
-            if key.event_type == keyboard.KEY_DOWN:
-                if web_request:
-                    ser.write(f"S,{key.name}\n".encode())
-                    if log_key_presses:
-                        print(f"Key pressed DOWN: {key.name}")
-                else:
-                    special_keys_pressed.add(key.name)
-                    if log_operational_messages:
-                        print(f"Key Combo gathering....adding: {key.name}")
-
-        else:
-            # handle regular typing 
-            character = key.name
-            if character in keys_without_shift or character in keys_with_shift:
-                if not keyboard_wait or web_request:
-                    keyboard_wait = True
-                    if key.event_type == keyboard.KEY_DOWN:
-                        ser.write(f"K,{key.name}\n".encode())
-                        if log_key_presses:
-                            print(f"Key pressed DOWN: {key.name}")
-                        keyboard_wait = False
-                else:
-                    print('keyboard waiting')
-
-def handleMouseClick(event):
-    global off_system
-
-    # Ensure the event is a ButtonEvent (ignoring MoveEvent, WheelEvent, etc.)
-    if off_system and isinstance(event, mouse.ButtonEvent):
-        event_type = event.event_type
-        button = event.button
-        pressed = event_type == "down"
-
-        if button == mouse.LEFT:
-            if pressed:
-                on_left_click()
-            else:
-                on_left_release()
-        elif button == mouse.RIGHT:
-            if pressed:
-                on_right_click()
-            else:
-                on_right_release()
-    return False
-
-def remove_keyboard_listeners():
-    if log_operational_messages:
-        print("Removing keyboard listeners")
-    keyboard.unhook_all()
-
-def on_left_click():
-    global mlc_sent, mlcr_sent, mouse_left_click, mouse_left_released
-    mouse_left_click = True
-    mlcr_sent = False
-    mlc_sent = True
-    mouse_left_released = False
-    ser.write(f"C,1\n".encode())
-    if log_key_presses:
-        print("Left mouse button pressed")
-
-def on_right_click():
-    global mrc_sent, mrcr_sent, mouse_right_click, mouse_right_released
-    mouse_right_click = True
-    mrcr_sent = False
-    mouse_right_released = False
-    mrc_sent = True
-    ser.write(f"C,3\n".encode())
-    if log_key_presses:
-        print("Right mouse button clicked")
-
-def on_left_release():
-
-    global mlc_sent, mlcr_sent, mouse_left_click, mouse_left_released
-    mouse_left_released = True
-    mlc_sent = False
-    mouse_left_click = False
-    mlcr_sent = True
-    ser.write(f"C,2\n".encode())
-    if log_key_presses:
-        print("Left mouse button released")
-
-def on_right_release():
-    global mrc_sent, mrcr_sent, mouse_right_click, mouse_right_released
-    mouse_right_released = True
-    mrc_sent = False
-    mouse_right_click = False
-    mrcr_sent = True
-    ser.write(f"C,4\n".encode())
-    if log_key_presses:
-        print("Right mouse button released")
-        
 def main():
-    global ser, tk, microprocessor_port, host_system, target_system, isSpecialKeyPressed, special_keys_pressed, special_keys, keyboard_wait, off_system, last_keys_pressed, log_mouse_movement, log_key_presses, log_operational_messages, log_microcontroller_messages
-    global mlc_sent, mrc_sent, mlcr_sent, mrcr_sent  # Declare these as global to modify them inside the functions
-
+    global engine, source, ser, serial_writer, serial_reader, motion_rate, microprocessor_port
+    # The GUI, the screens and the OS hooks are only loaded now, importing this module stays cheap
+    from screeninfo import get_monitors
+    from hid_controller.indicator import TkIndicator
+    from hid_controller.sources import HookSource, HostCursor
+    startup.mark("imports")
 
-    microprocessor_port = find_microprocessor_port()
+    def open_port(port):
+        return serial.serial_for_url(port, serial_baud_rate, timeout=1, write_timeout=2)
 
-    ser = serial.Serial(microprocessor_port, 1000000, timeout=1, write_timeout=2)
+    if microprocessor_port is None:
+        # The board found last time first, the ports are only scanned if it is gone
+        connect = lambda: open_microprocessor_port(open_port)
+    else:
+        fixed_port = microprocessor_port
+        connect = lambda: (fixed_port, open_port(fixed_port))
+    microprocessor_port, port = connect()
 
     if microprocessor_port is None:
         print("Microcontroller not found. Please check the connection.")
         return
     else :
+        # Reopens the port, rescanning if need be, when the board resets or re-enumerates
+        ser = SupervisedSerial(connect, microprocessor_port, port)
+        startup.mark("port")
         if log_microcontroller_messages:
             print(f"Connected to microcontroller on {microprocessor_port}")
-        
-    try:
 
-        hide_icon()  # Start with the icon hidden
+    input_recorder = None
+    if record_input_path:
+        input_recorder = InputRecorder(record_input_path)
+        if log_operational_messages:
+            print(f"Recording input to {record_input_path}")
+    serial_writer = create_writer(ser, latency_tracker)
+    serial_writer.recorder = input_recorder
+    monitors = get_monitors()
+    engine = create_engine(monitors, serial_writer, HostCursor(), recorder=input_recorder)
+    serial_writer.node = engine.state.active_target.node
+    serial_writer.start()
+    engine.text_sender = TextSender(serial_writer.send)
+    handlers = {
+        protocol.FRAME_TEXT_ACK: engine.text_sender.acknowledge,
+        protocol.FRAME_TRACE: latency_tracker.on_trace,
+    }
+    if serial_protocol == protocol.PROTOCOL_BINARY:
+        # Key state changes and clicks are acked by rx.ino, sent again if need be and checked by snapshots
+        engine.reliable = ReliableSender(serial_writer)
+        engine.reliable.start()
+        handlers[protocol.FRAME_EVENT_ACK] = engine.reliable.acknowledge
+    motion_rate = MotionRateController(serial_writer, ser, engine.reliable)
+    motion_rate.start()
+    handlers[protocol.FRAME_LINK_STATS] = motion_rate.on_link_stats
+    serial_reader = SerialReader(ser, handlers, on_line=handleMicrocontrollerLine)
+    serial_reader.start()
+    request_pipeline.start()
+
+    try:
+        right_monitor = max(monitors, key=lambda m: m.x)
+        indicator = TkIndicator(right_monitor, "red")
+        engine.indicator = indicator
 
-        mouse.hook(handleMouseClick)
+        source = HookSource(engine, mouse_forwarding_mode)
+        source.start()
+        startup.mark("hooks")
 
         # Start the Flask server in a new thread
         flask_thread = threading.Thread(target=start_flask)
         flask_thread.daemon = True  # Ensures the thread will close when the main program exits
         flask_thread.start()
-
+        startup.mark("ready")
+        if log_operational_messages:
+            print(f"Ready to forward: {startup.summary()} after launch")
+
+        if mouse_forwarding_mode == "event" and log_operational_messages:
+            print(f"Forwarding mouse movement on hook events ({motion_write_slot() * 1000:.2f} ms write slot)")
+        layout_checked = time.perf_counter()
+        first_event_reported = False
         while True:
-            check_position()
-            time.sleep(0.02)
+            if mouse_forwarding_mode == "event":
+                # Nothing to poll, only wake up for icon changes and to keep Tk alive
+                indicator.changed.wait(0.5)
+            else:
+                source.poll()
+                time.sleep(0.02)
+            indicator.update()
+            if not first_event_reported and serial_writer.first_write is not None:
+                first_event_reported = True
+                if log_operational_messages:
+                    print(f"First event forwarded {startup.first_event(serial_writer) * 1000:.0f} ms after launch")
+            if time.perf_counter() - layout_checked >= layout_refresh_interval:
+                # Picks up monitors being plugged in, removed or rearranged
+                layout_checked = time.perf_counter()
+                engine.refresh_layout(get_monitors())
 
     except Exception as e:
         print(f"Error occurred during setup: {e}")
         pass
+    finally:
+        if input_recorder is not None:
+            input_recorder.close()
 
 
 if __name__ == "__main__":
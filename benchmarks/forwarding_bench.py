@@ -0,0 +1,458 @@
+# Input forwarding throughput and latency of app_with_server.py
+#
+# run from the repository root: python -m benchmarks.forwarding_bench --output results.json
+#
+# Mouse, keyboard and HTTP traces are replayed through the app's ForwardingEngine and its
+# routes: mouse_move_event/check_position and mouse_event, keyboard_event (which reaches
+# send_special_key and send_chord for shortcuts) and the Flask routes via the test client.
+# The frames go to the tx.ino/rx.ino simulator (or any port given with --port), the OS
+# input libraries are replaced by benchmarks/headless.py.
+#
+# Per scenario the results hold events/s, serial bytes and writes per event, CPU per
+# event (whole process, and the replaying hook thread alone) and the LatencyTracker
+# histograms, whose "queue" stage is the time a frame waited for the writer thread.
+# Pass --compare with an earlier results file to see what changed, and --targets to spread
+# the HTTP requests over several simulated rx.ino nodes (per node HID reports are reported).
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import types
+
+import serial
+
+from benchmarks import headless
+from hid_controller import protocol
+from hid_controller import recorder
+from hid_controller.latency import LatencyTracker
+from hid_controller.motion_rate import MotionRateController
+from hid_controller.reliable import ReliableSender
+from hid_controller.serial_reader import SerialReader
+from hid_controller.sources import HookSource, HostCursor
+from hid_controller.targets import EDGES, Target
+from hid_controller.text_sender import TextSender
+from hid_controller.web import create_app
+
+DEFAULT_PORT = "sim://?realtime=0"
+DRAIN_TIMEOUT = 30  # seconds the writer gets to empty its queue after a replay
+
+sample_text = "the quick brown fox jumps over the lazy dog, 0123456789. "
+
+
+class CountingSerial:
+    """Wraps a serial port and counts what the writer thread puts on it."""
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.bytes = 0
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+        return self.ser.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+
+def generate_trace(anchor, seed=0, mouse_moves=20000, keystrokes=2000, requests=200):
+    """A deterministic trace in the --trace file format.
+
+    "mouse" holds [t, "move", x, y], [t, "down"/"up", button] and [t, "wheel", delta] with
+    host screen positions as mouse.hook reports them while forwarding (the cursor is
+    re-centered on anchor after every move), "keys" [t, "down"/"up", name] and "http"
+    [t, path, json body]. t is in seconds from the start of the trace.
+    """
+    rng = random.Random(seed)
+
+    mouse_events = []
+    t = 0.0
+    for i in range(mouse_moves):
+        t += 0.001  # 1000 Hz mouse
+        # Circles a few hundred pixels across with some hand jitter, so the target cursor never leaves the screen
+        dx = round(6 * math.cos(i / 50)) + rng.randint(-1, 1)
+        dy = round(6 * math.sin(i / 50)) + rng.randint(-1, 1)
+        if dx == 0 and dy == 0:
+            dx = 1
+        mouse_events.append([round(t, 6), "move", anchor[0] + dx, anchor[1] + dy])
+        if i % 250 == 249:
+            button = "left" if i % 1000 != 999 else "right"
+            mouse_events.append([round(t + 0.0002, 6), "down", button])
+            mouse_events.append([round(t + 0.0004, 6), "up", button])
+        if i % 1000 == 499:
+            # A fast flick of the wheel, a tick every 2 ms while the mouse keeps moving
+            for tick in range(20):
+                mouse_events.append([round(t + 0.0001 + tick * 0.002, 6), "wheel", -1.0])
+    mouse_events.sort(key=lambda event: event[0])
+
+    key_events = []
+    t = 0.0
+    for i in range(keystrokes):
+        if i % 50 == 49:
+            # ctrl+c, ctrl+v: one chord frame each, through handleSpecialKeys and send_chord
+            letter = "c" if i % 100 == 49 else "v"
+            for event_type, name in (("down", "ctrl"), ("down", letter), ("up", letter), ("up", "ctrl")):
+                t += rng.uniform(0.02, 0.06)
+                key_events.append([round(t, 6), event_type, name])
+            continue
+        name = sample_text[i % len(sample_text)]
+        name = {" ": "space", ",": ",", ".": "."}.get(name, name)
+        t += rng.uniform(0.03, 0.12)
+        key_events.append([round(t, 6), "down", name])
+        key_events.append([round(t + rng.uniform(0.02, 0.08), 6), "up", name])
+    key_events.sort(key=lambda event: event[0])
+
+    http_events = []
+    t = 0.0
+    for i in range(requests):
+        t += rng.uniform(0.01, 0.05)
+        kind = i % 4
+        if kind == 0:
+            http_events.append([round(t, 6), "/keypress", {"key": rng.choice("abcdefghijklmnopqrstuvwxyz")}])
+        elif kind == 1:
+            http_events.append([round(t, 6), "/mouse_click", {"button": "left", "action": rng.choice(["down", "up"])}])
+        elif kind == 2:
+            http_events.append([round(t, 6), "/multikeypress", {"content": sample_text[:rng.randint(10, len(sample_text))]}])
+        else:
+            http_events.append([round(t, 6), "/sequence", {"steps": [
+                {"type": "key", "key": "a"},
+                {"type": "click", "button": "left", "action": "click"},
+                {"type": "move", "dx": rng.randint(-20, 20), "dy": rng.randint(-20, 20)},
+                {"type": "key", "key": "enter"},
+            ]}])
+
+    return {"mouse": mouse_events, "keys": key_events, "http": http_events}
+
+
+def trace_from_log(path):
+    """The mouse and keyboard events of an InputRecorder log, in the --trace file format."""
+    trace = {"mouse": [], "keys": []}
+    for kind, t, value in recorder.read_log(path):
+        if kind == recorder.RECORD_MOUSE_MOVE:
+            trace["mouse"].append([t, "move", *value])
+        elif kind == recorder.RECORD_MOUSE_BUTTON:
+            trace["mouse"].append([t, *value])
+        elif kind == recorder.RECORD_MOUSE_WHEEL:
+            trace["mouse"].append([t, "wheel", value])
+        elif kind == recorder.RECORD_KEY:
+            trace["keys"].append([t, *value])
+    return trace
+
+
+def paced(events, speed):
+    """Yield events at their trace time divided by speed, or as fast as possible for speed 0."""
+    if speed <= 0:
+        yield from events
+        return
+    start = time.perf_counter()
+    for event in events:
+        remaining = start + event[0] / speed - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        yield event
+
+
+def load_app(targets=1):
+    """app_with_server's configuration, its engine fed by the hooks and its Flask app."""
+    modules = headless.install()
+    app = importlib.import_module("app_with_server")
+    for i in range(len(app.targets), targets):
+        # One more rx.ino per edge, like a user with a target on each side of the screens
+        app.targets.append(Target(f"target{i}", protocol.RX_NODES[i], app.target_system, app.target_width, app.target_height, EDGES[i], app.host_system))
+    app.log_microcontroller_messages = False
+    app.log_operational_messages = False
+    app.log_mouse_movement = False
+    app.log_key_presses = False
+    monitors = modules["screeninfo"].get_monitors()
+    engine = app.create_engine(monitors, cursor=HostCursor())
+    # Motion is replayed on this thread, so no forwarder thread of its own
+    source = HookSource(engine, "poll")
+    source.start()
+    app.request_pipeline.start()
+    web = create_app(engine, app.request_pipeline, source, app.web_request_timeout)
+    return types.SimpleNamespace(app=app, engine=engine, source=source, web=web, monitor=monitors[0], writer=None, reader=None, latency=None, motion_rate=None)
+
+
+def simulator_url(bench, port):
+    # A simulated rx.ino for every target
+    targets = bench.engine.targets
+    if len(targets) == 1 or not port.startswith("sim://"):
+        return port
+    nodes = ",".join(f"{target.node:02o}" for target in targets)
+    return f"{port}{'&' if '?' in port else '?'}nodes={nodes}"
+
+
+def connect(bench, port):
+    # The part of main() that opens the port and starts the writer and reader threads
+    counter = CountingSerial(serial.serial_for_url(simulator_url(bench, port), bench.app.serial_baud_rate, timeout=1, write_timeout=2))
+    bench.latency = LatencyTracker()
+    bench.writer = bench.app.create_writer(counter, bench.latency)
+    bench.writer.node = bench.engine.state.active_target.node
+    bench.writer.start()
+    bench.engine.sink = bench.writer
+    bench.engine.latency = bench.latency
+    bench.engine.text_sender = TextSender(bench.writer.send)
+    bench.engine.reliable = ReliableSender(bench.writer)
+    bench.engine.reliable.start()
+    bench.motion_rate = MotionRateController(bench.writer, counter, bench.engine.reliable)
+    bench.motion_rate.start()
+    bench.reader = SerialReader(counter, {
+        protocol.FRAME_TEXT_ACK: bench.engine.text_sender.acknowledge,
+        protocol.FRAME_TRACE: bench.latency.on_trace,
+        protocol.FRAME_EVENT_ACK: bench.engine.reliable.acknowledge,
+        protocol.FRAME_LINK_STATS: bench.motion_rate.on_link_stats,
+    }, on_line=bench.app.handleMicrocontrollerLine)
+    bench.reader.start()
+    return counter
+
+
+def disconnect(bench):
+    bench.motion_rate.stop()
+    bench.engine.reliable.stop()
+    bench.writer.stop()
+    bench.reader.stop()
+    bench.writer.ser.ser.close()
+
+
+def wait_delivered(bench):
+    # Until every queued frame is written and every key/click change is acked, so events/s
+    # counts what reached rx.ino
+    deadline = time.perf_counter() + DRAIN_TIMEOUT
+    reliable = bench.engine.reliable
+    while True:
+        if not bench.writer.barrier().wait(deadline - time.perf_counter()):
+            return False
+        delivery = reliable.snapshot()
+        if not delivery["pending"] and not delivery["waiting"]:
+            return True
+        if time.perf_counter() >= deadline:
+            return False
+        time.sleep(0.001)
+
+
+def switch_to_target(bench):
+    # Cross the right edge like a user would, then put the target cursor mid screen so the
+    # replayed motion never switches back. Runs before the clock starts.
+    engine, monitor = bench.engine, bench.monitor
+    if engine.state.off_system:
+        engine.leave()
+    engine.check_position((monitor.x + monitor.width - 1, monitor.y + monitor.height // 2))
+    engine.check_position(engine.state.motion_anchor)  # what the hook reports for the parking move
+    engine.state.cursor_x = engine.state.active_target.width / 2
+    engine.state.cursor_y = engine.state.active_target.height / 2
+
+
+def replay_mouse(bench, events, speed):
+    mouse = sys.modules["mouse"]
+    engine, state = bench.engine, bench.engine.state
+    for event in paced(events, speed):
+        now = time.time()
+        if event[1] == "move":
+            # What the mouse hook and the motion forwarder do for one move event
+            engine.mouse_move_event(mouse.MoveEvent(event[2], event[3], now))
+            engine.check_position(state.latest_mouse_position, state.latest_mouse_time)
+        elif event[1] == "wheel":
+            engine.mouse_event(mouse.WheelEvent(event[2], now))
+        else:
+            engine.mouse_event(mouse.ButtonEvent(event[1], event[2], now))
+    return len(events)
+
+
+def replay_keys(bench, events, speed):
+    keyboard = sys.modules["keyboard"]
+    for event in paced(events, speed):
+        keyboard.emit(keyboard.KeyboardEvent(event[1], event[2], time.time()))
+    return len(events)
+
+
+def replay_http(bench, events, speed):
+    client = bench.web.test_client()
+    names = [target.name for target in bench.engine.targets]
+    failed = 0
+    for i, event in enumerate(paced(events, speed)):
+        # Shifted every round so each kind of request reaches every target
+        body = event[2] if len(names) == 1 else {**event[2], "target": names[(i + i // len(names)) % len(names)]}
+        response = client.post(event[1], json=body)
+        if response.status_code != 200:
+            failed += 1
+    if failed:
+        print(f"{failed} of {len(events)} HTTP requests failed", file=sys.stderr)
+    return len(events)
+
+
+scenarios = {
+    "mouse": (replay_mouse, True),
+    "keys": (replay_keys, True),
+    "http": (replay_http, False),
+}
+
+
+def run_scenario(bench, name, events, port, speed):
+    replay, on_target = scenarios[name]
+    counter = connect(bench, port)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if on_target:
+                switch_to_target(bench)
+            bench.writer.barrier().wait(DRAIN_TIMEOUT)
+            writes, sent = counter.writes, counter.bytes  # without the switch's own frames
+
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            thread_cpu_start = time.thread_time()
+            count = replay(bench, events, speed)
+            hook_cpu = time.thread_time() - thread_cpu_start
+            drained = wait_delivered(bench)
+            # Motion still merging in the writer goes out within one write slot
+            time.sleep(bench.writer.motion_interval)
+            seconds = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+        writer = bench.writer
+        keyboard = sys.modules["keyboard"]
+        snapshot = bench.latency.snapshot()
+        simulator = getattr(counter.ser, "simulator", None)
+        return {
+            "events": count,
+            "seconds": round(seconds, 6),
+            "events_per_second": round(count / seconds, 1),
+            "bytes_per_event": round((counter.bytes - sent) / count, 3),
+            "writes_per_event": round((counter.writes - writes) / count, 3),
+            "cpu_us_per_event": round(cpu / count * 1e6, 2),
+            "hook_cpu_us_per_event": round(hook_cpu / count * 1e6, 2),
+            "drained": drained,
+            "dropped": writer.dropped,
+            # Frames the writer's full queue refused, events/s then counts frames thrown away
+            "valid": writer.dropped == 0,
+            "merged_motion": writer.merged_motion,
+            "merged_wheel": writer.merged_wheel,
+            "write_errors": writer.write_errors,
+            "delivery": bench.engine.reliable.snapshot(),
+            "motion_rate": bench.motion_rate.snapshot(),
+            "keyboard_hooks": len(keyboard.hooks) + sum(len(hooks) for hooks in keyboard.key_hooks.values()),
+            "hid_reports_by_node": {f"{node:02o}": receiver.hid_reports for node, receiver in simulator.receivers.items()} if simulator else None,
+            "traces": snapshot["traces"],
+            "latency_us": snapshot["latency_us"],
+        }
+    finally:
+        disconnect(bench)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def worst_queue_p99(result):
+    values = [stages["queue"]["p99"] for stages in result["latency_us"].values() if "queue" in stages]
+    return max(values) if values else None
+
+
+def print_results(results, baseline=None):
+    metrics = [
+        ("events/s", lambda r: r["events_per_second"]),
+        ("bytes/event", lambda r: r["bytes_per_event"]),
+        ("cpu us/event", lambda r: r["cpu_us_per_event"]),
+        ("hook cpu us/event", lambda r: r["hook_cpu_us_per_event"]),
+        ("queue p99 us", worst_queue_p99),
+        ("dropped frames", lambda r: r["dropped"]),
+    ]
+    for name, result in results["scenarios"].items():
+        print(f"{name}: {result['events']} events in {result['seconds']:.3f} s")
+        if not result["valid"]:
+            print(f"  INVALID: {result['dropped']} frames dropped, replay slower (--speed)")
+        old = baseline["scenarios"].get(name) if baseline else None
+        for label, metric in metrics:
+            value = metric(result)
+            line = f"  {label:18} {value if value is not None else '-':>12}"
+            if old is not None:
+                old_value = metric(old)
+                if value is not None and old_value:
+                    line += f"  ({(value - old_value) / old_value:+.1%} vs {old_value})"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay input traces through app_with_server.py and measure forwarding")
+    parser.add_argument("--output", default="forwarding_bench.json", help="results file (JSON)")
+    parser.add_argument("--port", default=DEFAULT_PORT, help="serial port or URL the frames go to")
+    parser.add_argument("--trace", help="replay this trace file or input log (hid_controller/recorder.py) instead of a generated one")
+    parser.add_argument("--write-trace", help="save the generated trace to this file and exit")
+    parser.add_argument("--scenario", action="append", choices=sorted(scenarios), help="run only these scenarios")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is the trace's own timing, 0 as fast as possible (runs that drop frames are invalid)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mouse-moves", type=int, default=20000)
+    parser.add_argument("--keystrokes", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--compare", help="an earlier results file to compare against")
+    parser.add_argument("--targets", type=int, default=1, choices=range(1, len(EDGES) + 1), help="targets the HTTP requests are spread over")
+    args = parser.parse_args()
+
+    bench = load_app(args.targets)
+    if args.trace:
+        with open(args.trace, "rb") as f:
+            recorded = f.read(len(recorder.MAGIC)) == recorder.MAGIC
+        if recorded:
+            trace = trace_from_log(args.trace)
+        else:
+            with open(args.trace) as f:
+                trace = json.load(f)
+    else:
+        trace = generate_trace(bench.engine.state.motion_anchor, args.seed, args.mouse_moves, args.keystrokes, args.requests)
+    if args.write_trace:
+        with open(args.write_trace, "w") as f:
+            json.dump(trace, f)
+        return
+
+    results = {
+        "benchmark": "forwarding",
+        "commit": git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "port": args.port,
+            "trace": args.trace,
+            "seed": None if args.trace else args.seed,
+            "speed": args.speed,
+            "repeat": args.repeat,
+            "targets": args.targets,
+            "serial_protocol": bench.app.serial_protocol,
+        },
+        "scenarios": {},
+    }
+    for name in args.scenario or scenarios:
+        events = trace.get(name)
+        if not events:
+            continue
+        runs = [run_scenario(bench, name, events, args.port, args.speed) for _ in range(max(1, args.repeat))]
+        # A run that dropped frames is only kept when every run did
+        results["scenarios"][name] = max(runs, key=lambda run: (run["valid"], run["events_per_second"]))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"Results written to {args.output}")
+    if not all(result["valid"] for result in results["scenarios"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Headless stand-ins for the OS input and GUI libraries app_with_server.py imports
+#
+# install() must run before app_with_server is imported. The benchmarks then replay
+# recorded events into the app's hook callbacks without grabbing the real mouse, keyboard
+# or screen, so runs are reproducible on any machine, CI included.
+
+import collections
+import sys
+import types
+
+MONITOR = {"x": 0, "y": 0, "width": 2560, "height": 1440}
+
+
+def _mouse_module():
+    module = types.ModuleType("mouse")
+    module.LEFT, module.RIGHT, module.MIDDLE, module.X, module.X2 = "left", "right", "middle", "x", "x2"
+    module.ButtonEvent = collections.namedtuple("ButtonEvent", ["event_type", "button", "time"])
+    module.MoveEvent = collections.namedtuple("MoveEvent", ["x", "y", "time"])
+    module.WheelEvent = collections.namedtuple("WheelEvent", ["delta", "time"])
+    module.position = (0, 0)
+    module.moves = 0  # mouse.move calls, the app re-centers the cursor on every forwarded move
+
+    def get_position():
+        return module.position
+
+    def move(x, y, absolute=True, duration=0):
+        module.position = (x, y)
+        module.moves += 1
+
+    module.get_position = get_position
+    module.move = move
+    module.hook = lambda callback: callback
+    module.unhook = lambda callback: None
+    module.unhook_all = lambda: None
+    return module
+
+
+def _keyboard_module():
+    # Keeps the hooks the app registers so replayed events reach the same callbacks, in the
+    # same order, as with the keyboard library
+    module = types.ModuleType("keyboard")
+    module.KEY_DOWN, module.KEY_UP = "down", "up"
+    module.KeyboardEvent = collections.namedtuple("KeyboardEvent", ["event_type", "name", "time", "scan_code"], defaults=[None])
+    module.hooks = []  # callbacks for every event
+    module.key_hooks = collections.defaultdict(list)  # key name -> callbacks
+
+    def hook(callback, suppress=False):
+        module.hooks.append(callback)
+        return callback
+
+    def on_press(callback, suppress=False):
+        def handler(event):
+            if event.event_type == module.KEY_DOWN:
+                callback(event)
+        module.hooks.append(handler)
+        return handler
+
+    def hook_key(key, callback, suppress=False):
+        module.key_hooks[key].append(callback)
+        return callback
+
+    def unhook(handler):
+        if handler in module.hooks:
+            module.hooks.remove(handler)
+
+    def unhook_all():
+        module.hooks.clear()
+        module.key_hooks.clear()
+
+    def emit(event):
+        """Deliver event like the keyboard library's listener thread would."""
+        for handler in list(module.hooks) + list(module.key_hooks.get(event.name, ())):
+            handler(event)
+
+    module.hook = hook
+    module.on_press = on_press
+    module.hook_key = hook_key
+    module.unhook = unhook
+    module.unhook_all = unhook_all
+    module.emit = emit
+    return module
+
+
+def _screeninfo_module():
+    module = types.ModuleType("screeninfo")
+    Monitor = collections.namedtuple("Monitor", ["x", "y", "width", "height"])
+    module.get_monitors = lambda: [Monitor(**MONITOR)]
+    return module
+
+
+def _tkinter_module():
+    module = types.ModuleType("tkinter")
+    module.BOTH = "both"
+
+    class Widget:
+        def __getattr__(self, name):
+            # overrideredirect, attributes, geometry, withdraw, update, pack, ...
+            return lambda *args, **kwargs: None
+
+    module.Tk = lambda: Widget()
+    module.Label = lambda *args, **kwargs: Widget()
+    return module
+
+
+def install():
+    """Put the stand-ins in sys.modules, returns them by name."""
+    modules = {
+        "mouse": _mouse_module(),
+        "keyboard": _keyboard_module(),
+        "screeninfo": _screeninfo_module(),
+        "tkinter": _tkinter_module(),
+        "pyautogui": types.ModuleType("pyautogui"),
+    }
+    sys.modules.update(modules)
+    return modules
@@ -0,0 +1,56 @@
+# Per key cost of the keyboard hook lookups, before and after KeyTranslator
+#
+# run from the repository root: python -m benchmarks.keymap_bench
+
+import timeit
+
+from hid_controller.keymap import KeyTranslator, keys_with_shift, keys_without_shift, map_key_to_arduino, special_keys, typing_keys
+
+host_system = "windows"
+target_system = "mac"
+
+# Old layout: plain lists scanned on every key event
+old_keys_without_shift = list(keys_without_shift)
+old_keys_with_shift = list(keys_with_shift)
+old_special_keys = list(special_keys)
+
+# A mix of what handleKeys sees while typing: letters, shifted symbols and modifiers
+sample_keys = list("the quick brown fox") + ["shift", "?", "ctrl", "enter", "backspace", "left windows", "f5"]
+
+
+def old_lookup():
+    for key in sample_keys:
+        if key in old_special_keys:
+            map_key_to_arduino(host_system, target_system, key)
+        elif key in old_keys_without_shift or key in old_keys_with_shift:
+            pass
+
+
+def new_lookup(translator):
+    for key in sample_keys:
+        if key in special_keys:
+            translator.arduino_name(key)
+        elif key in typing_keys:
+            pass
+
+
+def per_key_ns(func, number):
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    return best / (number * len(sample_keys)) * 1e9
+
+
+def main():
+    translator = KeyTranslator(host_system, target_system)
+    number = 20000
+    old_ns = per_key_ns(old_lookup, number)
+    new_ns = per_key_ns(lambda: new_lookup(translator), number)
+    rebuild_ms = min(timeit.repeat(lambda: translator.rebuild(host_system, target_system), number=10, repeat=5)) / 10 * 1e3
+
+    print(f"lists + map_key_to_arduino: {old_ns:8.1f} ns/key")
+    print(f"frozensets + KeyTranslator: {new_ns:8.1f} ns/key")
+    print(f"speedup:                    {old_ns / new_ns:8.1f}x")
+    print(f"KeyTranslator.rebuild:      {rebuild_ms:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
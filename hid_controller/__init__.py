@@ -0,0 +1 @@
+# Shared host side code for the Wireless HID Controller scripts (app.py / app_with_server.py)
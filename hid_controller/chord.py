@@ -0,0 +1,88 @@
+# Modifier chords
+#
+# Held modifiers are kept as the bits of the HID report's modifier byte, in Keyboard.h's
+# KEY_LEFT_CTRL..KEY_RIGHT_GUI order. Every other key going down while modifiers are held is
+# one chord: the modifier byte plus its key code, pressed and released together by rx.ino.
+# A modifier pressed and released on its own becomes a chord of just the modifiers when it
+# comes up, so a lone Win/Cmd tap still reaches the target.
+#
+# With the binary protocol the hooks send modifiers as key states instead (see key_state.py),
+# chords are the ASCII protocol's fallback and the shortcuts the back and forward buttons send.
+
+import threading
+
+from hid_controller.keymap import ARDUINO_KEYCODES
+
+MODIFIER_FIRST = ARDUINO_KEYCODES["KEY_LEFT_CTRL"]
+MODIFIER_LAST = ARDUINO_KEYCODES["KEY_RIGHT_GUI"]
+
+_ARDUINO_NAMES = {code: name for name, code in ARDUINO_KEYCODES.items()}
+
+
+def modifier_bit(code):
+    """Bit of a Keyboard.h modifier code in the modifier byte, 0 for any other key."""
+    if code is None or not MODIFIER_FIRST <= code <= MODIFIER_LAST:
+        return 0
+    return 1 << (code - MODIFIER_FIRST)
+
+
+SHIFT_BITS = modifier_bit(ARDUINO_KEYCODES["KEY_LEFT_SHIFT"]) | modifier_bit(ARDUINO_KEYCODES["KEY_RIGHT_SHIFT"])
+
+
+def history_chord(forward, target_os):
+    """Chord for the back or forward mouse button, Mouse.h only knows left, right and middle."""
+    if target_os == "mac":
+        return modifier_bit(ARDUINO_KEYCODES["KEY_LEFT_GUI"]), (ord("]" if forward else "["),)
+    return modifier_bit(ARDUINO_KEYCODES["KEY_LEFT_ALT"]), (ARDUINO_KEYCODES["KEY_RIGHT_ARROW" if forward else "KEY_LEFT_ARROW"],)
+
+
+def chord_names(modifiers, codes):
+    """Keyboard.h names of a chord, for the ASCII protocol's "X," combos."""
+    names = [_ARDUINO_NAMES[MODIFIER_FIRST + bit] for bit in range(8) if modifiers & (1 << bit)]
+    for code in codes:
+        names.append(chr(code) if " " < chr(code) < "\x7f" else _ARDUINO_NAMES.get(code, chr(code)))
+    return names
+
+
+class ChordEncoder:
+    """Modifier state of the host keyboard, turns key downs into chords."""
+
+    def __init__(self):
+        self.modifiers = 0
+        self._held = {}  # key id -> modifier bit
+        self._used = False  # a chord was sent since the first modifier went down
+        self._lock = threading.Lock()
+
+    def modifier_down(self, key, code):
+        bit = modifier_bit(code)
+        if not bit:
+            return
+        with self._lock:
+            self._held[key] = bit
+            self.modifiers |= bit
+
+    def modifier_up(self, key):
+        """(modifiers, ()) if this ends a lone modifier press that has to be sent, else None."""
+        with self._lock:
+            if self._held.pop(key, None) is None:
+                return None
+            chord = None if self._used else (self.modifiers, ())
+            self._used = True
+            self.modifiers = 0
+            for bit in self._held.values():
+                self.modifiers |= bit
+            if not self.modifiers:
+                self._used = False
+            return chord
+
+    def press(self, code):
+        """The chord for a key going down while modifiers are held."""
+        with self._lock:
+            self._used = True
+            return self.modifiers, (code,)
+
+    def reset(self):
+        with self._lock:
+            self._held.clear()
+            self.modifiers = 0
+            self._used = False
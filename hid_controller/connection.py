@@ -0,0 +1,105 @@
+# Finding the tx.ino board
+#
+# The board found by a scan is remembered by its USB VID/PID/serial number in
+# PORT_CACHE_PATH. The next start opens its device straight away if the port list still shows
+# that board on it, and only scans the ports again if not. A scan finds the same board again
+# under a new device name.
+
+import json
+import os
+
+# Port descriptions a tx.ino board shows up with
+BOARD_KEYWORDS = [
+    "Leonardo",
+    "Pro Micro",
+    "Uno",
+    "Mega",
+    "Arduino",
+    "USB Serial Device",
+    "Microsoft Natural Ergonomic Keyboard 4000",
+]
+
+PORT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".hid_controller_port.json")
+
+
+def port_identity(port):
+    """The cache entry for a list_ports port, None for ports that are not USB devices."""
+    if port.vid is None:
+        return None
+    return {"device": port.device, "vid": port.vid, "pid": port.pid, "serial_number": port.serial_number}
+
+
+def load_cached_port(path=PORT_CACHE_PATH):
+    try:
+        with open(path) as f:
+            identity = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return identity if isinstance(identity, dict) and "device" in identity else None
+
+
+def save_cached_port(identity, path=PORT_CACHE_PATH):
+    try:
+        with open(path, "w") as f:
+            json.dump(identity, f)
+    except OSError as e:
+        print(f"Could not remember the microcontroller port: {e}")
+
+
+def same_board(identity, cached):
+    return all(identity[key] == cached.get(key) for key in ("vid", "pid", "serial_number"))
+
+
+def list_serial_ports():
+    import serial.tools.list_ports
+
+    return list(serial.tools.list_ports.comports())
+
+
+def find_microprocessor_port(cache_path=PORT_CACHE_PATH, ports=None):
+    """Scan the serial ports (list_serial_ports() unless given) for the board, the cached one
+    first wherever it shows up now."""
+    cached = load_cached_port(cache_path) if cache_path else None
+    if ports is None:
+        ports = list_serial_ports()
+    if cached is not None:
+        for port in ports:
+            identity = port_identity(port)
+            if identity is not None and same_board(identity, cached):
+                if identity != cached and cache_path:
+                    save_cached_port(identity, cache_path)  # same board, new device name
+                print("Starting COMs with" + port.device)
+                return port.device
+    for port in ports:
+        if any(keyword in port.description for keyword in BOARD_KEYWORDS):
+            identity = port_identity(port)
+            if identity is not None and cache_path:
+                save_cached_port(identity, cache_path)
+            print("Starting COMs with" + port.device)
+            return port.device
+    return None
+
+
+def open_microprocessor_port(open_port, cache_path=PORT_CACHE_PATH):
+    """open_port(device) on the board, returns (device, what open_port returned).
+
+    The cached device is opened without scanning the port descriptions, but only while the
+    port list shows the cached board's VID/PID/serial number on it, so another device that
+    took over its name is never sent HID frames. (None, None) if no board was found.
+    """
+    cached = load_cached_port(cache_path) if cache_path else None
+    ports = None
+    if cached is not None:
+        ports = list_serial_ports()
+        identity = next((port_identity(port) for port in ports if port.device == cached["device"]), None)
+        if identity is not None and same_board(identity, cached):
+            try:
+                return cached["device"], open_port(cached["device"])
+            except (OSError, ValueError) as e:  # SerialException is an OSError
+                print(f"Cached port {cached['device']} not available ({e}), scanning")
+        else:
+            print(f"Cached port {cached['device']} is not the microcontroller any more, scanning")
+    device = find_microprocessor_port(cache_path, ports)
+    if device is None:
+        return None, None
+    return device, open_port(device)
@@ -0,0 +1,451 @@
+# Input forwarding engine
+#
+# Everything between the OS hooks and the serial writer: edge switching, relative motion,
+# keys, chords, buttons and the wheel. All state is in the engine's ForwardingState, the
+# inputs come in through plain method calls (see hid_controller/sources.py for the hooks)
+# and the outputs go to the sink, cursor and indicator it was given. Nothing here imports
+# the OS input or GUI libraries, so engines can be built, run side by side and benchmarked
+# without a desktop.
+
+import contextlib
+import threading
+import time
+
+from hid_controller import protocol
+from hid_controller.chord import SHIFT_BITS, ChordEncoder, chord_names, history_chord
+from hid_controller.key_state import KeyStateTracker, key_id
+from hid_controller.keymap import modifier_keys, special_keys, typing_keys
+from hid_controller.layout import ScreenLayout
+from hid_controller.motion import MotionScaler
+
+KEY_DOWN = "down"  # keyboard.KEY_DOWN and mouse.DOWN
+
+
+class ForwardingState:
+    """What an engine changes while it forwards, one per engine."""
+
+    def __init__(self, region):
+        self.off_system = False  # the cursor is on a target
+        self.allow_switching = True
+        self.keyboard_forwarding = False  # the keyboard hook forwards keys
+        self.suppress_host_keys = False  # the keyboard hook keeps keys from the host
+        self.active_region = region  # the edge the current or last target was entered over
+        self.active_target = region.target
+        self.key_translator = region.target.key_translator
+        self.motion_anchor = region.anchor  # where the host cursor is parked while on the target
+        self.settling_until = 0  # perf_counter() until which moves not at the anchor are from before the switch
+        self.cursor_x = 0  # where we believe the target cursor is, in target pixels
+        self.cursor_y = 0
+        self.latest_mouse_position = None  # newest (x, y) reported by the mouse hook
+        self.latest_mouse_time = None  # time.time() stamp of that hook event
+        self.buttons = set()  # mouse buttons held on the target
+        self.chord_encoder = ChordEncoder()  # modifiers held on the host, see send_chord()
+        self.key_state = KeyStateTracker()  # keys held on the target, see press_key()
+
+
+class ForwardingEngine:
+    """Forwards host input to the targets.
+
+    sink takes the frames (a SerialWriter or anything with its send/send_motion/send_wheel/
+    clear_motion/routed/barrier methods and node), cursor moves the host cursor (move(x, y)
+    and position()), indicator shows which side has the input (show()/hide()), all three can
+    be swapped at any time. monitors are the host's, see refresh_layout().
+    """
+
+    def __init__(self, targets, monitors, sink=None, cursor=None, indicator=None, serial_protocol=protocol.PROTOCOL_BINARY,
+                 host_system="windows", edge_threshold=40, mouse_sensitivity=2, mouse_compensator_factor=1.5,
+                 switch_settle_time=0.1, text_sender=None, reliable=None, latency=None, recorder=None):
+        self.targets = targets
+        self.targets_by_name = {target.name: target for target in targets}
+        self.sink = sink
+        self.cursor = cursor
+        self.indicator = indicator
+        self.serial_protocol = serial_protocol
+        self.host_system = host_system
+        self.mouse_sensitivity = mouse_sensitivity  # gain on top of the screen ratio, tx.ino used to double the coordinates
+        self.mouse_compensator_factor = mouse_compensator_factor
+        self.switch_settle_time = switch_settle_time  # seconds moves from before the cursor was parked are ignored for at most
+        self.text_sender = text_sender  # types type_text() strings in FRAME_TEXT chunks (binary protocol only)
+        self.reliable = reliable  # ReliableSender that gets key state changes and clicks acked (binary protocol only)
+        self.latency = latency  # LatencyTracker for the key dispatch time
+        self.recorder = recorder  # InputRecorder for every hook event
+        self.log_mouse_movement = False
+        self.log_key_presses = False
+        self.log_operational_messages = True
+        self.screen_layout = ScreenLayout(targets, edge_threshold)  # edge strips of the targets
+        self.screen_layout.update(monitors)
+        self.state = ForwardingState(self.screen_layout.regions[0])
+        self.motion_scaler = MotionScaler(*self.motion_scale(self.state.active_region))
+        self._mouse_moved = threading.Event()  # set by mouse_move_event, cleared by forward_motion
+        self._web_routing = threading.local()  # .target while a routed() action runs
+
+    def refresh_layout(self, monitors):
+        """Picks up monitors being plugged in, removed or rearranged."""
+        if not self.screen_layout.update(monitors):
+            return
+        if self.log_operational_messages:
+            print("Monitor layout changed, edge regions rebuilt")
+        state = self.state
+        # The active region's monitor may have moved or gone, leave() returns over its new one
+        target = state.active_region.target
+        region = next((region for region in self.screen_layout.regions if region.target is target), None)
+        if region is None:
+            return
+        self.set_active_region(region)
+        if state.off_system:
+            # Park the host cursor on the new anchor, moves measured against the old one would jump
+            state.settling_until = time.perf_counter() + self.switch_settle_time
+            self.cursor.move(*state.motion_anchor)
+
+    def motion_scale(self, region):
+        # Target pixels per host pixel of the monitor the target is entered from
+        return (
+            region.target.width / (region.monitor.width * self.mouse_compensator_factor) * self.mouse_sensitivity,
+            region.target.height / (region.monitor.height * self.mouse_compensator_factor) * self.mouse_sensitivity,
+        )
+
+    # Targets
+
+    @contextlib.contextmanager
+    def routed(self, target):
+        """Frames sent by this thread inside the block go to target's rx.ino, keys mapped for its OS."""
+        self._web_routing.target = target
+        try:
+            with self.sink.routed(target.node):
+                yield
+        finally:
+            self._web_routing.target = None
+
+    def current_target(self):
+        # The target of the routed() block running on this thread, else the one the cursor is on
+        return getattr(self._web_routing, "target", None) or self.state.active_target
+
+    def set_target_system(self, system, target=None):
+        target = target or self.state.active_target
+        target.set_system(self.host_system, system)
+
+    def set_active_region(self, region):
+        state = self.state
+        state.active_region = region
+        state.active_target = region.target
+        state.key_translator = region.target.key_translator
+        state.motion_anchor = region.anchor
+        self.motion_scaler.scale_x, self.motion_scaler.scale_y = self.motion_scale(region)
+        self.sink.node = region.target.node
+
+    # Mouse motion and switching
+
+    def mouse_move_event(self, event):
+        # Only remember the newest position, forward_motion picks it up on its next write slot
+        if not hasattr(event, "button") and not hasattr(event, "delta"):
+            self.state.latest_mouse_time = event.time
+            self.state.latest_mouse_position = (event.x, event.y)
+            self._mouse_moved.set()
+
+    def forward_motion(self):
+        """Runs check_position for the moves mouse_move_event sees, on a thread of its own."""
+        state = self.state
+        while True:
+            self._mouse_moved.wait()
+            self._mouse_moved.clear()
+            # Moves arriving while check_position runs coalesce into latest_mouse_position,
+            # the serial writer then merges the deltas into one frame per write slot
+            self.check_position(state.latest_mouse_position, state.latest_mouse_time)
+
+    def check_position(self, position=None, event_time=None):
+        """Forward a host cursor position, from the hook or (position None) polled from cursor."""
+        state = self.state
+        try:
+            if position is None:
+                position = self.cursor.position()
+            x, y = position
+
+            if self.log_mouse_movement:
+                print(f"Mouse position: x={x}, y={y} | Off-system: {state.off_system}")
+
+            if not state.off_system:
+                # Check if the cursor is in the edge region of one of the targets
+                region = self.screen_layout.hit(x, y) if state.allow_switching else None
+                if region is not None:
+                    self.enter(region, x, y)
+                return
+
+            if not state.allow_switching:
+                return
+
+            anchor = state.motion_anchor
+            if state.settling_until:
+                # Moves the hook saw before the cursor was parked would jump the target cursor
+                if (x, y) != anchor and time.perf_counter() < state.settling_until:
+                    return
+                state.settling_until = 0
+
+            # While on the target every host move is measured against the anchor and the cursor re-centered
+            dx = x - anchor[0]
+            dy = y - anchor[1]
+            if dx == 0 and dy == 0:
+                return  # our own re-centering move
+            self.cursor.move(*anchor)
+            dx, dy = self.motion_scaler.scale(dx, dy)
+
+            if state.active_region.leaving(state.cursor_x, state.cursor_y, dx, dy):
+                self.leave()
+                return
+
+            self.move_target_cursor(dx, dy, event_time)
+
+        except Exception as e:
+            print(f"Error occurred in loop: {e}")
+
+    def move_target_cursor(self, dx, dy, event_time=None):
+        """Move the target cursor by dx, dy target pixels and keep track of where it is."""
+        state = self.state
+        target = self.current_target()
+        if target is state.active_target:
+            # Only the active target's cursor is tracked, leave() returns the host cursor next to it
+            state.cursor_x = min(max(state.cursor_x + dx, 0), target.width)
+            state.cursor_y = min(max(state.cursor_y + dy, 0), target.height)
+        if dx or dy:
+            if self.log_mouse_movement:
+                print(f"Sending dx={dx}, dy={dy}")
+            self.sink.send_motion(dx, dy, event_time)
+
+    def enter(self, region, x, y):
+        """Switch to region's target, the host cursor crossed its edge at x, y."""
+        state = self.state
+        state.off_system = True
+        self.set_active_region(region)
+        self.connect_keyboard(True)
+        if self.indicator is not None:
+            self.indicator.show()  # Show the icon when switching to the target system
+        if self.log_operational_messages:
+            print(f"Switching to target system {region.target.name}...")
+
+        # The target cursor enters on the side facing the host, the host cursor is parked on the anchor
+        state.cursor_x, state.cursor_y = region.entry(x, y)
+        self.motion_scaler.reset()
+        state.settling_until = time.perf_counter() + self.switch_settle_time
+        self.cursor.move(*state.motion_anchor)
+
+    def leave(self):
+        """Switch back to the host, next to where the target cursor left."""
+        state = self.state
+        state.off_system = False
+        self.sink.clear_motion()
+        # A drag that crosses back to the host would leave the button down on the target,
+        # mouse_event doesn't forward its release any more
+        for button in sorted(state.buttons):
+            self.button(button, False)
+        self.disconnect_keyboard()
+        if self.indicator is not None:
+            self.indicator.hide()  # Hide the icon when switching back to the host system
+        if self.log_operational_messages:
+            print("Switching back to host system...")
+
+        # Just clear of the edge region, so there is no need to wait before checking it again
+        self.cursor.move(*state.active_region.return_position(state.cursor_x, state.cursor_y))
+
+    # Mouse buttons and wheel
+
+    def mouse_event(self, event):
+        """The mouse hook for buttons and the wheel, moves are handled by mouse_move_event."""
+        if self.recorder is not None:
+            self.recorder.mouse_event(event)  # this hook sees every mouse event, moves included
+        if not self.state.off_system:
+            return False
+        if hasattr(event, "button"):
+            pressed = event.event_type == KEY_DOWN
+            if event.button in ("left", "right", "middle"):
+                self.button(event.button, pressed)
+            elif event.button in ("x", "x2") and pressed:
+                self.history_button(event.button == "x2")
+        elif hasattr(event, "delta"):
+            self.wheel(event.delta, event.time)
+        return False
+
+    def button(self, button, pressed):
+        """Press or release "left", "right" or "middle" on the target."""
+        if pressed:
+            self.state.buttons.add(button)
+        else:
+            self.state.buttons.discard(button)
+        code = protocol.CLICK_CODES[(button, pressed)]
+        if self.reliable is not None and self.serial_protocol == protocol.PROTOCOL_BINARY:
+            # A lost release would leave the button down, so clicks wait for rx.ino's ack
+            self.reliable.send_click(self.current_target().node, code)
+        else:
+            self.sink.send(protocol.encode_click(code, self.serial_protocol), "click")
+        if self.log_key_presses:
+            print(f"{button.capitalize()} mouse button {'pressed' if pressed else 'released'}")
+
+    def history_button(self, forward):
+        # Back and forward buttons go out as the target's shortcut, see history_chord()
+        self.send_chord(*history_chord(forward, self.current_target().system))
+        if self.log_key_presses:
+            print(f"Mouse {'forward' if forward else 'back'} button")
+
+    def wheel(self, delta, event_time=None):
+        # Shift + wheel is how the host scrolls sideways. With the binary protocol Shift is held
+        # on the target, which does the same by itself. With ASCII it is only held in
+        # chord_encoder, so the target gets a horizontal scroll instead of a plain one.
+        if self.state.chord_encoder.modifiers & SHIFT_BITS:
+            self.sink.send_wheel(0, -delta, event_time)
+        else:
+            self.sink.send_wheel(delta, 0, event_time)
+
+    # Keyboard
+
+    def connect_keyboard(self, prevent_system_output=False):
+        # The hook stays installed, this only switches it to forwarding
+        self.state.keyboard_forwarding = True
+        self.state.suppress_host_keys = prevent_system_output or self.state.off_system
+
+    def disconnect_keyboard(self):
+        state = self.state
+        if self.log_operational_messages:
+            print("Removing keyboard listeners")
+        state.keyboard_forwarding = False
+        state.suppress_host_keys = False
+        state.chord_encoder.reset()
+        # Nothing may stay held on the target once the keys go back to the host
+        for code in state.key_state.release_all():
+            self.send_key_state(code, False)
+
+    def keyboard_event(self, key):
+        """The one keyboard hook, returns False to keep the key from reaching the host.
+
+        Presses go to handle_key, releases to release_key, or with the ASCII protocol those of
+        modifiers to handle_modifier.
+        """
+        if self.recorder is not None:
+            self.recorder.key_event(key)
+        state = self.state
+        if not state.keyboard_forwarding:
+            return True
+        start = time.perf_counter()
+        if key.event_type == KEY_DOWN:
+            self.handle_key(key)
+        elif key.name in modifier_keys and self.serial_protocol != protocol.PROTOCOL_BINARY:
+            self.handle_modifier(key)
+        else:
+            self.release_key(key)
+        if self.latency is not None:
+            self.latency.record("key", "dispatch", time.perf_counter() - start)
+        return not state.suppress_host_keys
+
+    def handle_key(self, key):
+        state = self.state
+        if self.log_key_presses:
+            print(key.name)
+        if not state.off_system:
+            return
+        if self.serial_protocol == protocol.PROTOCOL_BINARY:
+            # Modifiers are held on the target like any other key, so Ctrl + click, Shift + drag
+            # and Ctrl + wheel work there too
+            self.press_key(key)
+        elif key.name in modifier_keys:
+            self.handle_modifier(key)
+        elif state.chord_encoder.modifiers:
+            # Every key going down while modifiers are held is its own chord, auto-repeat included
+            code = state.key_translator.keycode(key.name)
+            if code is not None:
+                self.send_chord(*state.chord_encoder.press(code), key.time)
+        else:
+            self.press_key(key)
+
+    def handle_modifier(self, key):
+        # ASCII only, tx.ino builds without key states can't hold a modifier. Modifiers only
+        # change chord_encoder, a modifier pressed and released on its own is sent when it comes up
+        state = self.state
+        if key.event_type == KEY_DOWN:
+            state.chord_encoder.modifier_down(key_id(key), state.key_translator.keycode(key.name))
+            if self.log_key_presses:
+                print(f"Special Key pressed DOWN: {key.name}")
+        else:
+            chord = state.chord_encoder.modifier_up(key_id(key))
+            if self.log_key_presses:
+                print(f"Special Key released: {key.name}")
+            if chord is not None:
+                self.send_chord(*chord, key.time)
+
+    def press_key(self, key):
+        if self.serial_protocol != protocol.PROTOCOL_BINARY:
+            # ASCII tx.ino builds only tap keys, auto-repeat comes through as more taps
+            if key.name in typing_keys:
+                self.sink.send(protocol.encode_key(key.name, True, self.serial_protocol), "key", key.time)
+            elif key.name in special_keys:
+                self.send_special_key(key.name)
+            return
+        code = self.state.key_translator.keycode(key.name)
+        # The target holds the key until its up and repeats it by itself, so auto-repeat downs are dropped
+        if code is not None and self.state.key_state.press(key_id(key), code):
+            self.send_key_state(code, True, key.time)
+            if self.log_key_presses:
+                print(f"Key pressed DOWN: {key.name}")
+
+    def release_key(self, key):
+        code = self.state.key_state.release(key_id(key))
+        if code is not None:
+            self.send_key_state(code, False, key.time)
+            if self.log_key_presses:
+                print(f"Key released: {key.name}")
+
+    def send_key_state(self, code, down, event_time=None):
+        # Binary only. A lost up would leave the key held, so with a ReliableSender it waits for rx.ino's ack
+        if self.reliable is not None:
+            self.reliable.send_key(self.current_target().node, code, down, event_time)
+        else:
+            self.sink.send(protocol.encode_key_state(code, down), "key", event_time)
+
+    def send_special_key(self, key, pressed=True):
+        # In binary mode the precompiled key_translator turns the host key name into a single byte
+        translator = self.current_target().key_translator
+        code = translator.keycode(key)
+        if self.serial_protocol == protocol.PROTOCOL_BINARY and code is not None:
+            self.sink.send(protocol.encode_keycode(code, pressed), "key")
+        else:
+            self.sink.send(protocol.encode_special_key(translator.arduino_name(key), pressed, self.serial_protocol), "key")
+
+    def send_chord(self, modifiers, codes, event_time=None):
+        # A shortcut is one frame, rx.ino presses the modifiers and keys together and lets go
+        if self.serial_protocol == protocol.PROTOCOL_BINARY:
+            self.sink.send(protocol.encode_chord(modifiers, codes), "key", event_time)
+        else:
+            self.sink.send(protocol.encode_combo(chord_names(modifiers, codes), self.serial_protocol), "key", event_time)
+        if self.log_key_presses:
+            print(f"Chord: {'+'.join(chord_names(modifiers, codes))}")
+
+    def send_web_key(self, key):
+        # Keys from the HTTP API are sent straight away and never join the hooks' combo state
+        if key in special_keys:
+            self.send_special_key(key)
+        elif key in typing_keys:
+            self.sink.send(protocol.encode_key(key, True, self.serial_protocol), "key")
+        else:
+            raise ValueError(f"Unknown key: {key}")
+        if self.log_key_presses:
+            print(f"Key pressed DOWN: {key}")
+
+    def type_text(self, string):
+        if self.serial_protocol == protocol.PROTOCOL_BINARY:
+            # rx.ino types the string itself, one radio frame per chunk, and acks every chunk
+            stats = self.text_sender.type_text(string)
+        else:
+            start = time.perf_counter()
+            characters = 0
+            for character in string:
+                if character in typing_keys:  # space, newline and the other special keys have no "K," command
+                    self.sink.send(protocol.encode_key(character, True, self.serial_protocol), "key")
+                    characters += 1
+            # Only the time to queue the keys, the ASCII protocol has no acks
+            seconds = time.perf_counter() - start
+            stats = {
+                "characters": characters,
+                "skipped": len(string) - characters,
+                "seconds": round(seconds, 3),
+                "chars_per_second": round(characters / seconds, 1) if seconds > 0 else None,
+            }
+        if self.log_operational_messages:
+            skipped = f", skipped {stats['skipped']}" if stats["skipped"] else ""
+            print(f"Typed {stats['characters']} characters at {stats['chars_per_second']} chars/s{skipped}")
+        return stats
@@ -0,0 +1,46 @@
+# The dot in the corner of the host screen that shows when input goes to a target
+#
+# tkinter is only imported when the indicator is created, headless runs never load it.
+
+import threading
+
+
+class TkIndicator:
+    """A small always-on-top square in the bottom right corner of monitor.
+
+    Tk is not thread safe: show() and hide() can be called from any thread and only set a
+    flag, update() on the thread that created the indicator applies it. changed is set until
+    then, so a main loop can wait on it.
+    """
+
+    def __init__(self, monitor, color="red"):
+        import tkinter as tk
+
+        self.visible = False
+        self.changed = threading.Event()
+        self.root = tk.Tk()
+        self.root.overrideredirect(True)  # Remove window decorations (title bar, etc.)
+        self.root.attributes("-topmost", True)  # Keep the window on top
+        self.root.geometry(f"10x10+{monitor.x + monitor.width - 20}+{monitor.y + monitor.height - 20}")  # Position the window
+        # A label to display the icon (a simple colored square)
+        label = tk.Label(self.root, bg=color)
+        label.pack(fill=tk.BOTH, expand=True)
+        self.root.withdraw()  # Start with the icon hidden
+
+    def show(self):
+        self.visible = True
+        self.changed.set()
+
+    def hide(self):
+        self.visible = False
+        self.changed.set()
+
+    def update(self):
+        if self.changed.is_set():
+            self.changed.clear()
+            if self.visible:
+                self.root.deiconify()  # Show the window
+            else:
+                self.root.withdraw()  # Hide the window
+        self.root.update_idletasks()  # Update Tkinter window
+        self.root.update()  # Process Tkinter events
@@ -0,0 +1,48 @@
+# Which keys the target holds down
+#
+# The keyboard hook repeats KEY_DOWN while a key is held and names keys by what they type,
+# so a key can go down as "A" with shift held and come up as "a". Keys are tracked by scan
+# code and their up releases the code their down pressed.
+
+import threading
+
+
+def key_id(event):
+    """What identifies the physical key of a keyboard event."""
+    scan_code = getattr(event, "scan_code", None)
+    return event.name if scan_code is None else scan_code
+
+
+class KeyStateTracker:
+    """Turns hook events into key down and up transitions.
+
+    press() is False for auto-repeat, the target repeats held keys by itself. release_all()
+    lets go of everything, e.g. when the cursor goes back to the host.
+    """
+
+    def __init__(self):
+        self._held = {}  # key id -> key code sent with its down
+        self._lock = threading.Lock()
+
+    def press(self, key, code):
+        """True if key just went down and its down has to be sent."""
+        with self._lock:
+            if key in self._held:
+                return False
+            self._held[key] = code
+            return True
+
+    def release(self, key):
+        """Key code to send the up for, None if key isn't held."""
+        with self._lock:
+            return self._held.pop(key, None)
+
+    def release_all(self):
+        with self._lock:
+            codes = list(self._held.values())
+            self._held.clear()
+            return codes
+
+    def held(self):
+        with self._lock:
+            return len(self._held)
@@ -0,0 +1,306 @@
+# Key name tables shared by the host scripts
+#
+# key_mapping translates key names between operating systems, special_key_map turns the result
+# into the Keyboard.h key names rx.ino understands and ARDUINO_KEYCODES holds their values.
+# KeyTranslator precompiles all of that for one host/target pair.
+
+key_mapping = {
+    "windows": {
+        "ctrl": "ctrl",
+        "alt": "alt",
+        "win": "cmd",  # Treat Win on Windows as Cmd on Mac
+        "shift": "shift",
+        "delete": "delete",
+        "backspace": "backspace",
+        "enter": "enter",
+        "home": "home",
+        "end": "end",
+        "pageup": "page up",
+        "pagedown": "page down",
+        "esc": "esc",
+        "tab": "tab",
+        "space": "space",
+        "cmd": "win",  # Treat CMD on Mac as Win on Windows
+        "left windows": "cmd",
+    },
+    "mac": {
+        "ctrl": "ctrl",
+        "option": "alt",  # Treat Option on Mac as Alt on Windows/Linux
+        "cmd": "cmd",
+        "shift": "shift",
+        "delete": "backspace",  # Mac delete is equivalent to backspace
+        "fn+delete": "delete",
+        "return": "enter",
+        "home": "home",
+        "end": "end",
+        "pageup": "page up",
+        "pagedown": "page down",
+        "esc": "esc",
+        "tab": "tab",
+        "space": "space",
+        "super": "cmd",  # Treat Super on Linux as CMD on Mac
+    },
+    "linux": {
+        "ctrl": "ctrl",
+        "alt": "alt",
+        "super": "super",
+        "shift": "shift",
+        "delete": "delete",
+        "backspace": "backspace",
+        "enter": "enter",
+        "home": "home",
+        "end": "end",
+        "pageup": "page up",
+        "pagedown": "page down",
+        "esc": "esc",
+        "tab": "tab",
+        "space": "space",
+        "cmd": "super"  # Treat CMD on Mac as Super on Linux
+    }
+}
+
+# Arduino-specific mapping using Keyboard.h
+special_key_map = {
+    "shift": "KEY_LEFT_SHIFT",
+    "ctrl": "KEY_LEFT_CTRL",
+    "alt": "KEY_LEFT_ALT",
+    "space": "KEY_SPACE",
+    "enter": "KEY_RETURN",
+    "backspace": "KEY_BACKSPACE",
+    "tab": "KEY_TAB",
+    "esc": "KEY_ESC",
+    "up": "KEY_UP_ARROW",
+    "down": "KEY_DOWN_ARROW",
+    "left": "KEY_LEFT_ARROW",
+    "right": "KEY_RIGHT_ARROW",
+    "capslock": "KEY_CAPS_LOCK",
+    "delete": "KEY_DELETE",
+    "home": "KEY_HOME",
+    "end": "KEY_END",
+    "page up": "KEY_PAGE_UP",
+    "page down": "KEY_PAGE_DOWN",
+    "insert": "KEY_INSERT",
+    "print screen": "KEY_PRINT_SCREEN",
+    "pause": "KEY_PAUSE",
+    "cmd": "KEY_LEFT_GUI",
+    "win": "KEY_LEFT_GUI",
+    "super": "KEY_LEFT_GUI",
+    "option": "KEY_LEFT_ALT",
+    "right gui": "KEY_RIGHT_GUI",
+    "right shift": "KEY_RIGHT_SHIFT",
+    "right alt": "KEY_RIGHT_ALT",
+    "right control": "KEY_RIGHT_CTRL",
+    "left gui": "KEY_LEFT_GUI",
+    "left shift": "KEY_LEFT_SHIFT",
+    "left alt": "KEY_LEFT_ALT",
+    "left control": "KEY_LEFT_CTRL",
+    "right windows": "KEY_RIGHT_GUI",
+}
+
+# Keys typed as characters (frozensets, the hooks test membership on every key event)
+keys_without_shift = frozenset([
+    "a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", "n", "o", "p",
+    "q", "r", "s", "t", "u", "v", "w", "x", "y", "z", "1", "2", "3", "4", "5", "6",
+    "7", "8", "9", "0", "`", "-", "=", "[", "]", ";", "'", ",", ".", "/", "\\",
+    "A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P",
+    "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z", "!", "@", "#", "$", "%", "^",
+    "&", "*", "(", ")", "_", "+", "{", "}", "|", ":", '"', "<", ">", "?"
+])
+keys_with_shift = frozenset(["~", "!", "@", "#", "$", "%", "^", "&", "*", "(", ")", "_", "+", "{", "}", "|", ":", '"', "<", ">", "?"])
+special_keys = frozenset([
+    "shift",
+    "ctrl",
+    "alt",
+    "space",
+    "enter",
+    "backspace",
+    "tab",
+    "esc",
+    "up",
+    "down",
+    "left",
+    "right",
+    "capslock",
+    "delete",
+    "home",
+    "end",
+    "page up",
+    "page down",
+    "insert",
+    "print screen",
+    "pause",
+    "cmd",
+    "win",
+    "super",
+    "option",
+    "right gui",
+    "right shift",
+    "right alt",
+    "right control",
+    "left gui",
+    "left shift",
+    "left alt",
+    "left control",
+    "left windows",
+    "right windows",
+])
+typing_keys = keys_without_shift | keys_with_shift
+# Special keys that start a combo, every other key is forwarded as its own down and up
+modifier_keys = frozenset([
+    "shift",
+    "ctrl",
+    "alt",
+    "cmd",
+    "win",
+    "super",
+    "option",
+    "right gui",
+    "right shift",
+    "right alt",
+    "right control",
+    "left gui",
+    "left shift",
+    "left alt",
+    "left control",
+    "left windows",
+    "right windows",
+])
+
+
+# Keyboard.h key codes, mirrors specialKeyMap in rx.ino
+ARDUINO_KEYCODES = {
+    "KEY_LEFT_CTRL": 0x80,
+    "KEY_LEFT_SHIFT": 0x81,
+    "KEY_LEFT_ALT": 0x82,
+    "KEY_LEFT_GUI": 0x83,
+    "KEY_RIGHT_CTRL": 0x84,
+    "KEY_RIGHT_SHIFT": 0x85,
+    "KEY_RIGHT_ALT": 0x86,
+    "KEY_RIGHT_GUI": 0x87,
+    "KEY_UP_ARROW": 0xDA,
+    "KEY_DOWN_ARROW": 0xD9,
+    "KEY_LEFT_ARROW": 0xD8,
+    "KEY_RIGHT_ARROW": 0xD7,
+    "KEY_BACKSPACE": 0xB2,
+    "KEY_TAB": 0xB3,
+    "KEY_RETURN": 0xB0,
+    "KEY_ESC": 0xB1,
+    "KEY_INSERT": 0xD1,
+    "KEY_DELETE": 0xD4,
+    "KEY_PAGE_UP": 0xD3,
+    "KEY_PAGE_DOWN": 0xD6,
+    "KEY_HOME": 0xD2,
+    "KEY_END": 0xD5,
+    "KEY_CAPS_LOCK": 0xC1,
+    "KEY_F1": 0xC2,
+    "KEY_F2": 0xC3,
+    "KEY_F3": 0xC4,
+    "KEY_F4": 0xC5,
+    "KEY_F5": 0xC6,
+    "KEY_F6": 0xC7,
+    "KEY_F7": 0xC8,
+    "KEY_F8": 0xC9,
+    "KEY_F9": 0xCA,
+    "KEY_F10": 0xCB,
+    "KEY_F11": 0xCC,
+    "KEY_F12": 0xCD,
+    "KEY_PRINT_SCREEN": 0xCE,
+    "KEY_SCROLL_LOCK": 0xCF,
+    "KEY_PAUSE": 0xD0,
+    "KEY_NUM_LOCK": 0xDB,
+    "KEYPAD_0": 0xEA,
+    "KEYPAD_1": 0xE1,
+    "KEYPAD_2": 0xE2,
+    "KEYPAD_3": 0xE3,
+    "KEYPAD_4": 0xE4,
+    "KEYPAD_5": 0xE5,
+    "KEYPAD_6": 0xE6,
+    "KEYPAD_7": 0xE7,
+    "KEYPAD_8": 0xE8,
+    "KEYPAD_9": 0xE9,
+    "KEYPAD_DIVIDE": 0xDC,
+    "KEYPAD_MULTIPLY": 0xDD,
+    "KEYPAD_SUBTRACT": 0xDE,
+    "KEYPAD_ADD": 0xDF,
+    "KEYPAD_ENTER": 0xE0,
+    "KEYPAD_DOT": 0xEB,
+    "KEY_SPACE": ord(" "),
+}
+
+
+def map_key_to_arduino(input_os, target_os, key_pressed):
+    # Normalize the key name to lowercase
+    key_pressed_lowered = key_pressed.lower()
+
+    # Step 1: Convert the key from the input OS to a general target key
+    if input_os not in key_mapping:
+        return key_pressed  # Unsupported OS
+
+    target_key_intermediate = key_mapping[input_os].get(key_pressed_lowered, key_pressed_lowered)
+
+    # Step 2: Convert the intermediate key to the target OS key
+    if target_os not in key_mapping:
+        return key_pressed  # Unsupported OS
+
+    target_key_final = key_mapping[target_os].get(target_key_intermediate, target_key_intermediate)
+
+    # Step 3: Map the final target key to an Arduino key code
+    arduino_key_code = special_key_map.get(target_key_final.lower())
+
+    if arduino_key_code:
+        return arduino_key_code
+    else:
+        return target_key_final  # No mapping found, return the intermediate key as a fallback
+
+
+def arduino_keycode(name):
+    """Keyboard.h key code for an Arduino key name or a single printable character, None if unknown."""
+    code = ARDUINO_KEYCODES.get(name)
+    if code is None and len(name) == 1 and " " <= name < "\x7f":
+        code = ord(name)
+    return code
+
+
+def build_keycode_table(input_os, target_os, special_keys, characters=()):
+    """Resolve host key names to key codes once, so sending a key is a single dict lookup."""
+    table = {}
+    for name in set(special_keys) | set(special_key_map) | set(key_mapping.get(input_os, {})):
+        code = arduino_keycode(map_key_to_arduino(input_os, target_os, name))
+        if code is not None:
+            table[name] = code
+    # Characters are typed as they are, map_key_to_arduino would lowercase them
+    for character in characters:
+        code = arduino_keycode(character)
+        if code is not None:
+            table[character] = code
+    return table
+
+
+class KeyTranslator:
+    """map_key_to_arduino and key code lookups precompiled for one host/target pair.
+
+    Every known key is translated once up front so the keyboard hook only does dict lookups.
+    Call rebuild() when the target system changes at runtime.
+    """
+
+    def __init__(self, input_os, target_os):
+        self.rebuild(input_os, target_os)
+
+    def rebuild(self, input_os, target_os):
+        names = special_keys | set(special_key_map) | set(key_mapping.get(input_os, {}))
+        arduino_names = {name: map_key_to_arduino(input_os, target_os, name) for name in names}
+        keycodes = build_keycode_table(input_os, target_os, names, typing_keys)
+        # Swap whole tables so a hook running on another thread never sees a half built one
+        self.input_os = input_os
+        self.target_os = target_os
+        self.arduino_names = arduino_names
+        self.keycodes = keycodes
+
+    def arduino_name(self, key):
+        name = self.arduino_names.get(key)
+        if name is None:
+            name = map_key_to_arduino(self.input_os, self.target_os, key)
+        return name
+
+    def keycode(self, key):
+        return self.keycodes.get(key)
@@ -0,0 +1,161 @@
+# Input lag instrumentation
+#
+# Every frame the writer sends records its host side stages:
+#
+#   hook         hook callback -> enqueued (for motion: until the merged update is encoded)
+#   queue        enqueued -> written to the serial port
+#
+# Now and then one binary frame is sent with FRAME_TRACE_FLAG set, tx.ino and rx.ino then time
+# their part and tx.ino reports back with a FRAME_TRACE frame:
+#
+#   tx_radio     tx.ino frame received -> radio write acked by rx.ino's radio
+#   rx_dispatch  rx.ino payload read -> Mouse/Keyboard call done
+#   serial       one way host -> tx.ino, half of the serial round trip left after tx.ino's part
+#   end_to_end   hook callback -> HID report on the target, sum of the stages above
+#
+# The apps add their own stages with record(), e.g. "dispatch", the run time of the keyboard hook.
+
+import struct
+import threading
+import time
+
+from hid_controller import protocol
+
+
+class LatencyHistogram:
+    """Microsecond histogram with HdrHistogram style log-linear buckets.
+
+    Values keep sub_bucket_bits of precision, 7 bits is within 1% at any magnitude.
+    """
+
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value_us):
+        value = max(0, int(value_us))
+        shift = max(0, value.bit_length() - self.sub_bucket_bits)
+        bucket = (shift, value >> shift)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        if not self.total:
+            return None
+        target = max(1, -(-self.total * percent // 100))
+        seen = 0
+        for shift, mantissa in sorted(self.counts):
+            seen += self.counts[(shift, mantissa)]
+            if seen >= target:
+                # Highest value that lands in this bucket, like HdrHistogram reports it
+                return min(((mantissa + 1) << shift) - 1, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+class LatencyTracker:
+    """Collects per event type, per stage latency histograms for the SerialWriter.
+
+    prepare() and written() are called by the writer thread around each write, on_trace()
+    by the SerialReader. Only one device trace is outstanding at a time, tx.ino keeps a
+    single slot for it.
+    """
+
+    def __init__(self, sample_interval=0.02, trace_timeout=0.5):
+        self.sample_interval = sample_interval
+        self.trace_timeout = trace_timeout
+        self.traces = 0
+        self.lost_traces = 0  # trace sent but no FRAME_TRACE came back in time
+        self.radio_failures = 0
+        self._histograms = {}
+        self._trace = None  # the outstanding trace
+        self._last_trace = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, event_type, stage, seconds):
+        histogram = self._histograms.setdefault(event_type, {}).get(stage)
+        if histogram is None:
+            histogram = self._histograms[event_type][stage] = LatencyHistogram()
+        histogram.record(seconds * 1e6)
+
+    def record(self, event_type, stage, seconds):
+        with self._lock:
+            self._record(event_type, stage, seconds)
+
+    def prepare(self, event_type, data):
+        """Flag data for a device trace if the trace slot is free, returns the bytes to write."""
+        if not data or data[0] != protocol.FRAME_SYNC:
+            return data  # ASCII lines can't carry the flag
+        now = time.perf_counter()
+        with self._lock:
+            if self._trace is not None:
+                if now - self._trace["started"] < self.trace_timeout:
+                    return data
+                self.lost_traces += 1
+                self._trace = None
+            if event_type in ("mouse", "wheel") and now - self._last_trace < self.sample_interval:
+                return data  # motion and scrolling are plentiful, keys and clicks are always worth a sample
+            self._last_trace = now
+            self._trace = {"type": event_type, "seq": data[2], "started": now, "written": None}
+        return protocol.request_trace(data)
+
+    def written(self, event_type, data, hook_delay, enqueued, written):
+        with self._lock:
+            queue_delay = written - enqueued
+            if hook_delay is not None:
+                self._record(event_type, "hook", hook_delay)
+            self._record(event_type, "queue", queue_delay)
+            trace = self._trace
+            if trace is not None and trace["written"] is None and data[0] == protocol.FRAME_SYNC and data[2] == trace["seq"]:
+                trace["written"] = written
+                trace["host"] = (hook_delay or 0.0) + queue_delay
+
+    def on_trace(self, seq, payload):
+        # SerialReader handler for FRAME_TRACE
+        now = time.perf_counter()
+        traced_seq, flags, tx_radio_us, rx_dispatch_us, tx_roundtrip_us = struct.unpack("<BBHHH", payload)
+        with self._lock:
+            trace = self._trace
+            if trace is None or trace["seq"] != traced_seq or trace["written"] is None:
+                return
+            self._trace = None
+            self.traces += 1
+            event_type = trace["type"]
+            if not flags & protocol.TRACE_RADIO_OK:
+                self.radio_failures += 1
+                return
+            serial = max(0.0, (now - trace["written"]) - tx_roundtrip_us / 1e6) / 2
+            tx_radio = tx_radio_us / 1e6
+            rx_dispatch = rx_dispatch_us / 1e6
+            self._record(event_type, "serial", serial)
+            self._record(event_type, "tx_radio", tx_radio)
+            self._record(event_type, "rx_dispatch", rx_dispatch)
+            self._record(event_type, "end_to_end", trace["host"] + serial + tx_radio + rx_dispatch)
+
+    def snapshot(self):
+        """Histogram summaries in microseconds, by event type and stage."""
+        with self._lock:
+            return {
+                "traces": self.traces,
+                "lost_traces": self.lost_traces,
+                "radio_failures": self.radio_failures,
+                "latency_us": {
+                    event_type: {stage: histogram.summary() for stage, histogram in stages.items()}
+                    for event_type, stages in self._histograms.items()
+                },
+            }
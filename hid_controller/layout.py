@@ -0,0 +1,120 @@
+# Host screen layout: which strips along the monitors' edges lead to which target
+#
+# The strips are worked out once per monitor layout (ScreenLayout.update) and bucketed in a
+# grid of threshold sized cells. Finding the strip under the cursor is then one dict lookup
+# and a bounds check of the one or two strips sharing that cell, however many monitors and
+# targets there are.
+
+
+def edge_monitor(monitors, edge):
+    """The outermost monitor on a side, e.g. the rightmost one for "right"."""
+    if edge == "right":
+        return max(monitors, key=lambda m: m.x + m.width)
+    if edge == "left":
+        return min(monitors, key=lambda m: m.x)
+    if edge == "top":
+        return min(monitors, key=lambda m: m.y)
+    return max(monitors, key=lambda m: m.y + m.height)
+
+
+def monitor_key(monitors):
+    return tuple((m.x, m.y, m.width, m.height) for m in monitors)
+
+
+class EdgeRegion:
+    """The strip along one monitor edge that leads to a target.
+
+    On the target the cursor enters on the side facing the host and going back over that
+    side returns to the host, next to where it left.
+    """
+
+    def __init__(self, target, monitor, threshold):
+        self.target = target
+        self.monitor = monitor
+        self.edge = target.edge
+        self.threshold = threshold
+        m = monitor
+        # Inclusive x0, y0, x1, y1, the strip reaches one pixel past the monitor like the cursor can
+        if self.edge == "right":
+            self.bounds = (m.x + m.width - threshold, m.y, m.x + m.width, m.y + m.height)
+        elif self.edge == "left":
+            self.bounds = (m.x, m.y, m.x + threshold, m.y + m.height)
+        elif self.edge == "top":
+            self.bounds = (m.x, m.y, m.x + m.width, m.y + threshold)
+        else:
+            self.bounds = (m.x, m.y + m.height - threshold, m.x + m.width, m.y + m.height)
+        self.anchor = (m.x + m.width // 2, m.y + m.height // 2)  # where the host cursor is parked
+
+    def contains(self, x, y):
+        x0, y0, x1, y1 = self.bounds
+        return x0 <= x <= x1 and y0 <= y <= y1
+
+    def entry(self, x, y):
+        """Target cursor position for a host cursor crossing the edge at x, y."""
+        m, target = self.monitor, self.target
+        if self.edge in ("right", "left"):
+            return (0 if self.edge == "right" else target.width), (y - m.y) * target.height / m.height
+        return (x - m.x) * target.width / m.width, (target.height if self.edge == "top" else 0)
+
+    def leaving(self, cursor_x, cursor_y, dx, dy):
+        """True if moving the target cursor by dx, dy goes back over the side facing the host."""
+        if self.edge == "right":
+            return dx < 0 and cursor_x + dx <= 0
+        if self.edge == "left":
+            return dx > 0 and cursor_x + dx >= self.target.width
+        if self.edge == "top":
+            return dy > 0 and cursor_y + dy >= self.target.height
+        return dy < 0 and cursor_y + dy <= 0
+
+    def return_position(self, cursor_x, cursor_y):
+        """Host cursor position when coming back from target cursor_x, cursor_y, just clear of the strip."""
+        m, target, gap = self.monitor, self.target, self.threshold + 2
+        if self.edge in ("right", "left"):
+            x = m.x + m.width - gap if self.edge == "right" else m.x + gap
+            return x, m.y + cursor_y * m.height / target.height
+        y = m.y + gap if self.edge == "top" else m.y + m.height - gap
+        return m.x + cursor_x * m.width / target.width, y
+
+
+class ScreenLayout:
+    """EdgeRegions of a set of targets on the current monitors, with a constant time hit()."""
+
+    def __init__(self, targets, threshold):
+        self.targets = targets
+        self.threshold = threshold
+        self.regions = []
+        self._cell = max(1, threshold)
+        self._cells = {}  # (x // cell, y // cell) -> regions overlapping that cell
+        self._key = None
+
+    def update(self, monitors):
+        """Rebuild the regions if the monitors changed, returns True if they did."""
+        key = monitor_key(monitors)
+        if key == self._key:
+            return False
+        regions = [EdgeRegion(target, self._monitor(monitors, target), self.threshold) for target in self.targets]
+        cell = self._cell
+        cells = {}
+        for region in regions:
+            x0, y0, x1, y1 = region.bounds
+            for cx in range(x0 // cell, x1 // cell + 1):
+                for cy in range(y0 // cell, y1 // cell + 1):
+                    cells.setdefault((cx, cy), []).append(region)
+        # Swap both at once, the mouse hook may be in hit() on another thread
+        self.regions, self._cells, self._key = regions, cells, key
+        return True
+
+    def _monitor(self, monitors, target):
+        # Target.monitor is an index into get_monitors(), the outermost monitor if it's None or
+        # the monitor went away
+        if target.monitor is not None and 0 <= target.monitor < len(monitors):
+            return monitors[target.monitor]
+        return edge_monitor(monitors, target.edge)
+
+    def hit(self, x, y):
+        """The region under the host cursor at x, y, or None."""
+        cell = self._cell
+        for region in self._cells.get((int(x) // cell, int(y) // cell), ()):
+            if region.contains(x, y):
+                return region
+        return None
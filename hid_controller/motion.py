@@ -0,0 +1,24 @@
+# Host to target mouse motion
+
+
+class MotionScaler:
+    """Turns host pixel deltas into whole target counts, carrying the sub-pixel remainder to the next move."""
+
+    def __init__(self, scale_x, scale_y):
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.remainder_x = 0.0
+        self.remainder_y = 0.0
+
+    def scale(self, dx, dy):
+        scaled_x = dx * self.scale_x + self.remainder_x
+        scaled_y = dy * self.scale_y + self.remainder_y
+        counts_x = int(scaled_x)
+        counts_y = int(scaled_y)
+        self.remainder_x = scaled_x - counts_x
+        self.remainder_y = scaled_y - counts_y
+        return counts_x, counts_y
+
+    def reset(self):
+        self.remainder_x = 0.0
+        self.remainder_y = 0.0
@@ -0,0 +1,152 @@
+# Motion update rate that follows what the link can carry
+#
+# SerialWriter merges mouse deltas and sends them once per motion_interval. The write slot the
+# apps start with (motion_write_slot()) assumes every radio write gets through first time.
+# When the radio retries, fails or the channel is busy, tx.ino falls behind, the bytes pile up
+# in its serial buffer and in the host's, and the target cursor lags behind the hand.
+#
+# MotionRateController adjusts motion_interval AIMD style from what the link reports:
+#
+#   FRAME_LINK_STATS  tx.ino's radio writes, failures and the serial bytes it has not read yet
+#   out_waiting       bytes the host wrote that have not reached tx.ino
+#   retransmits       key and click changes ReliableSender had to send again
+#
+# A period with failures or a backlog halves the motion rate. A period where moves had to be
+# merged while waiting for their slot, with neither, raises it by increase_hz, back up to one
+# update per write slot. The deltas of a longer interval are summed into one update, so no
+# movement is lost, the target cursor moves in fewer and larger steps.
+
+import struct
+import threading
+import time
+
+from hid_controller import protocol
+
+
+class MotionRateController:
+    """Adjusts writer.motion_interval between min_interval and max_interval every period seconds.
+
+    ser is the port whose out_waiting is watched, reliable a ReliableSender whose retransmits
+    count as failures. Register on_link_stats as the SerialReader handler for FRAME_LINK_STATS.
+    """
+
+    def __init__(self, writer, ser=None, reliable=None, min_interval=None, max_interval=0.02, period=0.1,
+                 increase_hz=100.0, decrease_factor=0.5, max_failure_rate=0.1, max_backlog=32):
+        self.writer = writer
+        self.ser = ser
+        self.reliable = reliable
+        self.min_interval = writer.motion_interval if min_interval is None else min_interval
+        self.max_interval = max_interval  # 50 updates a second still look like movement, not jumps
+        self.period = period
+        self.increase_hz = increase_hz
+        self.decrease_factor = decrease_factor
+        self.max_failure_rate = max_failure_rate  # of tx.ino's radio writes in a period
+        self.max_backlog = max_backlog  # bytes waiting for tx.ino, on either side of the USB link
+        self.increases = 0
+        self.decreases = 0
+        self.last_reason = None  # why the rate was last cut
+        self._rate = 1 / self.min_interval if self.min_interval > 0 else None  # updates a second, None for unlimited
+        self._link = [0, 0, 0, 0]  # radio writes, failures, radio us, most serial bytes tx.ino had waiting
+        self._link_reports = 0
+        self._utilisation = None  # share of the last period tx.ino spent in radio writes
+        self._failure_rate = None
+        self._merged_motion = writer.merged_motion
+        self._retransmits = reliable.retransmits if reliable is not None else 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="motion-rate")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def on_link_stats(self, seq, payload):
+        # SerialReader handler for FRAME_LINK_STATS
+        writes, failures, radio_us, waiting = struct.unpack(protocol.LINK_STATS_FORMAT, payload)
+        with self._lock:
+            self._link[0] += writes
+            self._link[1] += failures
+            self._link[2] += radio_us
+            self._link[3] = max(self._link[3], waiting)
+            self._link_reports += 1
+
+    def _out_waiting(self):
+        try:
+            return self.ser.out_waiting if self.ser is not None else 0
+        except Exception:
+            return 0  # not every platform's serial driver reports it
+
+    def _congestion(self, writes, failures, tx_waiting, out_waiting, retransmits):
+        # Why the link can't keep up with the current rate, None if it can
+        if writes and failures / writes > self.max_failure_rate:
+            return f"{failures} of {writes} radio writes failed"
+        if tx_waiting > self.max_backlog:
+            return f"{tx_waiting} bytes waiting in tx.ino"
+        if out_waiting > self.max_backlog:
+            return f"{out_waiting} bytes waiting on the host"
+        if retransmits:
+            return f"{retransmits} key/click retransmits"
+        return None
+
+    def adjust(self, elapsed):
+        """Take one AIMD step from what the link reported over the last elapsed seconds."""
+        with self._lock:
+            writes, failures, radio_us, tx_waiting = self._link
+            self._link = [0, 0, 0, 0]
+        retransmits = 0
+        if self.reliable is not None:
+            retransmits = self.reliable.retransmits - self._retransmits
+            self._retransmits += retransmits
+        merged = self.writer.merged_motion - self._merged_motion
+        self._merged_motion += merged
+        self._utilisation = min(1.0, radio_us / 1e6 / elapsed) if writes and elapsed > 0 else None
+        self._failure_rate = failures / writes if writes else None
+
+        reason = self._congestion(writes, failures, tx_waiting, self._out_waiting(), retransmits)
+        if self._rate is None:
+            return  # no write slot to pace by
+        if reason is not None:
+            rate = max(1 / self.max_interval, self._rate * self.decrease_factor)
+            if rate < self._rate:
+                self.decreases += 1
+                self.last_reason = reason
+        elif merged:
+            # Moves waited for their slot, there is more to send than the current rate allows
+            rate = min(1 / self.min_interval, self._rate + self.increase_hz)
+            if rate > self._rate:
+                self.increases += 1
+        else:
+            return
+        self._rate = rate
+        self.writer.motion_interval = 1 / rate
+
+    def _run(self):
+        adjusted = time.perf_counter()
+        while not self._stopped.wait(self.period):
+            now = time.perf_counter()
+            self.adjust(now - adjusted)
+            adjusted = now
+
+    def snapshot(self):
+        """Current motion rate and the link feedback behind it, served by /stats."""
+        with self._lock:
+            link_reports = self._link_reports
+        return {
+            "interval_ms": round(self.writer.motion_interval * 1000, 3),
+            "rate_hz": round(self._rate, 1) if self._rate is not None else None,
+            "min_interval_ms": round(self.min_interval * 1000, 3),
+            "max_interval_ms": round(self.max_interval * 1000, 3),
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "last_reason": self.last_reason,
+            "link_reports": link_reports,
+            "radio_utilisation": round(self._utilisation, 3) if self._utilisation is not None else None,
+            "radio_failure_rate": round(self._failure_rate, 3) if self._failure_rate is not None else None,
+        }
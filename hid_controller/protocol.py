@@ -0,0 +1,392 @@
+# Serial protocol between the host scripts and tx.ino
+#
+# Two protocols are supported and selected with serial_protocol in the app scripts:
+#
+#   "ascii"  - the original newline terminated text commands (M{x},{y} / D,dx,dy,... / C,n / K,c / U,c / S,name / T,name / X,a,b)
+#   "binary" - compact fixed width frames, layout:
+#
+#       [FRAME_SYNC][type][seq][payload ...][crc8]
+#
+#   FRAME_SYNC carries the protocol version in its low nibble and is always above 0x7F so tx.ino
+#   can tell a binary frame from an ASCII line by its first byte. The crc covers type, seq and payload.
+#   Multi byte fields are little endian, the payload width is fixed per frame type and the few
+#   variable length frames carry their own length byte.
+#
+#   Frame types with the high bit set travel the other way, from tx.ino back to the host.
+#   FRAME_TRACE_FLAG on a host frame asks tx.ino and rx.ino to time it (see latency.py),
+#   FRAME_ACK_FLAG asks rx.ino to acknowledge its seq once applied (see reliable.py).
+
+import itertools
+import struct
+
+PROTOCOL_ASCII = "ascii"
+PROTOCOL_BINARY = "binary"
+
+PROTOCOL_VERSION = 1
+FRAME_SYNC = 0xF0 | PROTOCOL_VERSION
+
+# Frame types (keep in sync with tx.ino)
+FRAME_MOUSE_POSITION = 0x01  # int16 x, int16 y
+FRAME_CLICK = 0x02  # uint8 click code, same numbering as "C,n"
+FRAME_KEY = 0x03  # uint8 character, uint8 pressed
+FRAME_SPECIAL_KEY = 0x04  # uint8 pressed, uint8 length, key name
+FRAME_COMBO = 0x05  # uint8 length, comma separated key names
+FRAME_MOUSE_DELTA = 0x06  # int8 dx, int8 dy
+FRAME_MOUSE_DELTA_BATCH = 0x07  # uint8 count, count x (int8 dx, int8 dy)
+FRAME_KEYCODE = 0x08  # uint8 Keyboard.h key code, uint8 pressed
+FRAME_KEYCODE_COMBO = 0x09  # uint8 count, count x uint8 key code
+FRAME_TEXT = 0x0A  # uint8 stream, uint8 chunk index, uint8 length, ASCII text typed by rx.ino
+FRAME_KEY_STATE = 0x0B  # uint8 Keyboard.h key code, uint8 down; held until its up, FRAME_KEYCODE taps
+FRAME_CHORD = 0x0C  # uint8 modifier bits, uint8 count, count x uint8 key code; tapped together
+FRAME_MOUSE_WHEEL = 0x0D  # int8 vertical, int8 horizontal wheel steps
+FRAME_ROUTE = 0x0E  # uint16 RF24Network node of the rx.ino every following frame goes to
+FRAME_STATE_SNAPSHOT = 0x0F  # uint8 modifier bits, uint8 button bits, uint8 count, count x uint8 held key code
+
+FRAME_TRACE_FLAG = 0x40  # or'ed into the type of a host frame to get a FRAME_TRACE back
+FRAME_ACK_FLAG = 0x20  # or'ed into the type of a FRAME_KEY_STATE or FRAME_CLICK to get a FRAME_EVENT_ACK back
+
+# Frames sent by tx.ino
+FRAME_TEXT_ACK = 0x81  # uint8 stream, uint8 chunk index, uint8 TEXT_* status
+FRAME_TRACE = 0x82  # uint8 traced seq, uint8 TRACE_* flags, uint16 tx radio us, uint16 rx dispatch us, uint16 tx round trip us
+FRAME_EVENT_ACK = 0x83  # uint8 seq of the acked frame, uint8 EVENT_* status
+FRAME_LINK_STATS = 0x84  # uint16 radio writes, uint16 of them failed, uint16 radio us, uint8 serial bytes waiting; every LINK_STATS_INTERVAL while writing
+
+LINK_STATS_INTERVAL = 0.05  # seconds, tx.ino's reporting period for FRAME_LINK_STATS
+LINK_STATS_FORMAT = "<HHHB"
+
+# FRAME_TRACE flags
+TRACE_RADIO_OK = 0x01  # rx.ino got the payload, the timings are valid
+
+# FRAME_TEXT_ACK status
+TEXT_TYPED = 0  # chunk typed, and every chunk before it
+TEXT_RADIO_FAILED = 1  # tx.ino could not deliver the chunk to rx.ino
+TEXT_OUT_OF_ORDER = 2  # rx.ino is waiting for an earlier chunk, nothing typed
+
+# FRAME_EVENT_ACK status
+EVENT_APPLIED = 0  # rx.ino applied the key or button change
+EVENT_RADIO_FAILED = 1  # tx.ino could not deliver it to rx.ino
+
+# RF24Network addresses. tx.ino is 01, the first rx.ino its parent 00, more receivers are
+# tx.ino's children 011 to 051 so every rx.ino is one hop away.
+TX_NODE = 0o1
+RX_NODE = 0o0
+RX_NODES = (RX_NODE, 0o11, 0o21, 0o31, 0o41, 0o51)
+
+MAX_NAME_LENGTH = 127  # payload_t.message is 128 bytes including the terminator
+MAX_DELTA = 127  # Mouse.move() takes signed chars
+
+# Click codes of "C,n" and FRAME_CLICK: button (n + 1) // 2 (1 left, 2 right, 3 middle), odd codes press
+CLICK_CODES = {
+    ("left", True): 1,
+    ("left", False): 2,
+    ("right", True): 3,
+    ("right", False): 4,
+    ("middle", True): 5,
+    ("middle", False): 6,
+}
+
+# Radio payload sent from tx.ino to rx.ino (payload_t). Only the header and the used part
+# of message go on air, a 32 byte nRF24L01 frame leaves 24 bytes after the RF24Network header.
+PAYLOAD_MOUSE_POSITION = 0
+PAYLOAD_CLICK = 1
+PAYLOAD_KEY = 2
+PAYLOAD_SPECIAL_KEY = 3
+PAYLOAD_COMBO = 4
+PAYLOAD_MOUSE_DELTA = 5
+PAYLOAD_KEYCODE = 6
+PAYLOAD_KEYCODE_COMBO = 7
+PAYLOAD_TEXT = 8  # x = stream, y = chunk index, message = text
+PAYLOAD_TEXT_ACK = 9  # rx.ino -> tx.ino, x = stream, y = chunk index, message = status
+PAYLOAD_TRACE_ACK = 10  # rx.ino -> tx.ino, message = uint16 dispatch us
+PAYLOAD_KEY_STATE = 11  # x = key code, isPressed = down
+PAYLOAD_CHORD = 12  # x = modifier bits, message = key codes
+PAYLOAD_MOUSE_WHEEL = 13  # x = vertical, y = horizontal steps
+PAYLOAD_STATE_SNAPSHOT = 14  # x = modifier bits, message = button bits + held key codes
+PAYLOAD_EVENT_ACK = 15  # rx.ino -> tx.ino, y = seq of the acked payload
+PAYLOAD_TRACE_FLAG = 0x80  # or'ed into type, asks rx.ino for a PAYLOAD_TRACE_ACK
+PAYLOAD_ACK_FLAG = 0x40  # or'ed into type with the frame's seq in y, asks rx.ino for a PAYLOAD_EVENT_ACK
+
+PAYLOAD_HEADER_FORMAT = "<BbbBB"  # type, x, y, isPressed, length
+PAYLOAD_HEADER_SIZE = struct.calcsize(PAYLOAD_HEADER_FORMAT)
+PAYLOAD_MAX_MESSAGE = 128
+RF24_FRAME_PAYLOAD = 32 - 8
+
+MAX_DELTA_STEPS = (RF24_FRAME_PAYLOAD - PAYLOAD_HEADER_SIZE) // 2  # steps per batch, one radio frame each
+TEXT_CHUNK_SIZE = RF24_FRAME_PAYLOAD - PAYLOAD_HEADER_SIZE  # characters per FRAME_TEXT, one radio frame each
+
+# Payload sizes of the frames tx.ino sends back, by type
+_HOST_FRAME_SIZES = {
+    FRAME_TEXT_ACK: 3,
+    FRAME_TRACE: 8,
+    FRAME_EVENT_ACK: 2,
+    FRAME_LINK_STATS: 7,
+}
+
+# Fixed payload sizes of the host frames, the others carry a count or length byte
+_FIXED_FRAME_SIZES = {
+    FRAME_MOUSE_POSITION: 4,
+    FRAME_CLICK: 1,
+    FRAME_KEY: 2,
+    FRAME_MOUSE_DELTA: 2,
+    FRAME_KEYCODE: 2,
+    FRAME_KEY_STATE: 2,
+    FRAME_MOUSE_WHEEL: 2,
+    FRAME_ROUTE: 2,
+}
+
+# Typical size of a mouse update, used to budget serial write slots
+ASCII_MOUSE_FRAME_SIZE = 10  # e.g. "D,-12,34\n"
+BINARY_MOUSE_FRAME_SIZE = 6
+
+
+def _build_crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+_crc8_table = _build_crc8_table()
+_sequence = itertools.count()
+
+
+def crc8(data):
+    """CRC-8 (polynomial 0x07) as computed by tx.ino."""
+    crc = 0
+    for byte in data:
+        crc = _crc8_table[crc ^ byte]
+    return crc
+
+
+def next_sequence():
+    return next(_sequence) & 0xFF
+
+
+def pack_payload(payload_type, x=0, y=0, pressed=False, message=b""):
+    """Mirror of the payload_t bytes tx.ino puts on air for one event."""
+    assert len(message) <= PAYLOAD_MAX_MESSAGE, f"payload message too long ({len(message)} bytes)"
+    return struct.pack(PAYLOAD_HEADER_FORMAT, payload_type, x, y, int(pressed), len(message)) + message
+
+
+def fits_single_frame(payload):
+    return len(payload) <= RF24_FRAME_PAYLOAD
+
+
+def build_frame(frame_type, payload=b"", seq=None):
+    body = bytes((frame_type, next_sequence() if seq is None else seq)) + payload
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),))
+
+
+def frame_length(data):
+    """Length of the first host frame in data, mirrors expectedBodyLength() in tx.ino."""
+    frame_type = data[1] & ~(FRAME_TRACE_FLAG | FRAME_ACK_FLAG)
+    payload = data[3:]
+    size = _FIXED_FRAME_SIZES.get(frame_type)
+    if size is None:
+        if frame_type == FRAME_SPECIAL_KEY:
+            size = 2 + payload[1]
+        elif frame_type in (FRAME_COMBO, FRAME_KEYCODE_COMBO):
+            size = 1 + payload[0]
+        elif frame_type == FRAME_MOUSE_DELTA_BATCH:
+            size = 1 + 2 * payload[0]
+        elif frame_type == FRAME_TEXT:
+            size = 3 + payload[2]
+        elif frame_type == FRAME_CHORD:
+            size = 2 + payload[1]
+        elif frame_type == FRAME_STATE_SNAPSHOT:
+            size = 3 + payload[2]
+        else:
+            raise ValueError(f"Unknown frame type {frame_type:#04x}")
+    return 4 + size
+
+
+def request_trace(data):
+    """Set FRAME_TRACE_FLAG on the first frame in data."""
+    length = frame_length(data)
+    body = bytes((data[1] | FRAME_TRACE_FLAG,)) + data[2:length - 1]
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),)) + data[length:]
+
+
+def request_ack(data, seq):
+    """Set FRAME_ACK_FLAG and seq on the first frame in data, rx.ino acks it with that seq."""
+    length = frame_length(data)
+    body = bytes((data[1] | FRAME_ACK_FLAG, seq & 0xFF)) + data[3:length - 1]
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),)) + data[length:]
+
+
+def _clamp_int16(value):
+    return max(-32768, min(32767, int(value)))
+
+
+def _name_bytes(name):
+    data = name.encode()[:MAX_NAME_LENGTH]
+    return bytes((len(data),)) + data
+
+
+def mouse_frame_size(protocol):
+    return BINARY_MOUSE_FRAME_SIZE if protocol == PROTOCOL_BINARY else ASCII_MOUSE_FRAME_SIZE
+
+
+def encode_mouse_position(x, y, protocol=PROTOCOL_ASCII):
+    if protocol == PROTOCOL_BINARY:
+        return build_frame(FRAME_MOUSE_POSITION, struct.pack("<hh", _clamp_int16(x), _clamp_int16(y)))
+    return f"M{x},{y}\n".encode()
+
+
+def split_delta(dx, dy, limit=MAX_DELTA):
+    """Split an integer move into steps that fit Mouse.move(), spread evenly over both axes."""
+    count = max(1, -(-max(abs(dx), abs(dy)) // limit))
+    steps = []
+    sent_x = sent_y = 0
+    for step in range(1, count + 1):
+        # Truncating the running total keeps every step within the limit and ends exactly on (dx, dy)
+        total_x = int(dx * step / count)
+        total_y = int(dy * step / count)
+        steps.append((total_x - sent_x, total_y - sent_y))
+        sent_x, sent_y = total_x, total_y
+    return steps
+
+
+def encode_mouse_deltas(steps, protocol=PROTOCOL_ASCII):
+    # All steps of one move go out in a single write
+    if protocol == PROTOCOL_BINARY:
+        if len(steps) == 1:
+            return build_frame(FRAME_MOUSE_DELTA, struct.pack("<bb", *steps[0]))
+        frames = b""
+        for start in range(0, len(steps), MAX_DELTA_STEPS):
+            batch = steps[start:start + MAX_DELTA_STEPS]
+            payload = bytes((len(batch),)) + b"".join(struct.pack("<bb", dx, dy) for dx, dy in batch)
+            frames += build_frame(FRAME_MOUSE_DELTA_BATCH, payload)
+        return frames
+    return f"D,{','.join(f'{dx},{dy}' for dx, dy in steps)}\n".encode()
+
+
+def encode_click(code, protocol=PROTOCOL_ASCII):
+    # code: 1 left down, 2 left up, 3 right down, 4 right up, 5 middle down, 6 middle up
+    if protocol == PROTOCOL_BINARY:
+        return build_frame(FRAME_CLICK, bytes((code,)))
+    return f"C,{code}\n".encode()
+
+
+def encode_wheel(vertical, horizontal=0, protocol=PROTOCOL_ASCII):
+    # Steps as Mouse.move()'s wheel takes them, positive scrolls up and right
+    vertical = max(-MAX_DELTA, min(MAX_DELTA, int(vertical)))
+    horizontal = max(-MAX_DELTA, min(MAX_DELTA, int(horizontal)))
+    if protocol == PROTOCOL_BINARY:
+        return build_frame(FRAME_MOUSE_WHEEL, struct.pack("<bb", vertical, horizontal))
+    return f"W,{vertical},{horizontal}\n".encode()
+
+
+def encode_route(node, protocol=PROTOCOL_ASCII):
+    # tx.ino keeps the node until the next route, frames before the first go to RX_NODE
+    if protocol == PROTOCOL_BINARY:
+        return build_frame(FRAME_ROUTE, struct.pack("<H", node))
+    return f"R,{node}\n".encode()
+
+
+def encode_key(key, pressed=True, protocol=PROTOCOL_ASCII):
+    if protocol == PROTOCOL_BINARY:
+        return build_frame(FRAME_KEY, bytes((key.encode()[0], int(pressed))))
+    return f"{'K' if pressed else 'U'},{key}\n".encode()
+
+
+def encode_special_key(name, pressed=True, protocol=PROTOCOL_ASCII):
+    if protocol == PROTOCOL_BINARY:
+        return build_frame(FRAME_SPECIAL_KEY, bytes((int(pressed),)) + _name_bytes(name))
+    return f"{'S' if pressed else 'T'},{name}\n".encode()
+
+
+def encode_keycode(code, pressed=True):
+    # Binary only, the ASCII protocol sends key names with encode_special_key
+    return build_frame(FRAME_KEYCODE, bytes((code, int(pressed))))
+
+
+def encode_key_state(code, down):
+    # Binary only, rx.ino holds the key in its report until the matching up
+    return build_frame(FRAME_KEY_STATE, bytes((code, int(down))))
+
+
+def encode_state_snapshot(modifiers, buttons, codes):
+    # Binary only, rx.ino presses and releases whatever it takes to hold exactly these
+    return build_frame(FRAME_STATE_SNAPSHOT, bytes((modifiers, buttons, len(codes))) + bytes(codes))
+
+
+def encode_keycode_combo(codes):
+    return build_frame(FRAME_KEYCODE_COMBO, bytes((len(codes),)) + bytes(codes))
+
+
+def encode_chord(modifiers, codes):
+    # Binary only, modifiers is the HID modifier byte (see hid_controller.chord)
+    return build_frame(FRAME_CHORD, bytes((modifiers, len(codes))) + bytes(codes))
+
+
+def encode_combo(keys, protocol=PROTOCOL_ASCII):
+    if protocol == PROTOCOL_BINARY:
+        return build_frame(FRAME_COMBO, _name_bytes(",".join(keys)))
+    return f"X,{','.join(keys)}\n".encode()
+
+
+def chunk_text(text, size=TEXT_CHUNK_SIZE):
+    """Split text into ASCII chunks for FRAME_TEXT, characters Keyboard.write() can't type are dropped."""
+    data = text.replace("\r\n", "\n").encode("ascii", "ignore")
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def encode_text(stream, index, chunk):
+    # Binary only, the ASCII protocol types strings one key at a time
+    return build_frame(FRAME_TEXT, bytes((stream & 0xFF, index & 0xFF, len(chunk))) + chunk)
+
+
+class FrameParser:
+    """Picks the frames tx.ino sends back out of the serial stream.
+
+    Anything outside a frame (tx.ino's log lines) is collected into text lines.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._line = bytearray()
+
+    def feed(self, data):
+        """Returns the (frames, lines) completed by data, frames as (type, seq, payload) tuples."""
+        frames = []
+        lines = []
+        buffer = self._buffer
+        buffer += data
+        while buffer:
+            if buffer[0] != FRAME_SYNC:
+                byte = buffer.pop(0)
+                if byte == 0x0A:
+                    lines.append(self._line.decode(errors="replace").strip())
+                    self._line.clear()
+                elif byte != 0x0D:
+                    self._line.append(byte)
+                continue
+            if len(buffer) < 2:
+                break
+            size = _HOST_FRAME_SIZES.get(buffer[1])
+            if size is None:
+                del buffer[0]  # not a frame we know, resync on the next sync byte
+                continue
+            if len(buffer) < size + 4:
+                break
+            body = bytes(buffer[1:size + 3])
+            if crc8(body) == buffer[size + 3]:
+                frames.append((body[0], body[1], body[2:]))
+                del buffer[:size + 4]
+            else:
+                del buffer[0]
+        return frames, lines
+
+
+# Every common event has to fit in one radio frame, anything larger gets fragmented by RF24Network
+assert fits_single_frame(pack_payload(PAYLOAD_MOUSE_DELTA, MAX_DELTA_STEPS, message=bytes(2 * MAX_DELTA_STEPS)))
+assert fits_single_frame(pack_payload(PAYLOAD_CLICK, 2, pressed=True))
+assert fits_single_frame(pack_payload(PAYLOAD_KEY, ord("a"), pressed=True))
+assert fits_single_frame(pack_payload(PAYLOAD_SPECIAL_KEY, pressed=True, message=b"KEY_PRINT_SCREEN"))
+assert fits_single_frame(pack_payload(PAYLOAD_KEYCODE_COMBO, message=bytes(6)))
+assert fits_single_frame(pack_payload(PAYLOAD_TEXT, message=bytes(TEXT_CHUNK_SIZE)))
+assert fits_single_frame(pack_payload(PAYLOAD_STATE_SNAPSHOT, message=bytes(1 + 6)))
@@ -0,0 +1,116 @@
+# pyserial URL handler for the tx.ino/rx.ino simulator
+#
+#   serial.protocol_handler_packages.append("hid_controller")
+#   ser = serial.serial_for_url("sim://?radio_loss=0.01", 1000000, timeout=1)
+#
+# Options: radio_loss, radio_frame_time, hid_report_time, realtime (0/1), seed, and nodes,
+# the octal rx.ino addresses to simulate (nodes=00,011,021,031 for four targets).
+# The DeviceSimulator behind the port is available as ser.simulator.
+
+import time
+import urllib.parse
+
+from serial.serialutil import PortNotOpenError, SerialBase, SerialException, to_bytes
+
+from hid_controller.simulator import DeviceSimulator
+
+_OPTIONS = {
+    "radio_loss": float,
+    "radio_frame_time": float,
+    "hid_report_time": float,
+    "realtime": lambda value: value not in ("0", "false", "no"),
+    "seed": int,
+    "nodes": lambda value: tuple(int(node, 8) for node in value.split(",")),
+}
+
+
+class Serial(SerialBase):
+    """Serial port backed by a DeviceSimulator instead of a board."""
+
+    def __init__(self, *args, **kwargs):
+        self.simulator = None
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        self.simulator = DeviceSimulator(baud_rate=self._baudrate, **self._parse_url(self.port))
+        self.is_open = True
+
+    def _parse_url(self, url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme != "sim":
+            raise SerialException(f'expected a string in the form "sim://[?option=value...]": not starting with sim:// ({parts.scheme!r})')
+        options = {}
+        for option, values in urllib.parse.parse_qs(parts.query, True).items():
+            if option not in _OPTIONS:
+                raise SerialException(f"unknown sim:// option: {option!r}")
+            try:
+                options[option] = _OPTIONS[option](values[0])
+            except ValueError as e:
+                raise SerialException(f"bad value for sim:// option {option!r}: {e}")
+        return options
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.simulator.close()
+        super().close()
+
+    def _reconfigure_port(self):
+        # The modelled link speed follows the baud rate the port was opened with
+        if self.simulator is not None:
+            self.simulator.baud_rate = self._baudrate
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.simulator.in_waiting()
+
+    @property
+    def out_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.simulator.out_waiting()
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        data = bytearray()
+        deadline = None if self._timeout is None else time.perf_counter() + self._timeout
+        while len(data) < size:
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            chunk = self.simulator.read(size - len(data), remaining)
+            if not chunk:
+                break
+            data += chunk
+            if not self.is_open:
+                break
+        return bytes(data)
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.simulator.write(to_bytes(data))
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        while self.simulator.in_waiting():
+            self.simulator.read(4096, 0)
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    def _update_break_state(self):
+        pass
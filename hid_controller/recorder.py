@@ -0,0 +1,262 @@
+# Record and replay of hook events and the serial frames sent for them
+#
+# Log layout:
+#
+#   [MAGIC][float64 start time.time()] then records [kind][zigzag varint delta us][body]
+#
+#   RECORD_MOUSE_MOVE    zigzag varint x, zigzag varint y
+#   RECORD_MOUSE_BUTTON  uint8 event type, uint8 button (index into MOUSE_EVENT_TYPES / MOUSE_BUTTONS)
+#   RECORD_MOUSE_WHEEL   zigzag varint delta * 120
+#   RECORD_KEY           uint8 event type (index into KEY_EVENT_TYPES), varint length, UTF-8 key name
+#   RECORD_FRAME         varint length, bytes written to the serial port
+#
+# The delta is to the previous record, hook events are stamped with their own event.time so
+# it can go slightly negative. A 1000 Hz mouse costs about 7 bytes per move.
+#
+# The file grows in chunks that are memory mapped, appending is a copy into the map and
+# survives a crash of the app. Unused space is zero, which the reader takes as the end.
+#
+#   python -m hid_controller.recorder dump input.hidlog
+#   python -m hid_controller.recorder replay input.hidlog --port sim:// --speed 2
+
+import mmap
+import struct
+import threading
+import time
+
+MAGIC = b"HIDLOG\x01\x00"
+HEADER = struct.Struct("<8sd")
+CHUNK_SIZE = 1 << 20
+
+RECORD_MOUSE_MOVE = 1
+RECORD_MOUSE_BUTTON = 2
+RECORD_MOUSE_WHEEL = 3
+RECORD_KEY = 4
+RECORD_FRAME = 5
+
+# mouse and keyboard library event field values, stored as their index
+MOUSE_EVENT_TYPES = ("down", "up", "double")
+MOUSE_BUTTONS = ("left", "right", "middle", "x", "x2")
+KEY_EVENT_TYPES = ("down", "up")
+
+
+def encode_varint(value, out):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_zigzag(value, out):
+    encode_varint(value << 1 if value >= 0 else (-value << 1) - 1, out)
+
+
+def decode_varint(data, offset):
+    """Returns (value, offset after it), raises IndexError if data ends inside it."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def decode_zigzag(data, offset):
+    value, offset = decode_varint(data, offset)
+    return (value >> 1) ^ -(value & 1), offset
+
+
+class InputRecorder:
+    """Appends hook events and serial frames to a log file.
+
+    mouse_event() and key_event() are called from the hook callbacks, frame() by the
+    SerialWriter after each write.
+    """
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.records = 0
+        self.start = time.time()
+        self._last = self.start
+        self._file = open(path, "w+b")
+        self._file.write(HEADER.pack(MAGIC, self.start))
+        self._length = HEADER.size
+        self._file.truncate(chunk_size)
+        self._map = mmap.mmap(self._file.fileno(), chunk_size)
+        self._lock = threading.Lock()
+
+    def mouse_event(self, event):
+        body = bytearray()
+        if hasattr(event, "button"):
+            if event.event_type not in MOUSE_EVENT_TYPES or event.button not in MOUSE_BUTTONS:
+                return
+            body += bytes((MOUSE_EVENT_TYPES.index(event.event_type), MOUSE_BUTTONS.index(event.button)))
+            self._append(RECORD_MOUSE_BUTTON, event.time, body)
+        elif hasattr(event, "delta"):
+            encode_zigzag(round(event.delta * 120), body)
+            self._append(RECORD_MOUSE_WHEEL, event.time, body)
+        else:
+            encode_zigzag(event.x, body)
+            encode_zigzag(event.y, body)
+            self._append(RECORD_MOUSE_MOVE, event.time, body)
+
+    def key_event(self, event):
+        if event.event_type not in KEY_EVENT_TYPES or not event.name:
+            return
+        name = event.name.encode("utf-8")
+        body = bytearray((KEY_EVENT_TYPES.index(event.event_type),))
+        encode_varint(len(name), body)
+        body += name
+        self._append(RECORD_KEY, event.time, body)
+
+    def frame(self, data):
+        body = bytearray()
+        encode_varint(len(data), body)
+        body += data
+        self._append(RECORD_FRAME, time.time(), body)
+
+    def _append(self, kind, event_time, body):
+        with self._lock:
+            if self._map is None:
+                return
+            record = bytearray((kind,))
+            encode_zigzag(round((event_time - self._last) * 1e6), record)
+            record += body
+            self._last = event_time
+            end = self._length + len(record)
+            if end > len(self._map):
+                self._grow(end)
+            self._map[self._length:end] = record
+            self._length = end
+            self.records += 1
+
+    def _grow(self, needed):
+        # Called with the lock held
+        size = len(self._map)
+        while size < needed:
+            size += self.chunk_size
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def close(self):
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            self._file.truncate(self._length)
+            self._file.close()
+
+
+def read_log(path):
+    """Yield (kind, seconds since the log started, value) for every record in a log.
+
+    value is (x, y) for moves, (event type, button) for buttons, the wheel delta, (event type,
+    key name) for keys and the written bytes for frames.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an input log")
+    offset = HEADER.size
+    t = 0.0
+    while offset < len(data) and data[offset] != 0:
+        kind = data[offset]
+        try:
+            delta, position = decode_zigzag(data, offset + 1)
+            if kind == RECORD_MOUSE_MOVE:
+                x, position = decode_zigzag(data, position)
+                y, position = decode_zigzag(data, position)
+                value = (x, y)
+            elif kind == RECORD_MOUSE_BUTTON:
+                value = (MOUSE_EVENT_TYPES[data[position]], MOUSE_BUTTONS[data[position + 1]])
+                position += 2
+            elif kind == RECORD_MOUSE_WHEEL:
+                delta_120, position = decode_zigzag(data, position)
+                value = delta_120 / 120
+            elif kind == RECORD_KEY:
+                event_type = KEY_EVENT_TYPES[data[position]]
+                length, position = decode_varint(data, position + 1)
+                value = (event_type, data[position:position + length].decode("utf-8"))
+                position += length
+            elif kind == RECORD_FRAME:
+                length, position = decode_varint(data, position)
+                value = data[position:position + length]
+                position += length
+            else:
+                raise ValueError(f"unknown record kind {kind} at offset {offset}")
+        except IndexError:
+            return  # the app stopped in the middle of a record
+        if position > len(data):
+            return
+        t += delta / 1e6
+        offset = position
+        yield kind, t, value
+
+
+def replay_frames(path, write, speed=1.0):
+    """Write the logged frames again without running any hooks.
+
+    speed 1 keeps the recorded timing, 2 is twice as fast, 0 as fast as possible. Returns
+    the frame count, bytes and the timing run_schedule achieved.
+    """
+    from hid_controller.sequence import run_schedule
+
+    frames = [(t, data) for kind, t, data in read_log(path) if kind == RECORD_FRAME]
+    if not frames:
+        return {"frames": 0, "bytes": 0}
+    first = frames[0][0]
+    schedule = [((t - first) / speed if speed > 0 else 0.0, lambda data=data: write(data)) for t, data in frames]
+    result = run_schedule(schedule)
+    result.update(frames=len(frames), bytes=sum(len(data) for t, data in frames))
+    return result
+
+
+def main():
+    import argparse
+    import collections
+
+    import serial
+
+    parser = argparse.ArgumentParser(description="Inspect or replay an input log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dump = commands.add_parser("dump", help="print the records")
+    dump.add_argument("log")
+    dump.add_argument("--summary", action="store_true", help="only count the records")
+    replay = commands.add_parser("replay", help="write the logged serial frames to a port")
+    replay.add_argument("log")
+    replay.add_argument("--port", required=True, help='serial port, or "sim://" for the simulator')
+    replay.add_argument("--baud", type=int, default=1000000)
+    replay.add_argument("--speed", type=float, default=1.0, help="1 keeps the recorded timing, 0 is as fast as possible")
+    args = parser.parse_args()
+
+    if args.command == "dump":
+        names = {RECORD_MOUSE_MOVE: "move", RECORD_MOUSE_BUTTON: "button", RECORD_MOUSE_WHEEL: "wheel", RECORD_KEY: "key", RECORD_FRAME: "frame"}
+        counts = collections.Counter()
+        for kind, t, value in read_log(args.log):
+            counts[names[kind]] += 1
+            if not args.summary:
+                print(f"{t:12.6f} {names[kind]:6} {value.hex(' ') if kind == RECORD_FRAME else value}")
+        print(dict(counts))
+        return
+
+    serial.protocol_handler_packages.append("hid_controller")
+    ser = serial.serial_for_url(args.port, args.baud, timeout=1, write_timeout=2)
+    try:
+        result = replay_frames(args.log, ser.write, args.speed)
+        ser.flush()
+        while ser.out_waiting:
+            time.sleep(0.001)
+    finally:
+        ser.close()
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
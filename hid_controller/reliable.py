@@ -0,0 +1,219 @@
+# Acked key and button changes, sent again until rx.ino has applied them
+#
+# Key downs and ups (FRAME_KEY_STATE) and clicks (FRAME_CLICK) go out with FRAME_ACK_FLAG and
+# a seq of their own. rx.ino acks every one once applied, tx.ino reports a failed radio write
+# straight away. Each key or button has at most one change on its way: a down sent again
+# after its up would leave the key stuck, and a down dropped for its up would lose the
+# keystroke. Changes wait for that in one queue, so the changes of one key or button reach
+# rx.ino in the order they were made. Changes of different keys can overtake one that has to
+# be sent again, except around modifiers: a modifier change waits until every change before
+# it is acked and the changes after it wait for its ack, so a Ctrl or Shift down or up never
+# overtakes, and is never overtaken by, the keys and clicks around it. Every rx.ino also gets a
+# FRAME_STATE_SNAPSHOT of what it should hold now and then, which fixes whatever ran out of
+# retries. Motion and the wheel stay best effort.
+
+import collections
+import threading
+import time
+
+from hid_controller import protocol
+
+MODIFIER_CODES = range(0x80, 0x88)  # KEY_LEFT_CTRL to KEY_RIGHT_GUI, the modifier byte's bits
+MAX_SNAPSHOT_KEYS = 6  # rx.ino's 6KRO report
+
+
+def is_modifier(slot):
+    return slot[0] == "key" and slot[1] in MODIFIER_CODES
+
+
+class ReliableSender:
+    """Sends key state changes and clicks with acks, retransmits and periodic state snapshots.
+
+    At most window changes wait for their ack, the others are queued in the order they were
+    made, a modifier change (MODIFIER_CODES) only goes out alone. A change that doesn't get an ack within timeout seconds is sent again, up to
+    max_retries times. snapshot_interval is how often every
+    rx.ino that got a change is sent everything it should hold. Frames the writer refuses
+    because its queue is full are sent again on the timeout without using up a retry.
+    """
+
+    def __init__(self, sink, window=32, timeout=0.25, max_retries=5, snapshot_interval=1.0):
+        if not 0 < window < 256:
+            raise ValueError("window must be 1 to 255, the seqs in flight have to be unique in 8 bits")
+        self.sink = sink  # a SerialWriter, or anything with its send() and routed()
+        self.window = window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.snapshot_interval = snapshot_interval
+        self.acked = 0
+        self.retransmits = 0
+        self.lost = 0  # changes given up on after max_retries, left to the next snapshot
+        self.snapshots = 0
+        self.refused = 0  # frames the writer's full queue refused
+        self._pending = collections.OrderedDict()  # seq -> [node, slot, frame, event_type, sent at, retries, down], oldest first
+        self._in_flight = {}  # (node, slot) -> seq of the change waiting for its ack
+        self._modifiers_in_flight = 0  # of them, a modifier change holds back everything after it
+        self._queue = collections.deque()  # ((node, slot), down, frame, event_type, event_time) not sent yet, oldest first
+        self._queued = collections.Counter()  # (node, slot) -> its changes in _queue
+        self._last_down = {}  # (node, slot) -> state its newest change in flight or queued leaves it in
+        self._held = collections.defaultdict(set)  # node -> slots its sent changes hold down, ("key", code) or ("button", number)
+        self._seq = 0
+        self._next_snapshot = 0.0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._next_snapshot = time.perf_counter() + self.snapshot_interval
+        self._thread = threading.Thread(target=self._run, name="reliable-sender")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+
+    def send_key(self, node, code, down, event_time=None):
+        """Hold (down) or let go of a Keyboard.h key code on node's rx.ino."""
+        self._send(node, ("key", code), down, protocol.encode_key_state(code, down), "key", event_time)
+
+    def send_click(self, node, code, event_time=None):
+        """A "C,n" click code on node's rx.ino, odd codes press the button (code + 1) // 2."""
+        frame = protocol.encode_click(code, protocol.PROTOCOL_BINARY)
+        self._send(node, ("button", (code + 1) // 2), code % 2 == 1, frame, "click", event_time)
+
+    def _send(self, node, slot, down, frame, event_type, event_time):
+        with self._condition:
+            key = (node, slot)
+            if (key in self._in_flight or self._queued[key]) and self._last_down[key] == down:
+                return  # a repeat of the state the changes on the way leave it in
+            self._last_down[key] = down
+            self._queue.append((key, down, frame, event_type, event_time))
+            self._queued[key] += 1
+            self._send_queued()
+            self._condition.notify()
+
+    def _send_queued(self):
+        # Called with the condition held. Sends from the front of the queue until the window is
+        # full, the next change's key or button still has one on its way, or a modifier change
+        # is on its way or next with other changes still on theirs.
+        while self._queue and len(self._pending) < self.window and not self._modifiers_in_flight:
+            key = self._queue[0][0]
+            if key in self._in_flight or (self._pending and is_modifier(key[1])):
+                break
+            self._transmit(*self._queue.popleft())
+            self._queued[key] -= 1
+            if not self._queued[key]:
+                del self._queued[key]
+
+    def _transmit(self, key, down, frame, event_type, event_time=None):
+        # Called with the condition held
+        node, slot = key
+        seq = self._seq
+        self._seq = (self._seq + 1) & 0xFF  # never one in _pending, there are fewer than 256 of them
+        data = protocol.request_ack(frame, seq)
+        self._pending[seq] = [node, slot, data, event_type, time.perf_counter(), 0, down]
+        self._in_flight[key] = seq
+        if is_modifier(slot):
+            self._modifiers_in_flight += 1
+        # Snapshots only hold what has been sent, never a change still waiting for its turn
+        if down:
+            self._held[node].add(slot)
+        else:
+            self._held[node].discard(slot)
+        # Sent with the lock held, so changes and snapshots reach the writer in the order they were made
+        self._write(node, data, event_type, event_time)
+
+    def _write(self, node, data, event_type=None, event_time=None):
+        with self.sink.routed(node):
+            sent = self.sink.send(data, event_type, event_time)
+        if sent is False:
+            self.refused += 1
+        return sent is not False
+
+    def _settle(self, seq):
+        # Called with the condition held once seq is acked or given up on, lets the queue move on
+        node, slot = self._pending.pop(seq)[:2]
+        del self._in_flight[(node, slot)]
+        if is_modifier(slot):
+            self._modifiers_in_flight -= 1
+        self._send_queued()
+
+    def acknowledge(self, seq, payload):
+        # SerialReader handler for FRAME_EVENT_ACK
+        acked_seq, status = payload[0], payload[1]
+        with self._condition:
+            entry = self._pending.get(acked_seq)
+            if entry is None:
+                return  # a duplicate, or a change that was replaced since
+            if status == protocol.EVENT_APPLIED:
+                self.acked += 1
+                self._settle(acked_seq)
+            else:
+                self._retransmit(acked_seq, entry)
+            self._condition.notify()
+
+    def _retransmit(self, seq, entry):
+        # Called with the condition held
+        node, slot, data, event_type, sent_at, retries, down = entry
+        if retries >= self.max_retries:
+            self.lost += 1
+            print(f"Giving up on {slot[0]} {slot[1]} for node {node:02o} after {retries} retries, the next snapshot sets it")
+            self._settle(seq)
+            return
+        entry[4] = time.perf_counter()
+        if self._write(node, data, event_type):
+            entry[5] = retries + 1
+            self.retransmits += 1
+
+    def send_snapshots(self):
+        """Send every rx.ino that got a change everything it should hold right now."""
+        with self._condition:
+            for node, held in self._held.items():
+                modifiers = buttons = 0
+                codes = []
+                for kind, value in held:
+                    if kind == "button":
+                        buttons |= 1 << (value - 1)
+                    elif value in MODIFIER_CODES:
+                        modifiers |= 1 << (value - MODIFIER_CODES.start)
+                    elif len(codes) < MAX_SNAPSHOT_KEYS:
+                        codes.append(value)
+                if self._write(node, protocol.encode_state_snapshot(modifiers, buttons, codes)):
+                    self.snapshots += 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                now = time.perf_counter()
+                for seq, entry in list(self._pending.items()):
+                    # A retransmit giving up can send queued changes, and a quick ack settle them
+                    if now - entry[4] >= self.timeout and self._pending.get(seq) is entry:
+                        self._retransmit(seq, entry)
+                deadline = self._next_snapshot
+                if self._pending:
+                    deadline = min(deadline, min(entry[4] for entry in self._pending.values()) + self.timeout)
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+            if now >= self._next_snapshot:
+                self._next_snapshot = now + self.snapshot_interval
+                self.send_snapshots()
+
+    def snapshot(self):
+        """Delivery counters, served by /stats."""
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "waiting": len(self._queue),
+                "acked": self.acked,
+                "retransmits": self.retransmits,
+                "lost": self.lost,
+                "snapshots": self.snapshots,
+                "refused": self.refused,
+            }
@@ -0,0 +1,112 @@
+# Asynchronous execution of HTTP API actions
+#
+# Flask routes only enqueue and hand back a ticket. One worker thread runs the actions, so
+# they never race each other or the keyboard/mouse hooks' own state.
+
+import collections
+import itertools
+import threading
+import time
+
+
+class RequestPipeline:
+    """Runs submitted actions on a single worker thread.
+
+    Actions of one client run in the order they were submitted, clients take turns so a
+    long /multikeypress from one of them doesn't starve the others for more than one action.
+    Results are kept for the last keep_results tickets.
+    """
+
+    def __init__(self, max_pending=1024, keep_results=1024):
+        self.max_pending = max_pending
+        self.keep_results = keep_results
+        self.rejected = 0  # actions refused because max_pending were already waiting
+        self._clients = collections.OrderedDict()  # client -> deque of tickets, in turn order
+        self._tickets = collections.OrderedDict()  # ticket id -> ticket, oldest first
+        self._pending = 0
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-pipeline")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, client, action):
+        """Queue action() for client, returns the ticket id or None if the pipeline is full."""
+        with self._condition:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return None
+            ticket = {
+                "ticket": next(self._ids),
+                "client": client,
+                "state": "queued",
+                "result": None,
+                "error": None,
+                "queued_at": time.time(),
+                "done": threading.Event(),
+                "action": action,
+            }
+            self._tickets[ticket["ticket"]] = ticket
+            self._clients.setdefault(client, collections.deque()).append(ticket)
+            self._pending += 1
+            self._forget_old_tickets()
+            self._condition.notify()
+            return ticket["ticket"]
+
+    def wait(self, ticket_id, timeout=None):
+        """Block until the ticket has run, returns its status or None if it is unknown."""
+        with self._condition:
+            ticket = self._tickets.get(ticket_id)
+        if ticket is None:
+            return None
+        ticket["done"].wait(timeout)
+        return self.status(ticket_id)
+
+    def status(self, ticket_id):
+        with self._condition:
+            ticket = self._tickets.get(ticket_id)
+            if ticket is None:
+                return None
+            return {key: ticket[key] for key in ("ticket", "client", "state", "result", "error")}
+
+    def pending(self):
+        with self._condition:
+            return self._pending
+
+    def _forget_old_tickets(self):
+        # Called with the condition held, only finished tickets are dropped
+        while len(self._tickets) > self.keep_results:
+            oldest = next(iter(self._tickets.values()))
+            if not oldest["done"].is_set():
+                break
+            self._tickets.popitem(last=False)
+
+    def _next_ticket(self):
+        with self._condition:
+            while not self._clients:
+                self._condition.wait()
+            client, queue = self._clients.popitem(last=False)
+            ticket = queue.popleft()
+            if queue:
+                self._clients[client] = queue  # back of the line
+            ticket["state"] = "running"
+            return ticket
+
+    def _run(self):
+        while True:
+            ticket = self._next_ticket()
+            try:
+                result = ticket["action"]()
+                state, error = "done", None
+            except Exception as e:
+                result, state, error = None, "error", str(e)
+            with self._condition:
+                ticket["result"] = result
+                ticket["error"] = error
+                ticket["state"] = state
+                ticket["action"] = None
+                self._pending -= 1
+            ticket["done"].set()
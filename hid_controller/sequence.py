@@ -0,0 +1,78 @@
+# Scripted key/click/move/delay sequences for the /sequence endpoint
+#
+# The whole script is validated up front and then run on the host against the monotonic
+# clock, so a step costs a function call instead of an HTTP round trip.
+
+import math
+import time
+
+SPIN_TIME = 0.002  # seconds before a deadline where sleep() hands over to a busy wait
+# A sequence runs on the RequestPipeline's one worker thread and holds up every other
+# client's requests until it is done, so it may last at most this many seconds
+MAX_SEQUENCE_TIME = 2.0
+
+
+def compile_sequence(steps, builders, max_time=MAX_SEQUENCE_TIME):
+    """Turn API steps into a list of (offset seconds, action) pairs.
+
+    builders maps a step type to a callable taking the step dict and returning the action,
+    "delay" steps ({"type": "delay", "ms": 20}) only move the offset of the following steps.
+    Delays at the end leave an (offset, None) pair, run_schedule waits for it like for a step.
+    Raises ValueError for a malformed step or a sequence longer than max_time seconds,
+    before anything has been sent.
+    """
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("steps must be a non empty list")
+    schedule = []
+    offset = 0.0
+    for number, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise ValueError(f"Step {number}: expected an object")
+        step_type = step.get("type")
+        try:
+            if step_type == "delay":
+                delay = float(step.get("ms", 0)) / 1000
+                if not math.isfinite(delay) or delay < 0:
+                    raise ValueError("ms must be a finite number, not negative")
+                offset += delay
+                if offset > max_time:
+                    raise ValueError(f"the sequence would last longer than {max_time * 1000:.0f} ms")
+                continue
+            builder = builders.get(step_type)
+            if builder is None:
+                raise ValueError(f"unknown type {step_type!r}")
+            schedule.append((offset, builder(step)))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Step {number}: {e}") from None
+    if offset > (schedule[-1][0] if schedule else 0.0):
+        schedule.append((offset, None))
+    return schedule
+
+
+def run_schedule(schedule, clock=time.perf_counter, spin_time=SPIN_TIME):
+    """Run every action at its offset from now, returns the timing it achieved."""
+    start = clock()
+    lateness = []
+    for offset, action in schedule:
+        deadline = start + offset
+        remaining = deadline - clock()
+        if remaining > spin_time:
+            time.sleep(remaining - spin_time)
+        while clock() < deadline:
+            pass
+        if action is None:
+            continue  # the delays at the end
+        lateness.append(clock() - deadline)
+        action()
+    duration = clock() - start
+
+    lateness.sort()
+    return {
+        "steps": len(lateness),
+        "duration_ms": round(duration * 1000, 3),
+        "jitter_us": {
+            "mean": round(sum(lateness) / len(lateness) * 1e6, 1) if lateness else None,
+            "p99": round(lateness[min(len(lateness) - 1, int(len(lateness) * 0.99))] * 1e6, 1) if lateness else None,
+            "max": round(lateness[-1] * 1e6, 1) if lateness else None,
+        },
+    }
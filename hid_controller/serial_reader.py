@@ -0,0 +1,59 @@
+# Reader thread for the frames tx.ino sends back to the host
+#
+# The writer thread owns ser.write, this thread is the only one calling ser.read.
+
+import threading
+
+from hid_controller.protocol import FrameParser
+
+
+class SerialReader:
+    """Feeds everything tx.ino writes into a FrameParser and dispatches the result.
+
+    handlers maps a frame type to a callable taking (seq, payload). on_line, when given,
+    receives tx.ino's log lines.
+    """
+
+    def __init__(self, ser, handlers, on_line=None):
+        self.ser = ser
+        self.handlers = handlers
+        self.on_line = on_line
+        self.read_errors = 0
+        self._parser = FrameParser()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="serial-reader")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # ser.read returns within the port timeout, no need to wake the thread up
+        self._running = False
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while self._running:
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except Exception as e:
+                self.read_errors += 1
+                print(f"Error while reading from serial: {e}")
+                if getattr(self.ser, "supervised", False):
+                    self._parser = FrameParser()  # drop the half frame from the old port
+                    continue  # reads wait for the SupervisedSerial to reconnect
+                return
+            if not data:
+                continue
+            frames, lines = self._parser.feed(data)
+            for frame_type, seq, payload in frames:
+                handler = self.handlers.get(frame_type)
+                if handler:
+                    handler(seq, payload)
+            if self.on_line:
+                for line in lines:
+                    if line:
+                        self.on_line(line)
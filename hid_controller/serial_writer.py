@@ -0,0 +1,289 @@
+# Single writer thread that owns the serial port
+#
+# Hook callbacks and Flask routes only enqueue, so a stalled USB-CDC write can no longer
+# freeze the input hooks and no two threads ever call ser.write at the same time.
+
+import collections
+import contextlib
+import math
+import threading
+import time
+
+
+class SerialWriter:
+    """Drains bounded per-receiver queues of key/click frames and merged mouse motion into one serial port.
+
+    Key and click frames are sent first, in order for each receiver. With more than one
+    receiver the queues take turns frame by frame, so a target busy typing text can't hold
+    up the keys of another. Motion is never queued: deltas that arrive while the link is busy
+    are summed and sent as a single frame once per motion_interval. Wheel steps are summed
+    the same way, motion and wheel take turns for the slots.
+
+    Frames go to node, or to the node given to routed() on the sending thread. With
+    encode_route set the writer puts a route frame in front of the first frame for a different
+    node than the one before. With a LatencyTracker as tracer, frames sent with an event type
+    are timed, with an InputRecorder as recorder every written frame is logged.
+
+    On a SupervisedSerial a failed write waits for the port to come back: the key/click
+    frame is written again on the new port, motion and scrolling from before are dropped.
+    """
+
+    def __init__(self, ser, encode_motion, max_queue=256, motion_interval=0.0, tracer=None, recorder=None, encode_wheel=None, encode_route=None):
+        self.ser = ser
+        self.encode_motion = encode_motion  # (dx, dy) -> bytes
+        self.encode_wheel = encode_wheel  # (vertical, horizontal) whole steps -> bytes
+        self.encode_route = encode_route  # node -> bytes, None for a single receiver
+        self.max_queue = max_queue  # per receiver
+        self.motion_interval = motion_interval
+        self.tracer = tracer
+        self.recorder = recorder
+        self.node = None  # receiver of frames sent outside routed(), e.g. the active target
+        self.dropped = 0  # control frames refused because the queue was full
+        self.merged_motion = 0  # motion updates folded into a pending one
+        self.merged_wheel = 0  # wheel updates folded into a pending one
+        self.write_errors = 0
+        self.replayed = 0  # key/click frames written again after a reconnect
+        self._queues = {}  # node -> deque of control frames
+        self._ready = collections.deque()  # nodes with queued frames, in the order they are served
+        self._enqueued = collections.Counter()  # node -> frames queued so far
+        self._written = collections.Counter()  # node -> frames written (or failed) so far
+        self._barriers = []  # ({node: frames to wait for}, Event)
+        self._route = None  # node the last route frame selected
+        self._generation = 0  # of the SupervisedSerial port _route was selected on
+        self._local = threading.local()
+        self._motion_dx = 0
+        self._motion_dy = 0
+        self._motion_pending = False
+        self._motion_node = None
+        self._motion_hook_delay = None  # of the oldest move in the pending motion
+        self._motion_enqueued = 0.0
+        self._wheel = [0.0, 0.0]  # vertical, horizontal; fractions of a step stay for the next one
+        self._wheel_pending = False
+        self._wheel_node = None
+        self._wheel_hook_delay = None
+        self._wheel_enqueued = 0.0
+        self._next_motion = 0.0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.first_write = None  # perf_counter() of the first frame written, see hid_controller/startup.py
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="serial-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+
+    @contextlib.contextmanager
+    def routed(self, node):
+        """Frames, motion and scrolling sent by this thread inside the block go to node."""
+        previous = getattr(self._local, "node", None)
+        self._local.node = node
+        try:
+            yield
+        finally:
+            self._local.node = previous
+
+    def _target_node(self):
+        node = getattr(self._local, "node", None)
+        return self.node if node is None else node
+
+    def send(self, data, event_type=None, event_time=None):
+        """Queue a key/click frame, returns False if the receiver's queue is full.
+
+        event_type ("key", "click", ...) groups the frame's latency stats, event_time is the
+        hook event's time.time() stamp.
+        """
+        hook_delay = time.time() - event_time if event_time is not None else None
+        node = self._target_node()
+        with self._condition:
+            queue = self._queues.get(node)
+            if queue is None:
+                queue = self._queues[node] = collections.deque()
+            if len(queue) >= self.max_queue:
+                self.dropped += 1
+                return False
+            if not queue:
+                self._ready.append(node)
+            queue.append((data, event_type, hook_delay, time.perf_counter(), node, True))
+            self._enqueued[node] += 1
+            self._condition.notify()
+        return True
+
+    def barrier(self):
+        """Returns an Event that is set once every frame queued so far has been written."""
+        written = threading.Event()
+        with self._condition:
+            waiting = {node: count for node, count in self._enqueued.items() if self._written[node] < count}
+            if waiting:
+                self._barriers.append((waiting, written))
+            else:
+                written.set()
+        return written
+
+    def send_motion(self, dx, dy, event_time=None):
+        node = self._target_node()
+        with self._condition:
+            if self._motion_pending and self._motion_node != node:
+                self._motion_dx = self._motion_dy = 0  # left over from the previous target
+                self._motion_pending = False
+            if self._motion_pending:
+                self.merged_motion += 1
+            else:
+                self._motion_hook_delay = time.time() - event_time if event_time is not None else None
+                self._motion_enqueued = time.perf_counter()
+                self._motion_node = node
+            self._motion_dx += dx
+            self._motion_dy += dy
+            self._motion_pending = True
+            self._condition.notify()
+
+    def send_wheel(self, vertical, horizontal=0.0, event_time=None):
+        """Add wheel steps (floats from smooth scrolling devices are fine) to the pending scroll."""
+        node = self._target_node()
+        with self._condition:
+            if self._wheel_node != node:
+                self._wheel = [0.0, 0.0]
+                self._wheel_pending = False
+                self._wheel_node = node
+            if self._wheel_pending:
+                self.merged_wheel += 1
+            else:
+                self._wheel_hook_delay = time.time() - event_time if event_time is not None else None
+                self._wheel_enqueued = time.perf_counter()
+            self._wheel[0] += vertical
+            self._wheel[1] += horizontal
+            self._wheel_pending = abs(self._wheel[0]) >= 1 or abs(self._wheel[1]) >= 1
+            if self._wheel_pending:
+                self._condition.notify()
+
+    def clear_motion(self):
+        """Forget motion and scrolling that has not been written yet, e.g. after switching back to the host."""
+        with self._condition:
+            self._motion_dx = self._motion_dy = 0
+            self._motion_pending = False
+            self._wheel = [0.0, 0.0]
+            self._wheel_pending = False
+
+    def queue_depth(self):
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def queue_depths(self):
+        """Queued frames by node."""
+        with self._condition:
+            return {node: len(queue) for node, queue in self._queues.items()}
+
+    def _next_frame(self):
+        # Called with the condition held, waits until there is something to write
+        while self._running:
+            if self._ready:
+                node = self._ready.popleft()
+                queue = self._queues[node]
+                frame = queue.popleft()
+                if queue:
+                    self._ready.append(node)  # back of the line, the other receivers go first
+                return frame
+            if self._motion_pending or self._wheel_pending:
+                wait = self._next_motion - time.perf_counter()
+                if wait <= 0:
+                    self._next_motion = time.perf_counter() + self.motion_interval
+                    # The older of the two goes first, so steady motion never starves the wheel
+                    if self._motion_pending and not (self._wheel_pending and self._wheel_enqueued < self._motion_enqueued):
+                        data = self.encode_motion(self._motion_dx, self._motion_dy)
+                        self._motion_dx = self._motion_dy = 0
+                        self._motion_pending = False
+                        return data, "mouse", self._motion_hook_delay, self._motion_enqueued, self._motion_node, False
+                    return self._take_wheel()
+                self._condition.wait(wait)
+            else:
+                self._condition.wait()
+        return None
+
+    def _take_wheel(self):
+        # Called with the condition held. Whole steps go out, at most 127 per frame, the rest
+        # stays pending.
+        steps = [max(-127, min(127, math.trunc(value))) for value in self._wheel]
+        self._wheel[0] -= steps[0]
+        self._wheel[1] -= steps[1]
+        enqueued = self._wheel_enqueued
+        self._wheel_pending = abs(self._wheel[0]) >= 1 or abs(self._wheel[1]) >= 1
+        if self._wheel_pending:
+            self._wheel_enqueued = time.perf_counter()
+        return self.encode_wheel(*steps), "wheel", self._wheel_hook_delay, enqueued, self._wheel_node, False
+
+    def _written_frame(self, node, queued):
+        # Called with the condition held once a frame has been written or failed
+        if not queued:
+            return
+        self._written[node] += 1
+        for barrier in list(self._barriers):
+            waiting, written = barrier
+            if all(self._written[node] >= count for node, count in waiting.items()):
+                written.set()
+                self._barriers.remove(barrier)
+
+    def _replay(self, frame):
+        # Put a frame whose write failed back at the front of its queue
+        node = frame[4]
+        with self._condition:
+            queue = self._queues[node]
+            if not queue:
+                self._ready.appendleft(node)
+            queue.appendleft(frame)
+            self.replayed += 1
+
+    def _wait_for_port(self):
+        # The SupervisedSerial is reconnecting, writes are pointless until it is back
+        while self._running and not self.ser.wait_connected(0.5):
+            pass
+        self.clear_motion()  # moved while the board was gone, too stale to replay
+
+    def _run(self):
+        supervised = getattr(self.ser, "supervised", False)
+        while True:
+            with self._condition:
+                frame = self._next_frame()
+            if frame is None:
+                return
+            data, event_type, hook_delay, enqueued, node, queued = frame
+            traced = self.tracer is not None and event_type is not None
+            if traced:
+                data = self.tracer.prepare(event_type, data)
+            if supervised and self.ser.generation != self._generation:
+                self._generation = self.ser.generation
+                self._route = None  # a reconnected tx.ino starts out on its default node
+            routed = self.encode_route is not None and node is not None and node != self._route
+            if routed:
+                data = self.encode_route(node) + data
+            try:
+                self.ser.write(data)
+            except Exception as e:
+                self.write_errors += 1
+                self._route = None  # tx.ino may or may not have got the route
+                print(f"Error while writing to serial: {e}")
+                if supervised:
+                    if queued:
+                        self._replay(frame)
+                    self._wait_for_port()
+                    continue
+                with self._condition:
+                    self._written_frame(node, queued)
+                continue
+            if routed:
+                self._route = node
+            if self.first_write is None:
+                self.first_write = time.perf_counter()
+            if self.recorder is not None:
+                self.recorder.frame(data)
+            if traced:
+                self.tracer.written(event_type, data, hook_delay, enqueued, time.perf_counter())
+            with self._condition:
+                self._written_frame(node, queued)
@@ -0,0 +1,669 @@
+# Software stand-in for tx.ino and rx.ino
+#
+# Mirrors the two sketches closely enough to benchmark the host side without any hardware:
+# tx.ino's ASCII/binary parser and payload_t building, RF24Network fragmenting, and rx.ino's
+# Mouse/Keyboard dispatch with its text, event and trace acks. Time is modelled with sleeps: every
+# byte takes 10 bit times on the serial link, every radio frame radio_frame_time and every
+# USB HID report on the target hid_report_time.
+#
+# Use it through pyserial as "sim://" (see protocol_sim.py) or on a pty:
+#
+#   python -m hid_controller.simulator
+
+import collections
+import random
+import struct
+import threading
+import time
+
+from hid_controller import protocol
+from hid_controller.keymap import ARDUINO_KEYCODES
+
+RADIO_FRAME_TIME = 0.0005  # 32 byte nRF24L01 frame incl. auto-ack at 2Mbps
+HID_REPORT_TIME = 0.001  # full speed USB polls the HID endpoint once per ms
+SERIAL_TIMEOUT = 0.02  # tx.ino's Serial.setTimeout, for ASCII lines without a newline
+MAX_HELD_KEYS = 6  # rx.ino's 6KRO report
+
+# Payload size of each host frame type once its length byte (if any) is known, mirrors
+# expectedBodyLength() in tx.ino
+_FRAME_PAYLOAD_SIZES = {
+    protocol.FRAME_MOUSE_POSITION: lambda body: 4,
+    protocol.FRAME_CLICK: lambda body: 1,
+    protocol.FRAME_KEY: lambda body: 2,
+    protocol.FRAME_SPECIAL_KEY: lambda body: 2 + body[3] if len(body) >= 4 else None,
+    protocol.FRAME_COMBO: lambda body: 1 + body[2] if len(body) >= 3 else None,
+    protocol.FRAME_MOUSE_DELTA: lambda body: 2,
+    protocol.FRAME_MOUSE_DELTA_BATCH: lambda body: 1 + 2 * body[2] if len(body) >= 3 else None,
+    protocol.FRAME_KEYCODE: lambda body: 2,
+    protocol.FRAME_KEYCODE_COMBO: lambda body: 1 + body[2] if len(body) >= 3 else None,
+    protocol.FRAME_TEXT: lambda body: 3 + body[4] if len(body) >= 5 else None,
+    protocol.FRAME_KEY_STATE: lambda body: 2,
+    protocol.FRAME_CHORD: lambda body: 2 + body[3] if len(body) >= 4 else None,
+    protocol.FRAME_MOUSE_WHEEL: lambda body: 2,
+    protocol.FRAME_ROUTE: lambda body: 2,
+    protocol.FRAME_STATE_SNAPSHOT: lambda body: 3 + body[4] if len(body) >= 5 else None,
+}
+
+_FRAME_FLAGS = protocol.FRAME_TRACE_FLAG | protocol.FRAME_ACK_FLAG
+
+_MOUSE_BUTTONS = {1: "left", 2: "right", 3: "middle"}
+
+
+def _int8(value):
+    return ((int(value) + 128) & 0xFF) - 128
+
+
+def _to_int(text):
+    # Arduino String.toInt(), a leading integer or 0
+    digits = ""
+    for position, character in enumerate(text.strip()):
+        if character.isdigit() or (position == 0 and character in "+-"):
+            digits += character
+        else:
+            break
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+
+class DeviceSimulator:
+    """tx.ino and one rx.ino per node with a serial link in between, driven by write() and read().
+
+    Set realtime=False to skip all the modelled delays, radio_loss is the chance that
+    network.write() fails. receivers holds a ReceiverSimulator per node, hid_log, cursor,
+    scrolled and typed are those of the first one. Counters for all of them are in stats.
+    """
+
+    def __init__(self, baud_rate=1000000, radio_frame_time=RADIO_FRAME_TIME, hid_report_time=HID_REPORT_TIME,
+                 radio_loss=0.0, realtime=True, seed=None, nodes=(protocol.RX_NODE,)):
+        self.baud_rate = baud_rate
+        self.radio_frame_time = radio_frame_time
+        self.hid_report_time = hid_report_time
+        self.radio_loss = radio_loss
+        self.realtime = realtime
+        self.stats = collections.Counter()
+        self._random = random.Random(seed)
+        self._condition = threading.Condition()
+        self._input = collections.deque()  # (arrival time, bytes) written by the host
+        self._input_end = 0.0  # when the last written byte reaches tx.ino
+        self._output = collections.deque()  # (arrival time, bytes) for the host
+        self._output_end = 0.0
+        self._running = True
+
+        # tx.ino state
+        self._buffer = bytearray()
+        self._payload = {"type": 0, "x": 0, "y": 0, "pressed": False, "message": b""}
+        self._reply_sequence = 0
+        self._trace = None  # (seq, received at, radio us) while rx's trace ack is outstanding
+        self._replies = collections.deque()  # payloads the rx.inos sent back over the radio
+        self._node = protocol.RX_NODE  # targetNode, set by FRAME_ROUTE
+        self._link = [0, 0, 0.0]  # radio writes, failures and seconds spent in them since the last FRAME_LINK_STATS
+        self._link_stats_at = 0.0
+
+        self.receivers = {node: ReceiverSimulator(self, node) for node in nodes}
+        self._tx_thread = threading.Thread(target=self._run_tx, name="sim-tx", daemon=True)
+        self._tx_thread.start()
+
+    @property
+    def receiver(self):
+        return self.receivers[next(iter(self.receivers))]
+
+    @property
+    def hid_log(self):
+        return self.receiver.hid_log
+
+    @property
+    def cursor(self):
+        return self.receiver.cursor
+
+    @property
+    def scrolled(self):
+        return self.receiver.scrolled
+
+    @property
+    def typed(self):
+        return self.receiver.typed
+
+    # Host side of the serial link
+
+    def _serial_time(self, length):
+        return length * 10 / self.baud_rate if self.realtime else 0.0
+
+    def write(self, data):
+        with self._condition:
+            now = time.perf_counter()
+            self._input_end = max(now, self._input_end) + self._serial_time(len(data))
+            self._input.append((self._input_end, bytes(data)))
+            self.stats["serial_bytes_in"] += len(data)
+            self._condition.notify_all()
+        return len(data)
+
+    def read(self, size=1, timeout=None):
+        """Up to size bytes tx.ino has sent, waits up to timeout seconds for the first one."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        data = bytearray()
+        with self._condition:
+            while self._running:
+                now = time.perf_counter()
+                while self._output and self._output[0][0] <= now and len(data) < size:
+                    arrival, chunk = self._output.popleft()
+                    taken = chunk[:size - len(data)]
+                    data += taken
+                    if len(taken) < len(chunk):
+                        self._output.appendleft((arrival, chunk[len(taken):]))
+                if data or (deadline is not None and now >= deadline):
+                    break
+                wait = self._output[0][0] - now if self._output else None
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._condition.wait(wait)
+        return bytes(data)
+
+    def in_waiting(self):
+        with self._condition:
+            now = time.perf_counter()
+            return sum(len(chunk) for arrival, chunk in self._output if arrival <= now)
+
+    def out_waiting(self):
+        # Bytes written by the host that tx.ino hasn't got yet
+        with self._condition:
+            now = time.perf_counter()
+            return sum(len(chunk) for arrival, chunk in self._input if arrival > now)
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+    def _reply(self, frame_type, payload):
+        # tx.ino's sendReply()
+        body = bytes((frame_type, self._reply_sequence)) + payload
+        self._reply_sequence = (self._reply_sequence + 1) & 0xFF
+        frame = bytes((protocol.FRAME_SYNC,)) + body + bytes((protocol.crc8(body),))
+        with self._condition:
+            now = time.perf_counter()
+            self._output_end = max(now, self._output_end) + self._serial_time(len(frame))
+            self._output.append((self._output_end, frame))
+            self._condition.notify_all()
+
+    def _sleep(self, seconds):
+        if self.realtime and seconds > 0:
+            time.sleep(seconds)
+
+    # tx.ino
+
+    def _run_tx(self):
+        # loop(): serial input first, then whatever rx.ino sent back
+        while True:
+            with self._condition:
+                while True:
+                    if not self._running:
+                        return
+                    now = time.perf_counter()
+                    data = self._input.popleft()[1] if self._input and self._input[0][0] <= now else None
+                    replies = list(self._replies)
+                    self._replies.clear()
+                    if data is not None or replies:
+                        break
+                    self._condition.wait(self._input[0][0] - now if self._input else None)
+            if data is not None:
+                self._buffer += data
+                self._parse()
+            for reply in replies:
+                self._handle_reply(reply)
+            now = time.perf_counter()
+            if self._link[0] and now - self._link_stats_at >= protocol.LINK_STATS_INTERVAL:
+                self._link_stats_at = now
+                self._send_link_stats()
+
+    def _send_link_stats(self):
+        writes, failures, radio_time = self._link
+        self._link = [0, 0, 0.0]
+        with self._condition:
+            waiting = sum(len(chunk) for arrival, chunk in self._input if arrival <= time.perf_counter()) + len(self._buffer)
+        self._reply(protocol.FRAME_LINK_STATS, struct.pack(
+            protocol.LINK_STATS_FORMAT, min(writes, 0xFFFF), min(failures, 0xFFFF), min(int(radio_time * 1e6), 0xFFFF), min(waiting, 0xFF)))
+
+    def _parse(self):
+        buffer = self._buffer
+        while buffer:
+            if buffer[0] != protocol.FRAME_SYNC:
+                newline = buffer.find(b"\n")
+                if newline < 0:
+                    if not self._input_pending_within(SERIAL_TIMEOUT):
+                        line = bytes(buffer)
+                        buffer.clear()
+                        self._handle_line(line)
+                    return
+                line = bytes(buffer[:newline])
+                del buffer[:newline + 1]
+                self._handle_line(line)
+                continue
+            if len(buffer) < 2:
+                return
+            frame_type = buffer[1] & ~_FRAME_FLAGS
+            size = _FRAME_PAYLOAD_SIZES.get(frame_type)
+            if size is None:
+                # tx.ino drops the sync and type bytes and reads on as ASCII
+                self.stats["unknown_frames"] += 1
+                del buffer[:2]
+                continue
+            payload_size = size(buffer[1:])
+            if payload_size is None or len(buffer) < payload_size + 4:
+                return
+            body = bytes(buffer[1:payload_size + 3])
+            crc = buffer[payload_size + 3]
+            del buffer[:payload_size + 4]
+            if protocol.crc8(body) != crc:
+                self.stats["bad_frames"] += 1
+                continue
+            self._handle_frame(body)
+
+    def _input_pending_within(self, seconds):
+        with self._condition:
+            return bool(self._input) and self._input[0][0] - time.perf_counter() < seconds
+
+    def _set_payload(self, payload_type, x=0, y=0, pressed=False, message=b""):
+        self._payload.update(type=payload_type, x=_int8(x), y=_int8(y), pressed=bool(pressed),
+                             message=bytes(message)[:protocol.PAYLOAD_MAX_MESSAGE - 1])
+
+    def _set_click(self, code):
+        # setMouseClick() leaves button and state alone for unknown codes
+        if 1 <= code <= 6:
+            button, pressed = (code + 1) // 2, code % 2 == 1
+        else:
+            button, pressed = self._payload["x"], self._payload["pressed"]
+        self._set_payload(protocol.PAYLOAD_CLICK, button, 0, pressed)
+
+    def _set_combo(self, keys):
+        # setCombo() cuts the names at { and }
+        for stop in (b"{", b"}"):
+            keys = keys.split(stop)[0]
+        self._set_payload(protocol.PAYLOAD_COMBO, pressed=True, message=keys)
+
+    def _handle_line(self, line):
+        self.stats["ascii_lines"] += 1
+        text = line.decode(errors="replace").strip()
+        if text.startswith("M"):
+            comma = text.find(",")
+            x = _to_int(text[2:comma] if comma >= 0 else text[2:])
+            y = _to_int(text[comma + 1:])
+            self._set_payload(protocol.PAYLOAD_MOUSE_POSITION, _int8(x) * 2, _int8(y) * 2)
+        elif text.startswith("D,"):
+            values = [max(-127, min(127, _to_int(value))) for value in text[2:].split(",") if value.strip()]
+            steps = struct.pack(f"<{len(values) // 2 * 2}b", *values[:len(values) // 2 * 2])
+            self._set_payload(protocol.PAYLOAD_MOUSE_DELTA, len(values) // 2, message=steps)
+        elif text.startswith("C,"):
+            self._set_click(_to_int(text[2:]))
+        elif text.startswith("W,"):
+            values = text[2:].split(",")
+            vertical = max(-127, min(127, _to_int(values[0])))
+            horizontal = max(-127, min(127, _to_int(values[1]))) if len(values) > 1 else 0
+            self._set_payload(protocol.PAYLOAD_MOUSE_WHEEL, vertical, horizontal)
+        elif text.startswith("U,") or text.startswith("K,"):
+            self._set_payload(protocol.PAYLOAD_KEY, ord(text[2]) if len(text) > 2 else 0, 0, text[0] == "K")
+        elif text.startswith("T,") or text.startswith("S,"):
+            self._set_payload(protocol.PAYLOAD_SPECIAL_KEY, pressed=text[0] == "S", message=text[2:].encode())
+        elif text.startswith("X,"):
+            self._set_combo(text[2:].encode())
+        elif text.startswith("R,"):
+            self._node = _to_int(text[2:])
+            return  # nothing to send, like tx.ino
+        # tx.ino sends whatever is in payload, even for a line it didn't understand
+        self._send_payload(traced=False)
+
+    def _handle_frame(self, body):
+        self.stats["frames"] += 1
+        frame_type = body[0] & ~_FRAME_FLAGS
+        traced = bool(body[0] & protocol.FRAME_TRACE_FLAG)
+        acked = bool(body[0] & protocol.FRAME_ACK_FLAG)
+        received_at = time.perf_counter()
+        data = body[2:]
+        if frame_type == protocol.FRAME_ROUTE:
+            self._node = data[0] | data[1] << 8
+            return
+        if frame_type == protocol.FRAME_MOUSE_POSITION:
+            x, y = struct.unpack("<hh", data)
+            self._set_payload(protocol.PAYLOAD_MOUSE_POSITION, _int8(x) * 2, _int8(y) * 2)
+        elif frame_type == protocol.FRAME_CLICK:
+            self._set_click(data[0])
+        elif frame_type == protocol.FRAME_KEY:
+            self._set_payload(protocol.PAYLOAD_KEY, data[0], 0, data[1])
+        elif frame_type == protocol.FRAME_SPECIAL_KEY:
+            self._set_payload(protocol.PAYLOAD_SPECIAL_KEY, pressed=data[0], message=data[2:2 + data[1]])
+        elif frame_type == protocol.FRAME_COMBO:
+            self._set_combo(data[1:1 + data[0]])
+        elif frame_type == protocol.FRAME_MOUSE_DELTA:
+            self._set_payload(protocol.PAYLOAD_MOUSE_DELTA, 1, message=data[:2])
+        elif frame_type == protocol.FRAME_MOUSE_DELTA_BATCH:
+            count = min(data[0], protocol.PAYLOAD_MAX_MESSAGE // 2)
+            self._set_payload(protocol.PAYLOAD_MOUSE_DELTA, count, message=data[1:1 + 2 * count])
+        elif frame_type == protocol.FRAME_KEYCODE:
+            self._set_payload(protocol.PAYLOAD_KEYCODE, data[0], 0, data[1])
+        elif frame_type == protocol.FRAME_KEYCODE_COMBO:
+            self._set_payload(protocol.PAYLOAD_KEYCODE_COMBO, pressed=True, message=data[1:1 + data[0]])
+        elif frame_type == protocol.FRAME_TEXT:
+            self._set_payload(protocol.PAYLOAD_TEXT, data[0], data[1], message=data[3:3 + data[2]])
+        elif frame_type == protocol.FRAME_KEY_STATE:
+            self._set_payload(protocol.PAYLOAD_KEY_STATE, data[0], 0, data[1])
+        elif frame_type == protocol.FRAME_MOUSE_WHEEL:
+            vertical, horizontal = struct.unpack("<bb", data)
+            self._set_payload(protocol.PAYLOAD_MOUSE_WHEEL, vertical, horizontal)
+        elif frame_type == protocol.FRAME_CHORD:
+            self._set_payload(protocol.PAYLOAD_CHORD, data[0], 0, True, message=data[2:2 + data[1]])
+        elif frame_type == protocol.FRAME_STATE_SNAPSHOT:
+            self._set_payload(protocol.PAYLOAD_STATE_SNAPSHOT, data[0], 0, False, message=data[1:2] + data[3:3 + data[2]])
+        if acked:
+            self._payload["y"] = _int8(body[1])
+        ok = self._send_payload(traced, acked)
+        if frame_type == protocol.FRAME_TEXT and not ok:
+            self._reply(protocol.FRAME_TEXT_ACK, bytes((data[0], data[1], protocol.TEXT_RADIO_FAILED)))
+        if acked and not ok:
+            self._reply(protocol.FRAME_EVENT_ACK, bytes((body[1], protocol.EVENT_RADIO_FAILED)))
+        if traced:
+            radio_us = min(int((time.perf_counter() - received_at) * 1e6), 0xFFFF)
+            if ok:
+                self._trace = (body[1], received_at, radio_us)
+            else:
+                self._trace = None
+                self._reply(protocol.FRAME_TRACE, struct.pack("<BBHHH", body[1], 0, radio_us, 0, 0))
+
+    def _send_payload(self, traced, acked=False):
+        # network.write(): blocks for every fragment, fails if the radio gives up
+        payload = self._payload
+        payload_type = payload["type"] | (protocol.PAYLOAD_TRACE_FLAG if traced else 0) | (protocol.PAYLOAD_ACK_FLAG if acked else 0)
+        data = protocol.pack_payload(payload_type, payload["x"], payload["y"], payload["pressed"], payload["message"])
+        fragments = max(1, -(-len(data) // protocol.RF24_FRAME_PAYLOAD))
+        self.stats["radio_frames"] += fragments
+        self._sleep(fragments * self.radio_frame_time)
+        self._link[0] += 1
+        self._link[2] += fragments * self.radio_frame_time
+        receiver = self.receivers.get(self._node)
+        if receiver is None or (self.radio_loss and self._random.random() < self.radio_loss):
+            self.stats["radio_failures"] += 1
+            self._link[1] += 1
+            return False
+        with self._condition:
+            receiver.receive(data)
+            self._condition.notify_all()
+        return True
+
+    def _handle_reply(self, data):
+        payload_type, x, y, pressed, length = struct.unpack_from(protocol.PAYLOAD_HEADER_FORMAT, data)
+        message = data[protocol.PAYLOAD_HEADER_SIZE:]
+        if payload_type == protocol.PAYLOAD_TEXT_ACK:
+            self._reply(protocol.FRAME_TEXT_ACK, bytes((x & 0xFF, y & 0xFF, message[0])))
+        elif payload_type == protocol.PAYLOAD_EVENT_ACK:
+            self._reply(protocol.FRAME_EVENT_ACK, bytes((y & 0xFF, protocol.EVENT_APPLIED)))
+        elif payload_type == protocol.PAYLOAD_TRACE_ACK and self._trace is not None:
+            seq, received_at, radio_us = self._trace
+            self._trace = None
+            round_trip_us = min(int((time.perf_counter() - received_at) * 1e6), 0xFFFF)
+            rx_us = message[0] | message[1] << 8
+            self._reply(protocol.FRAME_TRACE, struct.pack("<BBHHH", seq, protocol.TRACE_RADIO_OK, radio_us, rx_us, round_trip_us))
+
+
+class ReceiverSimulator:
+    """One rx.ino, at RF24Network address node. What it does to its target ends up in
+    hid_log, cursor, scrolled and typed."""
+
+    def __init__(self, device, node):
+        self.device = device
+        self.node = node
+        self.hid_log = collections.deque(maxlen=10000)
+        self.cursor = [0, 0]
+        self.scrolled = [0, 0]  # wheel steps, vertical and horizontal
+        self.typed = bytearray()
+        self.hid_reports = 0
+        self.held_keys = []  # keys held by key state payloads, at most MAX_HELD_KEYS
+        self.held_modifiers = 0
+        self.held_buttons = set()  # Mouse.isPressed()
+        self._radio = collections.deque()  # payloads on their way to this rx.ino
+        self._initial_payload = False
+        self._last_position = (0, 0)
+        self._text_stream = None
+        self._next_text_chunk = 0
+        self._thread = threading.Thread(target=self._run_rx, name=f"sim-rx-{node:o}", daemon=True)
+        self._thread.start()
+
+    def receive(self, data):
+        # Called with the device's condition held
+        self._radio.append(data)
+
+    def _radio_reply(self, data):
+        self.device._sleep(self.device.radio_frame_time)
+        with self.device._condition:
+            self.device._replies.append(data)
+            self.device._condition.notify_all()
+
+    def _run_rx(self):
+        while True:
+            with self.device._condition:
+                while self.device._running and not self._radio:
+                    self.device._condition.wait()
+                if not self.device._running:
+                    return
+                data = self._radio.popleft()
+            received_at = time.perf_counter()
+            payload_type, x, y, pressed, length = struct.unpack_from(protocol.PAYLOAD_HEADER_FORMAT, data)
+            traced = bool(payload_type & protocol.PAYLOAD_TRACE_FLAG)
+            acked = bool(payload_type & protocol.PAYLOAD_ACK_FLAG)
+            payload_type &= ~(protocol.PAYLOAD_TRACE_FLAG | protocol.PAYLOAD_ACK_FLAG)
+            message = data[protocol.PAYLOAD_HEADER_SIZE:protocol.PAYLOAD_HEADER_SIZE + length]
+            self._dispatch(payload_type, x, y, bool(pressed), message)
+            if acked:
+                self._radio_reply(protocol.pack_payload(protocol.PAYLOAD_EVENT_ACK, 0, y))
+            if traced:
+                dispatch_us = min(int((time.perf_counter() - received_at) * 1e6), 0xFFFF)
+                self._radio_reply(protocol.pack_payload(protocol.PAYLOAD_TRACE_ACK, message=struct.pack("<H", dispatch_us)))
+
+    def _hid(self, *event):
+        self.hid_log.append((time.perf_counter(),) + event)
+        self.hid_reports += 1
+        self.device.stats["hid_reports"] += 1
+        self.device._sleep(self.device.hid_report_time)
+
+    def _mouse_move(self, dx, dy):
+        self.cursor[0] += dx
+        self.cursor[1] += dy
+        self._hid("Mouse.move", dx, dy)
+
+    def _scroll(self, vertical, horizontal):
+        # case 13, horizontal steps are Shift + wheel
+        if vertical:
+            self._hid("Mouse.move", 0, 0, vertical)
+        if horizontal:
+            shift = ARDUINO_KEYCODES["KEY_LEFT_SHIFT"]
+            shift_held = self.held_modifiers & (1 << (shift - ARDUINO_KEYCODES["KEY_LEFT_CTRL"]))
+            if not shift_held:
+                self._hid("Keyboard.press", shift)
+            self._hid("Mouse.move", 0, 0, -horizontal)
+            if not shift_held:
+                self._hid("Keyboard.release", shift)
+        self.scrolled[0] += vertical
+        self.scrolled[1] += horizontal
+
+    def _press_key(self, code, pressed):
+        # Keyboard.press() + release() for a key down, just release() for a key up
+        if pressed:
+            self._hid("Keyboard.press", code)
+        self._hid("Keyboard.release", code)
+
+    def _set_key_state(self, code, down):
+        # setKeyState(), only a change of the held keys sends a report
+        if ARDUINO_KEYCODES["KEY_LEFT_CTRL"] <= code <= ARDUINO_KEYCODES["KEY_RIGHT_GUI"]:
+            bit = 1 << (code - ARDUINO_KEYCODES["KEY_LEFT_CTRL"])
+            if down == bool(self.held_modifiers & bit):
+                return
+            self.held_modifiers ^= bit
+        else:
+            if down == (code in self.held_keys):
+                return
+            if down:
+                if len(self.held_keys) == MAX_HELD_KEYS:
+                    self.device.stats["rolled_over_keys"] += 1
+                    return
+                self.held_keys.append(code)
+            else:
+                self.held_keys.remove(code)
+        self._hid("Keyboard.press" if down else "Keyboard.release", code)
+
+    def _tap_chord(self, modifiers, codes):
+        # tapChord(), keys and modifiers held by key state payloads stay down
+        first = ARDUINO_KEYCODES["KEY_LEFT_CTRL"]
+        for bit in range(8):
+            if modifiers & (1 << bit):
+                self._hid("Keyboard.press", first + bit)
+        for code in codes:
+            self._hid("Keyboard.press", code)
+        for code in reversed(codes):
+            if code not in self.held_keys:
+                self._hid("Keyboard.release", code)
+        for bit in range(8):
+            if modifiers & ~self.held_modifiers & (1 << bit):
+                self._hid("Keyboard.release", first + bit)
+
+    def _mouse_button(self, button, pressed):
+        # Mouse.press()/release() only send a report when the button state changes
+        if pressed == (button in self.held_buttons):
+            return
+        if pressed:
+            self.held_buttons.add(button)
+        else:
+            self.held_buttons.discard(button)
+        self._hid("Mouse.press" if pressed else "Mouse.release", button)
+
+    def _apply_snapshot(self, modifiers, buttons, codes):
+        # applySnapshot(): only what differs from the snapshot is pressed or released
+        for code in list(self.held_keys):
+            if code not in codes:
+                self._set_key_state(code, False)
+        first = ARDUINO_KEYCODES["KEY_LEFT_CTRL"]
+        for bit in range(8):
+            self._set_key_state(first + bit, bool(modifiers & (1 << bit)))
+        for code in codes:
+            self._set_key_state(code, True)
+        for number, button in _MOUSE_BUTTONS.items():
+            self._mouse_button(button, bool(buttons & (1 << (number - 1))))
+
+    def _release_all(self):
+        self._hid("Keyboard.releaseAll")
+        self.held_keys.clear()
+        self.held_modifiers = 0
+
+    def _dispatch(self, payload_type, x, y, pressed, message):
+        self.device.stats["payloads"] += 1
+        if payload_type == protocol.PAYLOAD_MOUSE_POSITION:
+            if not self._initial_payload:
+                self._initial_payload = True  # first position is only the reference
+            else:
+                self._mouse_move(x - self._last_position[0], y - self._last_position[1])
+            self._last_position = (x, y)
+        elif payload_type == protocol.PAYLOAD_MOUSE_DELTA:
+            steps = struct.unpack(f"<{2 * max(0, x)}b", message[:2 * max(0, x)])
+            for index in range(0, len(steps), 2):
+                self._mouse_move(steps[index], steps[index + 1])
+        elif payload_type == protocol.PAYLOAD_CLICK:
+            if x in _MOUSE_BUTTONS:
+                self._mouse_button(_MOUSE_BUTTONS[x], pressed)
+        elif payload_type in (protocol.PAYLOAD_KEY, protocol.PAYLOAD_KEYCODE):
+            self._press_key(x & 0xFF, pressed)
+        elif payload_type == protocol.PAYLOAD_SPECIAL_KEY:
+            code = ARDUINO_KEYCODES.get(message.decode(errors="replace"), 0)
+            if code:
+                self._press_key(code, pressed)
+        elif payload_type == protocol.PAYLOAD_KEYCODE_COMBO:
+            for code in message:
+                self._hid("Keyboard.press", code)
+            self._release_all()
+        elif payload_type == protocol.PAYLOAD_COMBO:
+            for name in message.decode(errors="replace").split(","):
+                if name:
+                    self._hid("Keyboard.press", ARDUINO_KEYCODES.get(name) or ord(name[0]))
+            self._release_all()
+        elif payload_type == protocol.PAYLOAD_TEXT:
+            self._type_text(x & 0xFF, y & 0xFF, message)
+        elif payload_type == protocol.PAYLOAD_KEY_STATE:
+            self._set_key_state(x & 0xFF, pressed)
+        elif payload_type == protocol.PAYLOAD_CHORD:
+            self._tap_chord(x & 0xFF, message)
+        elif payload_type == protocol.PAYLOAD_MOUSE_WHEEL:
+            self._scroll(x, y)
+        elif payload_type == protocol.PAYLOAD_STATE_SNAPSHOT and message:
+            self._apply_snapshot(x & 0xFF, message[0], message[1:])
+
+    def _type_text(self, stream, index, text):
+        if stream != self._text_stream:
+            self._text_stream = stream
+            self._next_text_chunk = 0
+        status = protocol.TEXT_TYPED
+        offset = (index - self._next_text_chunk) & 0xFF
+        if offset == 0:
+            for character in text:
+                # Keyboard.write() is a press and a release
+                self.hid_log.append((time.perf_counter(), "Keyboard.write", character))
+                self.device.stats["hid_reports"] += 2
+                self.hid_reports += 2
+                self.device._sleep(2 * self.device.hid_report_time)
+                self.typed.append(character)
+            self._next_text_chunk = (self._next_text_chunk + 1) & 0xFF
+        elif offset < 128:
+            status = protocol.TEXT_OUT_OF_ORDER
+        self._radio_reply(protocol.pack_payload(protocol.PAYLOAD_TEXT_ACK, _int8(stream), _int8(index), message=bytes((status,))))
+
+
+def serve_pty(simulator):
+    """Expose simulator on a new pseudo terminal, returns the path to hand to the app."""
+    import os
+    import tty
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+
+    def host_to_device():
+        while True:
+            try:
+                data = os.read(master, 4096)
+            except OSError:
+                return
+            simulator.write(data)
+
+    def device_to_host():
+        while True:
+            data = simulator.read(4096, timeout=0.5)
+            if data:
+                os.write(master, data)
+
+    for target in (host_to_device, device_to_host):
+        threading.Thread(target=target, daemon=True).start()
+    return path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate tx.ino and rx.ino on a pseudo terminal")
+    parser.add_argument("--radio-loss", type=float, default=0.0, help="chance that a radio write fails")
+    parser.add_argument("--radio-frame-time", type=float, default=RADIO_FRAME_TIME)
+    parser.add_argument("--hid-report-time", type=float, default=HID_REPORT_TIME)
+    parser.add_argument("--no-realtime", action="store_true", help="skip the modelled serial, radio and USB delays")
+    parser.add_argument("--nodes", default="00", help="comma separated octal rx.ino addresses, e.g. 00,011,021,031")
+    args = parser.parse_args()
+
+    simulator = DeviceSimulator(radio_frame_time=args.radio_frame_time, hid_report_time=args.hid_report_time,
+                                radio_loss=args.radio_loss, realtime=not args.no_realtime,
+                                nodes=tuple(int(node, 8) for node in args.nodes.split(",")))
+    path = serve_pty(simulator)
+    print(f"Simulating tx.ino/rx.ino on {path}, set microprocessor_port = \"{path}\" (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"cursor={tuple(simulator.cursor)} typed={len(simulator.typed)} {dict(simulator.stats)}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Where a ForwardingEngine's input comes from and where the host cursor goes
+#
+# The mouse and keyboard libraries are only imported once a hook is started, so the engine
+# and everything around it can be imported and driven from anything else, e.g. the
+# benchmarks' recorded traces.
+
+import threading
+
+
+class HookSource:
+    """The mouse and keyboard library hooks, feeding one engine.
+
+    forwarding_mode "event" forwards motion from mouse hook move events on a thread of its
+    own, "poll" leaves it to poll() (the legacy 20 ms loop).
+    """
+
+    def __init__(self, engine, forwarding_mode="event"):
+        self.engine = engine
+        self.forwarding_mode = forwarding_mode
+        self.hook_count = 0  # mouse and keyboard hooks installed, stays the same for the whole session
+        self.keyboard_hook = None  # the one keyboard hook, see ForwardingEngine.connect_keyboard
+        self._thread = None
+
+    def start(self):
+        import keyboard
+        import mouse
+
+        mouse.hook(self.engine.mouse_event)
+        self.hook_count += 1
+        self.keyboard_hook = keyboard.hook(self.engine.keyboard_event, suppress=True)
+        self.hook_count += 1
+        if self.forwarding_mode == "event":
+            mouse.hook(self.engine.mouse_move_event)
+            self.hook_count += 1
+            self._thread = threading.Thread(target=self.engine.forward_motion, name="motion-forwarder")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def poll(self):
+        if self.forwarding_mode != "event":
+            self.engine.check_position()
+
+
+class HostCursor:
+    """The host's own cursor, moved with the mouse library."""
+
+    def __init__(self):
+        import mouse
+
+        self._mouse = mouse
+
+    def move(self, x, y):
+        self._mouse.move(x, y)
+
+    def position(self):
+        return self._mouse.get_position()
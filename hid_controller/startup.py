@@ -0,0 +1,32 @@
+# How long the scripts take from launch until input reaches a target
+#
+# Launch is the script's first line, so the interpreter's own start-up is not included but
+# every import is. /stats serves the snapshot.
+
+import time
+
+
+class StartupTimer:
+    """Seconds from launch to each startup stage and to the first frame the writer sent."""
+
+    def __init__(self, launched=None):
+        self.launched = time.perf_counter() if launched is None else launched
+        self.stages = {}  # stage -> seconds after launch, in the order they were reached
+
+    def mark(self, stage):
+        self.stages[stage] = time.perf_counter() - self.launched
+
+    def first_event(self, writer):
+        """Seconds from launch until writer wrote its first frame, None before that."""
+        written = getattr(writer, "first_write", None)
+        return None if written is None else written - self.launched
+
+    def snapshot(self, writer=None):
+        first_event = self.first_event(writer)
+        return {
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            "first_event_ms": None if first_event is None else round(first_event * 1000, 1),
+        }
+
+    def summary(self):
+        return ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in self.stages.items())
@@ -0,0 +1,181 @@
+# Serial port that reconnects by itself after the tx.ino board resets or re-enumerates
+#
+# SerialWriter and SerialReader use it like any other port. When a read or write fails, the
+# port is closed and a thread of its own reconnects with backoff. SerialWriter keeps the
+# key/click frame whose write failed, and everything queued behind it, for the new port,
+# and drops stale motion and scrolling (see SerialWriter._run). Frames written just before
+# the board reset may still be lost with it. Replaying them could type a key twice, so they
+# are not replayed.
+
+import collections
+import threading
+import time
+
+import serial
+
+
+class SupervisedSerial:
+    """Wraps the port connect() opens and reopens it after errors.
+
+    connect() returns (device, port), or (None, None) when there is no board, e.g.
+    open_microprocessor_port(), which tries the cached device and then scans the ports
+    again. device and port are the connection already open at startup.
+    """
+
+    supervised = True  # tells SerialWriter and SerialReader to wait for a reconnect instead of giving up
+
+    def __init__(self, connect, device=None, port=None, min_backoff=0.05, max_backoff=2.0, read_timeout=0.5):
+        self.connect = connect
+        self.device = device
+        self.min_backoff = min_backoff  # seconds before the second attempt, doubled after every failed one
+        self.max_backoff = max_backoff
+        self.read_timeout = read_timeout  # read() waits at most this long for the port to come back
+        self.generation = 0  # incremented for every (re)connected port, a new port has a freshly reset board
+        self.disconnects = 0
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.last_error = None
+        self.recovery_times = collections.deque(maxlen=32)  # seconds from losing the port to having it back
+        self._port = None
+        self._lost_at = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._stopped = threading.Event()  # wakes the reconnect thread up from its backoff on close()
+        self._thread = None
+        if port is not None:
+            self._attach(device, port)
+
+    @property
+    def state(self):
+        if self._closed:
+            return "closed"
+        return "connected" if self._connected.is_set() else "reconnecting"
+
+    def wait_connected(self, timeout=None):
+        return self._connected.wait(timeout)
+
+    def _attach(self, device, port):
+        # Called with the lock held, or before any other thread has the port
+        self.device = device
+        self._port = port
+        self.generation += 1
+        self._connected.set()
+
+    def _current(self):
+        port = self._port
+        if port is None:
+            raise serial.SerialException(f"Microcontroller on {self.device} is disconnected")
+        return port
+
+    def write(self, data):
+        port = self._current()
+        try:
+            return port.write(data)
+        except Exception as e:
+            self.lost(port, e)
+            raise
+
+    def read(self, size=1):
+        if not self._connected.wait(self.read_timeout):
+            return b""
+        port = self._current()
+        try:
+            return port.read(size)
+        except Exception as e:
+            self.lost(port, e)
+            raise
+
+    def flush(self):
+        port = self._current()
+        try:
+            port.flush()
+        except Exception as e:
+            self.lost(port, e)
+            raise
+
+    @property
+    def in_waiting(self):
+        return self._waiting("in_waiting")
+
+    @property
+    def out_waiting(self):
+        return self._waiting("out_waiting")
+
+    def _waiting(self, name):
+        port = self._port
+        if port is None:
+            return 0
+        try:
+            return getattr(port, name)
+        except Exception as e:
+            self.lost(port, e)
+            return 0
+
+    def lost(self, port, error):
+        """port failed with error, start reconnecting unless that is already under way."""
+        with self._lock:
+            if port is not self._port or self._closed:
+                return
+            self._port = None
+            self._connected.clear()
+            self.disconnects += 1
+            self.last_error = str(error)
+            self._lost_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._reconnect, name="serial-reconnect")
+            self._thread.daemon = True
+            self._thread.start()
+        print(f"Lost the microcontroller on {self.device} ({error}), reconnecting")
+        try:
+            port.close()
+        except Exception:
+            pass
+
+    def _reconnect(self):
+        backoff = self.min_backoff
+        while not self._closed:
+            try:
+                device, port = self.connect()
+            except Exception as e:
+                device, port = None, None
+                self.last_error = str(e)
+            if port is not None:
+                with self._lock:
+                    if self._closed:
+                        port.close()
+                        return
+                    self.recovery_times.append(time.perf_counter() - self._lost_at)
+                    self.reconnects += 1
+                    self._attach(device, port)
+                print(f"Reconnected to microcontroller on {device} after {self.recovery_times[-1] * 1000:.0f} ms")
+                return
+            self.failed_attempts += 1
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            port, self._port = self._port, None
+        self._stopped.set()
+        if port is not None:
+            port.close()
+
+    def snapshot(self):
+        """Connection state and recovery times, served by /connection."""
+        recovery_ms = [round(seconds * 1000, 1) for seconds in self.recovery_times]
+        lost_at = self._lost_at
+        return {
+            "state": self.state,
+            "device": self.device,
+            "disconnects": self.disconnects,
+            "reconnects": self.reconnects,
+            "failed_attempts": self.failed_attempts,
+            "last_error": self.last_error,
+            "down_ms": round((time.perf_counter() - lost_at) * 1000, 1) if self.state == "reconnecting" and lost_at else None,
+            "recovery_ms": {
+                "last": recovery_ms[-1] if recovery_ms else None,
+                "max": max(recovery_ms) if recovery_ms else None,
+                "recent": recovery_ms,
+            },
+        }
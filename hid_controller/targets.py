@@ -0,0 +1,39 @@
+# Target computers, one rx.ino each
+#
+# Every target hangs off its own RF24Network node and is reached by pushing the cursor over
+# one edge of the host's monitors, see hid_controller/layout.py for where that edge is.
+
+from hid_controller import protocol
+from hid_controller.keymap import KeyTranslator
+
+EDGES = ("right", "left", "top", "bottom")
+SYSTEMS = ("windows", "linux", "mac")
+
+
+class Target:
+    """One target computer: its rx.ino node, OS, screen size and the host edge leading to it.
+
+    edge is a side of monitor, an index into get_monitors(). With monitor None it's the
+    outermost monitor on that side, e.g. the rightmost one for "right". Holds the
+    KeyTranslator for host_system to its OS, call set_system() to change the OS.
+    """
+
+    def __init__(self, name, node=protocol.RX_NODE, system="windows", width=1920, height=1080, edge="right", host_system="windows", monitor=None):
+        if edge not in EDGES:
+            raise ValueError(f"invalid edge {edge!r} for target {name!r}, expected one of {', '.join(EDGES)}")
+        if system not in SYSTEMS:
+            raise ValueError(f"invalid system {system!r} for target {name!r}")
+        if node not in protocol.RX_NODES:
+            raise ValueError(f"invalid node {node:o} for target {name!r}, tx.ino reaches {', '.join(f'{n:02o}' for n in protocol.RX_NODES)}")
+        self.name = name
+        self.node = node
+        self.system = system
+        self.width = width
+        self.height = height
+        self.edge = edge
+        self.monitor = monitor
+        self.key_translator = KeyTranslator(host_system, system)
+
+    def set_system(self, host_system, system):
+        self.system = system
+        self.key_translator.rebuild(host_system, system)
@@ -0,0 +1,105 @@
+# Bulk text typing over FRAME_TEXT
+#
+# Strings go out in chunks of one radio frame each and rx.ino types them itself, instead of
+# one serial write and one radio packet per character.
+
+import collections
+import threading
+import time
+
+from hid_controller import protocol
+
+
+class TextSender:
+    """Types strings on the target with go-back-N flow control.
+
+    At most window chunks are in flight so the 32U4's USB buffer and the receiving radio
+    never overflow. rx.ino types chunks strictly in order and acks every one, an ack for a
+    chunk covers all chunks before it. A chunk that failed or timed out is sent again
+    together with everything after it. Failures reported while another copy of the same
+    chunk is still in flight are left to that copy (or to the timeout).
+    """
+
+    def __init__(self, send, window=2, timeout=0.5, max_retries=5):
+        self.send = send  # bytes -> bool, e.g. SerialWriter.send
+        self.window = window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()  # one string at a time
+        self._condition = threading.Condition()
+        self._acks = collections.deque()
+        self._stream = 0
+
+    def acknowledge(self, seq, payload):
+        # SerialReader handler for FRAME_TEXT_ACK
+        with self._condition:
+            self._acks.append(tuple(payload))
+            self._condition.notify()
+
+    def type_text(self, text):
+        """Type text on the target, returns throughput stats once every chunk is acknowledged."""
+        chunks = protocol.chunk_text(text)
+        with self._lock:
+            with self._condition:
+                # A new stream id tells rx.ino to start counting chunks from 0 again
+                self._stream = (self._stream + 1) & 0xFF
+                self._acks.clear()
+            stream = self._stream
+            start = time.perf_counter()
+            base = 0  # oldest chunk not acknowledged yet
+            next_chunk = 0
+            sent_at = start
+            retries = 0
+            retransmits = 0
+            in_flight = collections.Counter()  # copies of each chunk sent and not acked yet
+
+            while base < len(chunks):
+                while next_chunk < len(chunks) and next_chunk - base < self.window:
+                    if next_chunk == base:
+                        sent_at = time.perf_counter()
+                    self.send(protocol.encode_text(stream, next_chunk, chunks[next_chunk]))
+                    in_flight[next_chunk] += 1
+                    next_chunk += 1
+
+                with self._condition:
+                    if not self._acks:
+                        self._condition.wait(max(0.0, sent_at + self.timeout - time.perf_counter()))
+                    acks = list(self._acks)
+                    self._acks.clear()
+
+                resend_from = None
+                for ack_stream, index, status in acks:
+                    # The chunk index on air wraps at 256, map it back into the window
+                    offset = (index - base) & 0xFF
+                    if ack_stream != stream or offset >= next_chunk - base:
+                        continue  # late ack for an earlier chunk or string
+                    chunk = base + offset
+                    in_flight[chunk] -= 1
+                    if status == protocol.TEXT_TYPED:
+                        base = chunk + 1
+                        sent_at = time.perf_counter()
+                        retries = 0
+                    elif in_flight[chunk] <= 0:
+                        # Out of order means rx.ino is still waiting for the oldest chunk
+                        failed = chunk if status == protocol.TEXT_RADIO_FAILED else base
+                        resend_from = failed if resend_from is None else min(resend_from, failed)
+                if base < next_chunk and time.perf_counter() - sent_at >= self.timeout:
+                    resend_from = base
+
+                if resend_from is not None and resend_from >= base:
+                    retries += 1
+                    if retries > self.max_retries:
+                        raise TimeoutError(f"Target stopped acknowledging text after {base} of {len(chunks)} chunks")
+                    retransmits += next_chunk - resend_from
+                    next_chunk = resend_from
+
+            seconds = time.perf_counter() - start
+            characters = sum(len(chunk) for chunk in chunks)
+            return {
+                "characters": characters,
+                "skipped": len(text.replace("\r\n", "\n")) - characters,  # not ASCII, dropped by chunk_text()
+                "chunks": len(chunks),
+                "retransmits": retransmits,
+                "seconds": round(seconds, 3),
+                "chars_per_second": round(characters / seconds, 1) if seconds > 0 else None,
+            }
@@ -0,0 +1,201 @@
+# HTTP API for a ForwardingEngine (app_with_server.py)
+#
+# Flask is only imported by create_app(). Every action goes through a RequestPipeline, so
+# API calls run one at a time on its worker thread and never race the hooks.
+
+from hid_controller.keymap import special_keys, typing_keys
+from hid_controller.sequence import compile_sequence, run_schedule
+
+SYSTEMS = ("windows", "linux", "mac")
+
+
+def create_app(engine, request_pipeline, source=None, request_timeout=30, startup=None, connection=None, motion_rate=None):
+    """The Flask app serving engine's API. source is the HookSource whose hooks /stats counts,
+    startup the StartupTimer it reports, connection the SupervisedSerial /connection reports,
+    motion_rate the MotionRateController pacing mouse movement.
+
+    Unless a request sets "wait": false, it is answered once its action has run and its
+    frames have been written, or with its ticket after request_timeout seconds.
+    """
+    from flask import Flask, jsonify, request
+
+    app = Flask(__name__)
+
+    def routed_action(target, action):
+        # Runs action with its frames going to target's rx.ino and its keys mapped for target's OS
+        def run():
+            with engine.routed(target):
+                return action()
+        return run
+
+    def run_web_action(action, response):
+        # Queue action behind the calling client's earlier requests. "target": name sends it
+        # to that target instead of the active one.
+        target_name = request.json.get('target')
+        if target_name is not None:
+            if target_name not in engine.targets_by_name:
+                return jsonify({"status": "error", "message": f"Unknown target: {target_name}"}), 400
+            action = routed_action(engine.targets_by_name[target_name], action)
+            response = {**response, "target": target_name}
+        client = request.json.get('client') or request.remote_addr
+        ticket = request_pipeline.submit(client, action)
+        if ticket is None:
+            return jsonify({"status": "error", "message": "Too many pending requests"}), 503
+        if request.json.get('wait', True) is False:
+            return jsonify({"status": "queued", "ticket": ticket, **response}), 202
+        result = request_pipeline.wait(ticket, request_timeout)
+        if result["state"] == "error":
+            return jsonify({"status": "error", "ticket": ticket, "message": result["error"]}), 500
+        if result["state"] != "done":
+            return jsonify({"status": result["state"], "ticket": ticket, **response}), 202
+        engine.sink.barrier().wait(request_timeout)
+        return jsonify({"status": "success", "ticket": ticket, **response, **(result["result"] or {})}), 200
+
+    def button_handler(button, action):
+        if button not in ('left', 'right', 'middle') or action not in ('down', 'up', 'click'):
+            return None
+        if action == 'click':
+            return lambda: (engine.button(button, True), engine.button(button, False))
+        return lambda: engine.button(button, action == 'down')
+
+    def build_key_step(step):
+        key = step.get('key')
+        if key not in special_keys and key not in typing_keys:
+            raise ValueError(f"unknown key {key!r}")
+        return lambda: engine.send_web_key(key)
+
+    def build_click_step(step):
+        button = step.get('button', 'left')
+        action = step.get('action', 'click')
+        handler = button_handler(button, action)
+        if handler is None:
+            raise ValueError(f"invalid click {button!r} {action!r}")
+        return handler
+
+    def build_move_step(step):
+        dx = int(step.get('dx', 0))
+        dy = int(step.get('dy', 0))
+        # Goes out in the next motion slot like the hook's moves, which keys and clicks queued
+        # meanwhile overtake, so give a click after a move a delay step of a few ms
+        return lambda: engine.move_target_cursor(dx, dy)
+
+    sequence_step_builders = {'key': build_key_step, 'click': build_click_step, 'move': build_move_step}
+
+    @app.route('/keypress', methods=['POST'])
+    def keypress():
+        try:
+            key = request.json.get('key')
+            if key:
+                return run_web_action(lambda: engine.send_web_key(key), {"key": key})
+            return jsonify({"status": "error", "message": "No key provided"}), 400
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    @app.route('/multikeypress', methods=['POST'])
+    def multikeypress():
+        try:
+            string = request.json.get('content')
+            if not string:
+                return jsonify({"status": "error", "message": "No content provided"}), 400
+            return run_web_action(lambda: engine.type_text(string), {"string": string})
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    @app.route('/sequence', methods=['POST'])
+    def sequence():
+        # {"steps": [{"type": "key", "key": "a"}, {"type": "delay", "ms": 20},
+        #            {"type": "click", "button": "left", "action": "click"}, {"type": "move", "dx": 10, "dy": -5}]}
+        # Sequences longer than MAX_SEQUENCE_TIME are refused, they would hold up the other clients
+        try:
+            schedule = compile_sequence(request.json.get('steps'), sequence_step_builders)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        try:
+            return run_web_action(lambda: run_schedule(schedule), {})
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        # Input lag percentiles per event type and stage, see hid_controller/latency.py
+        result = engine.latency.snapshot() if engine.latency is not None else {}
+        writer = engine.sink
+        if writer is not None:
+            result["serial_writer"] = {
+                "queue_depth": writer.queue_depth(),
+                "queue_depths": {f"{node:02o}" if node is not None else "default": depth for node, depth in writer.queue_depths().items()},
+                "dropped": writer.dropped,
+                "merged_motion": writer.merged_motion,
+                "merged_wheel": writer.merged_wheel,
+                "write_errors": writer.write_errors,
+            }
+        result["requests_pending"] = request_pipeline.pending()
+        if source is not None:
+            result["hooks"] = source.hook_count
+        if startup is not None:
+            result["startup"] = startup.snapshot(writer)
+        if engine.reliable is not None:
+            result["delivery"] = engine.reliable.snapshot()
+        if motion_rate is not None:
+            result["motion_rate"] = motion_rate.snapshot()
+        return jsonify(result), 200
+
+    @app.route('/connection', methods=['GET'])
+    def connection_status():
+        # Whether tx.ino is connected, how often it was lost and how long getting it back took
+        if connection is None:
+            return jsonify({"status": "error", "message": "Connection is not supervised"}), 404
+        result = connection.snapshot()
+        writer = engine.sink
+        if writer is not None:
+            result["replayed"] = writer.replayed
+            result["dropped"] = writer.dropped
+        return jsonify(result), 200
+
+    @app.route('/tickets/<int:ticket>', methods=['GET'])
+    def ticket_status(ticket):
+        result = request_pipeline.status(ticket)
+        if result is None:
+            return jsonify({"status": "error", "message": "Unknown ticket"}), 404
+        return jsonify(result), 200
+
+    @app.route('/turnoff-keyboard-mouse', methods=['POST'])
+    def turnoff_keyboard_mouse():
+        engine.state.allow_switching = False
+        return jsonify({"status": "success"}), 200
+
+    @app.route('/turnon-keyboard-mouse', methods=['POST'])
+    def turnon_keyboard_mouse():
+        engine.state.allow_switching = True
+        return jsonify({"status": "success"}), 200
+
+    @app.route('/mouse_click', methods=['POST'])
+    def mouse_click():
+        try:
+            button = request.json.get('button')
+            action = request.json.get('action')
+            if not (button and action):
+                return jsonify({"status": "error", "message": "No button or action provided"}), 400
+            if button not in ('left', 'right', 'middle'):
+                return jsonify({"status": "error", "message": "Invalid button"}), 400
+            if action not in ('down', 'up'):
+                return jsonify({"status": "error", "message": "Invalid action"}), 400
+            return run_web_action(button_handler(button, action), {"button": button, "action": action})
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    @app.route('/target-system', methods=['POST'])
+    def target_system_route():
+        try:
+            system = request.json.get('target_system')
+            if system not in SYSTEMS:
+                return jsonify({"status": "error", "message": "Invalid target_system"}), 400
+            target = engine.targets_by_name.get(request.json.get('target', engine.state.active_target.name))
+            if target is None:
+                return jsonify({"status": "error", "message": "Unknown target"}), 400
+            engine.set_target_system(system, target)
+            return jsonify({"status": "success", "target": target.name, "target_system": target.system}), 200
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    return app
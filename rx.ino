@@ -7,17 +7,39 @@
 RF24 radio(7, 8);               // nRF24L01(+) radio attached using Getting Started board
 RF24Network network(radio);     // Network uses that radio
 const bool LogSerial = false; // turn on to log serial output for testing, open serial monitor in arduino for program to actually work if this gets turned on
-const uint16_t this_node = 00;  // Address of our node in Octal format
+const uint16_t this_node = 00;  // Address of our node in Octal format: 00, or 011, 021, 031, 041, 051 for
+                                // more targets (see targets in app_with_server.py), one per receiver
 const uint16_t other_node = 01; // Address of the other node in Octal format
 
-// Structure of our payload
+// Structure of our payload, must match tx.ino
+// Only the header and the used part of message are sent, message is not null terminated on air
 struct payload_t {
-  uint8_t type;  // 0 for mouse movement, 1 for mouse click, 2 for keyboard input
-  int8_t x;      // For mouse: x movement; For keyboard: key code; For click: button (1=left, 2=right)
-  int8_t y;      // For mouse: y movement; For keyboard and click: not used
-  char message[128]; // larger payloads
+  uint8_t type;  // 0 for mouse position, 1 for mouse click, 2 for keyboard input, 3 special key, 4 combination, 5 relative mouse movement, 6 key code, 7 key code combination, 8 text, 9 text ack to tx, 10 trace ack to tx, 11 key state, 12 chord, 13 wheel, 14 state snapshot, 15 event ack to tx
+  int8_t x;      // For mouse: x movement; For relative movement: number of steps; For keyboard: key code; For click: button (1=left, 2=right); For text: stream; For snapshots: modifier bits
+  int8_t y;      // For mouse: y movement; For text: chunk index; With PAYLOAD_ACK_FLAG: the seq to ack
   bool isPressed;
+  uint8_t length;     // bytes used in message
+  char message[128];  // larger payloads
 };
+const uint8_t PAYLOAD_HEADER_SIZE = offsetof(payload_t, message);
+
+// Text acks, see FRAME_TEXT_ACK in hid_controller/protocol.py
+const uint8_t TEXT_TYPED = 0;
+const uint8_t TEXT_OUT_OF_ORDER = 2;
+const uint8_t PAYLOAD_TRACE_FLAG = 0x80;  // or'ed into type by tx, answer with how long dispatching took
+const uint8_t PAYLOAD_ACK_FLAG = 0x40;    // or'ed into type by tx, answer with a type 15 payload carrying y
+bool textStarted = false;
+uint8_t textStream = 0;
+uint8_t nextTextChunk = 0;  // chunks are typed strictly in order
+
+// Keys held by type 11 payloads, the same 6KRO report Keyboard.h keeps: up to six keys plus
+// the modifier bits. A press or release that changes nothing sends no report.
+const uint8_t MAX_HELD_KEYS = 6;
+uint8_t heldKeys[MAX_HELD_KEYS];
+uint8_t heldKeyCount = 0;
+uint8_t heldModifiers = 0;
+
+const uint8_t mouseButtons[] = {MOUSE_LEFT, MOUSE_RIGHT, MOUSE_MIDDLE};  // by click payload x - 1
 
 bool skipMove = false;
 bool initialPayloadReceived = false;
@@ -119,6 +141,143 @@ void handleSpecialKey(const char* message, bool isPressed) {
     }
 }
 
+void setKeyState(uint8_t keyCode, bool down) {
+    if (keyCode >= KEY_LEFT_CTRL && keyCode <= KEY_RIGHT_GUI) {
+        uint8_t bit = 1 << (keyCode - KEY_LEFT_CTRL);
+        if (down == ((heldModifiers & bit) != 0)) {
+            return;
+        }
+        heldModifiers ^= bit;
+    } else {
+        uint8_t slot = 0;
+        while (slot < heldKeyCount && heldKeys[slot] != keyCode) {
+            slot++;
+        }
+        if (down == (slot < heldKeyCount)) {
+            return;
+        }
+        if (down) {
+            if (heldKeyCount == MAX_HELD_KEYS) {
+                return;  // rolled over, Keyboard.h has no room for a seventh key either
+            }
+            heldKeys[heldKeyCount++] = keyCode;
+        } else {
+            heldKeys[slot] = heldKeys[--heldKeyCount];
+        }
+    }
+    if (down) {
+        Keyboard.press(keyCode);
+    } else {
+        Keyboard.release(keyCode);
+    }
+}
+
+// Type 14: press and release whatever it takes to hold exactly these keys, modifiers and
+// buttons. The host sends one now and then, so a lost key or button up gets fixed.
+void applySnapshot(uint8_t modifiers, uint8_t buttons, const uint8_t* keyCodes, uint8_t count) {
+    for (uint8_t slot = heldKeyCount; slot > 0; slot--) {
+        uint8_t keyCode = heldKeys[slot - 1];
+        bool keep = false;
+        for (uint8_t i = 0; i < count; i++) {
+            keep = keep || keyCodes[i] == keyCode;
+        }
+        if (!keep) {
+            setKeyState(keyCode, false);
+        }
+    }
+    for (uint8_t bit = 0; bit < 8; bit++) {
+        setKeyState(KEY_LEFT_CTRL + bit, modifiers & (1 << bit));
+    }
+    for (uint8_t i = 0; i < count; i++) {
+        setKeyState(keyCodes[i], true);
+    }
+    for (uint8_t i = 0; i < sizeof(mouseButtons); i++) {
+        bool down = buttons & (1 << i);
+        if (down != Mouse.isPressed(mouseButtons[i])) {
+            if (down) {
+                Mouse.press(mouseButtons[i]);
+            } else {
+                Mouse.release(mouseButtons[i]);
+            }
+        }
+    }
+}
+
+// Combos end with releaseAll(), which lets go of held keys too
+void releaseAllKeys() {
+    Keyboard.releaseAll();
+    heldKeyCount = 0;
+    heldModifiers = 0;
+}
+
+bool isHeldKey(uint8_t keyCode) {
+    for (uint8_t slot = 0; slot < heldKeyCount; slot++) {
+        if (heldKeys[slot] == keyCode) {
+            return true;
+        }
+    }
+    return false;
+}
+
+// Type 12: the modifier bits and keys pressed together, then released again. Keys and
+// modifiers held by type 11 payloads stay down.
+void tapChord(uint8_t modifiers, const uint8_t* keyCodes, uint8_t count) {
+    for (uint8_t bit = 0; bit < 8; bit++) {
+        if (modifiers & (1 << bit)) {
+            Keyboard.press(KEY_LEFT_CTRL + bit);
+        }
+    }
+    for (uint8_t i = 0; i < count; i++) {
+        Keyboard.press(keyCodes[i]);
+    }
+    for (uint8_t i = count; i > 0; i--) {
+        if (!isHeldKey(keyCodes[i - 1])) {
+            Keyboard.release(keyCodes[i - 1]);
+        }
+    }
+    for (uint8_t bit = 0; bit < 8; bit++) {
+        if (modifiers & ~heldModifiers & (1 << bit)) {
+            Keyboard.release(KEY_LEFT_CTRL + bit);
+        }
+    }
+}
+
+void sendTextAck(uint8_t stream, uint8_t index, uint8_t status) {
+  payload_t ack;
+  ack.type = 9;  // Text ack
+  ack.x = stream;
+  ack.y = index;
+  ack.isPressed = false;
+  ack.length = 1;
+  ack.message[0] = status;
+  RF24NetworkHeader header(other_node);
+  network.write(header, &ack, PAYLOAD_HEADER_SIZE + ack.length);
+}
+
+void sendTraceAck(uint16_t dispatchUs) {
+  payload_t ack;
+  ack.type = 10;  // Trace ack
+  ack.x = 0;
+  ack.y = 0;
+  ack.isPressed = false;
+  ack.length = 2;
+  ack.message[0] = (uint8_t)dispatchUs;
+  ack.message[1] = (uint8_t)(dispatchUs >> 8);
+  RF24NetworkHeader header(other_node);
+  network.write(header, &ack, PAYLOAD_HEADER_SIZE + ack.length);
+}
+
+void sendEventAck(uint8_t seq) {
+  payload_t ack;
+  ack.type = 15;  // Event ack
+  ack.x = 0;
+  ack.y = seq;
+  ack.isPressed = false;
+  ack.length = 0;
+  RF24NetworkHeader header(other_node);
+  network.write(header, &ack, PAYLOAD_HEADER_SIZE);
+}
+
 void setup(void) {
   if (LogSerial) {
     Serial.begin(1000000);
@@ -155,9 +314,14 @@ void loop(void) {
     RF24NetworkHeader header;    // If so, grab it
     payload_t payload;
     network.read(header, &payload, sizeof(payload));
+    unsigned long receivedAt = micros();
+    bool traced = payload.type & PAYLOAD_TRACE_FLAG;
+    bool acked = payload.type & PAYLOAD_ACK_FLAG;
+    payload.type &= ~(PAYLOAD_TRACE_FLAG | PAYLOAD_ACK_FLAG);
+    payload.message[min(payload.length, (uint8_t)(sizeof(payload.message) - 1))] = 0;
 
-    if (!initialPayloadReceived) {
-      // Store the first received payload as the initial reference point
+    if (payload.type == 0 && !initialPayloadReceived) {
+      // Store the first absolute position as the initial reference point
       lastX = payload.x;
       lastY = payload.y;
       initialPayloadReceived = true;
@@ -190,24 +354,46 @@ void loop(void) {
           }
           break;
         }
-        case 1: {  // Mouse click
-          if (payload.x == 1) {
+        case 5: {  // Relative mouse movement, payload.x steps of (dx, dy) in message
+          const int8_t* steps = (const int8_t*)payload.message;
+          for (int8_t i = 0; i < payload.x; i++) {
+            Mouse.move(steps[2 * i], steps[2 * i + 1]);
+          }
+          if(LogSerial){
+            Serial.print(F("Mouse move steps: "));
+            Serial.println(payload.x);
+          }
+          break;
+        }
+        case 1: {  // Mouse click, payload.x = 1 left, 2 right, 3 middle
+          if (payload.x >= 1 && payload.x <= 3) {
+            uint8_t button = mouseButtons[payload.x - 1];
             if(payload.isPressed){
-                Mouse.press(MOUSE_LEFT);
+                Mouse.press(button);
             } else {
-                Mouse.release(MOUSE_LEFT);
+                Mouse.release(button);
             }
             if(LogSerial){
-                Serial.println(F("Mouse Left Click"));
+                Serial.print(F("Mouse Click: "));
+                Serial.println(payload.x);
             }
-          } else if (payload.x == 2) {
-            if(payload.isPressed){
-                Mouse.press(MOUSE_RIGHT);
-            } else {
-                Mouse.release(MOUSE_RIGHT);
+          }
+          break;
+        }
+        case 13: {  // Mouse wheel, payload.x = vertical, payload.y = horizontal steps
+          if (payload.x != 0) {
+            Mouse.move(0, 0, payload.x);
+          }
+          if (payload.y != 0) {
+            // Mouse.h has no horizontal wheel, Shift + wheel scrolls sideways on Windows,
+            // macOS and Linux. Wheel down with Shift scrolls right.
+            bool shiftHeld = heldModifiers & (1 << (KEY_LEFT_SHIFT - KEY_LEFT_CTRL));
+            if (!shiftHeld) {
+                Keyboard.press(KEY_LEFT_SHIFT);
             }
-            if(LogSerial){
-                Serial.println(F("Mouse Right Click"));
+            Mouse.move(0, 0, -payload.y);
+            if (!shiftHeld) {
+                Keyboard.release(KEY_LEFT_SHIFT);
             }
           }
           break;
@@ -233,6 +419,81 @@ void loop(void) {
           }
           break;
         }
+        case 6: {  // Key code resolved by the host, no specialKeyMap lookup
+          uint8_t keyCode = (uint8_t)payload.x;
+          if (payload.isPressed) {
+            Keyboard.press(keyCode);
+            Keyboard.release(keyCode);
+          } else {
+            Keyboard.release(keyCode);
+          }
+          if(LogSerial){
+            Serial.print(F("Key Code: "));
+            Serial.println(keyCode);
+          }
+          break;
+        }
+        case 7: {  // Key code combination, payload.length codes in message
+          for (uint8_t i = 0; i < payload.length; i++) {
+            Keyboard.press((uint8_t)payload.message[i]);
+          }
+          releaseAllKeys();
+          if(LogSerial){
+            Serial.print(F("Key Code Combination: "));
+            Serial.println(payload.length);
+          }
+          break;
+        }
+        case 8: {  // Text, payload.x = stream, payload.y = chunk index
+          uint8_t stream = (uint8_t)payload.x;
+          uint8_t index = (uint8_t)payload.y;
+          if (!textStarted || stream != textStream) {
+            textStarted = true;
+            textStream = stream;
+            nextTextChunk = 0;
+          }
+          uint8_t status = TEXT_TYPED;
+          uint8_t offset = index - nextTextChunk;
+          if (offset == 0) {
+            for (uint8_t i = 0; i < payload.length; i++) {
+              Keyboard.write((uint8_t)payload.message[i]);
+            }
+            nextTextChunk++;
+          } else if (offset < 128) {
+            status = TEXT_OUT_OF_ORDER;  // an earlier chunk went missing, the host sends it again
+          }
+          // else a chunk typed already was sent again, just ack it
+          sendTextAck(stream, index, status);
+          if(LogSerial){
+            Serial.print(F("Text chunk: "));
+            Serial.println(index);
+          }
+          break;
+        }
+        case 11: {  // Key state, held until the matching up
+          setKeyState((uint8_t)payload.x, payload.isPressed);
+          if(LogSerial){
+            Serial.print(payload.isPressed ? F("Key Down: ") : F("Key Up: "));
+            Serial.println((uint8_t)payload.x);
+          }
+          break;
+        }
+        case 12: {  // Chord, payload.x = modifier bits, payload.length codes in message
+          tapChord((uint8_t)payload.x, (const uint8_t*)payload.message, payload.length);
+          if(LogSerial){
+            Serial.print(F("Chord: "));
+            Serial.print((uint8_t)payload.x);
+            Serial.print(F(" + "));
+            Serial.println(payload.length);
+          }
+          break;
+        }
+        case 14: {  // State snapshot, payload.x = modifier bits, message = button bits + key codes
+          if (payload.length > 0) {
+            applySnapshot((uint8_t)payload.x, (uint8_t)payload.message[0], (const uint8_t*)payload.message + 1, payload.length - 1);
+          }
+          break;
+        }
         case 4: {  // Key combinations
           if(LogSerial){
             Serial.print(F("Key Combinations: "));
@@ -254,11 +515,18 @@ void loop(void) {
 
             pch = strtok(NULL, ","); // this is to get the next token
           }
-          Keyboard.releaseAll();
+          releaseAllKeys();
           break;
         }
         
       }
     }
+
+    if (acked) {
+      sendEventAck((uint8_t)payload.y);
+    }
+    if (traced) {
+      sendTraceAck(min(micros() - receivedAt, 0xFFFFUL));
+    }
   }
 }
@@ -6,23 +6,509 @@ RF24 radio(7, 8);               // nRF24L01(+) radio attached using Getting Star
 RF24Network network(radio);     // Network uses that radio
 bool logSerial = false;
 const uint16_t this_node = 01;  // Address of our node in Octal format
-const uint16_t other_node = 00; // Address of the other node in Octal format
+const uint16_t other_node = 00; // Address of the first receiver in Octal format
+// Receiver the payloads go to, set by FRAME_ROUTE / "R,node". More receivers are our
+// children 011, 021, 031, 041 and 051, one hop away like other_node.
+uint16_t targetNode = other_node;
 // add string for message
 String eventMessage = "";
 // Structure of our payload
+// Only the header and the used part of message go on air (see sendPayload), so motion, clicks,
+// keys and special key names fit in a single 32 byte nRF24L01 frame (24 bytes after the RF24Network header)
 struct payload_t {
-  uint8_t type;  // 0 for mouse movement, 1 for mouse click, 2 for keyboard input
-  int8_t x;      // x movement or key/button code
-  int8_t y;      // y movement, not used for clicks/keyboard
-  char message[128]; // message
+  uint8_t type;  // 0 for mouse position, 1 for mouse click, 2 for keyboard input, 3 special key, 4 combination, 5 relative mouse movement, 6 key code, 7 key code combination, 8 text, 9 text ack from rx, 10 trace ack from rx, 11 key state, 12 chord, 13 wheel, 14 state snapshot, 15 event ack from rx
+  int8_t x;      // x movement, relative movement step count, key/button code, text stream or modifier bits
+  int8_t y;      // y movement, text chunk index or the seq rx acks (PAYLOAD_ACK_FLAG), not used for clicks/keyboard otherwise
   bool isPressed;
+  uint8_t length;     // bytes used in message
+  char message[128];  // special key names, combinations and movement steps, not null terminated on air
 };
+const uint8_t PAYLOAD_HEADER_SIZE = offsetof(payload_t, message);
 
 bool receiving = false;
 payload_t payload;
 
+// Binary serial framing, see hid_controller/protocol.py
+// [FRAME_SYNC][type][seq][payload ...][crc8]
+const uint8_t FRAME_SYNC = 0xF1;  // 0xF0 | protocol version 1
+const uint8_t FRAME_MOUSE_POSITION = 0x01;  // int16 x, int16 y
+const uint8_t FRAME_CLICK = 0x02;           // uint8 click code
+const uint8_t FRAME_KEY = 0x03;             // uint8 character, uint8 pressed
+const uint8_t FRAME_SPECIAL_KEY = 0x04;     // uint8 pressed, uint8 length, name
+const uint8_t FRAME_COMBO = 0x05;           // uint8 length, comma separated names
+const uint8_t FRAME_MOUSE_DELTA = 0x06;     // int8 dx, int8 dy
+const uint8_t FRAME_MOUSE_DELTA_BATCH = 0x07;  // uint8 count, count x (int8 dx, int8 dy)
+const uint8_t FRAME_KEYCODE = 0x08;         // uint8 Keyboard.h key code, uint8 pressed
+const uint8_t FRAME_KEYCODE_COMBO = 0x09;   // uint8 count, count x uint8 key code
+const uint8_t FRAME_TEXT = 0x0A;            // uint8 stream, uint8 chunk index, uint8 length, text
+const uint8_t FRAME_KEY_STATE = 0x0B;       // uint8 Keyboard.h key code, uint8 down, held until the up
+const uint8_t FRAME_CHORD = 0x0C;           // uint8 modifier bits, uint8 count, count x uint8 key code
+const uint8_t FRAME_MOUSE_WHEEL = 0x0D;     // int8 vertical, int8 horizontal
+const uint8_t FRAME_ROUTE = 0x0E;           // uint16 node the following frames go to
+const uint8_t FRAME_STATE_SNAPSHOT = 0x0F;  // uint8 modifier bits, uint8 button bits, uint8 count, count x uint8 key code
+const uint8_t FRAME_TRACE_FLAG = 0x40;      // or'ed into the type, time this frame and report a FRAME_TRACE
+const uint8_t FRAME_ACK_FLAG = 0x20;        // or'ed into the type, rx acks the seq once applied, see FRAME_EVENT_ACK
+
+// Frames sent back to the host
+const uint8_t FRAME_TEXT_ACK = 0x81;        // uint8 stream, uint8 chunk index, uint8 status
+const uint8_t FRAME_TRACE = 0x82;           // uint8 traced seq, uint8 flags, uint16 radio us, uint16 rx dispatch us, uint16 round trip us
+const uint8_t FRAME_EVENT_ACK = 0x83;       // uint8 acked seq, uint8 status
+const uint8_t FRAME_LINK_STATS = 0x84;      // uint16 radio writes, uint16 failed, uint16 radio us, uint8 serial bytes waiting
+const uint8_t TEXT_RADIO_FAILED = 1;        // statuses 0 (typed) and 2 (out of order) come from rx
+const uint8_t EVENT_APPLIED = 0;
+const uint8_t EVENT_RADIO_FAILED = 1;
+const uint8_t TRACE_RADIO_OK = 0x01;
+uint8_t replySequence = 0;
+
+// Latency trace, the host keeps at most one outstanding
+const uint8_t PAYLOAD_TRACE_FLAG = 0x80;    // or'ed into payload.type, rx answers with a type 10 payload
+const uint8_t PAYLOAD_ACK_FLAG = 0x40;      // or'ed into payload.type with the seq in y, rx answers with a type 15 payload
+bool tracePending = false;
+uint8_t traceSeq = 0;
+unsigned long traceReceivedAt = 0;
+uint16_t traceRadioUs = 0;
+
+// Radio writes since the last FRAME_LINK_STATS, the host paces mouse movement by them
+const unsigned long LINK_STATS_INTERVAL = 50;  // ms
+uint16_t linkWrites = 0;
+uint16_t linkFailures = 0;
+unsigned long linkRadioUs = 0;
+unsigned long linkStatsAt = 0;
+
+const uint8_t FRAME_MAX_BODY = 4 + sizeof(payload.message);  // type, seq, pressed, length + name
+uint8_t frameBody[FRAME_MAX_BODY + 1];  // body followed by the crc
+uint8_t frameLength = 0;  // bytes of the current frame received after the sync byte
+bool inFrame = false;
+
+uint8_t crc8(const uint8_t* data, uint8_t length) {
+  uint8_t crc = 0;
+  while (length--) {
+    crc ^= *data++;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// Body length (type + seq + payload) of the frame collected so far, 0 while it is not known yet
+uint16_t expectedBodyLength() {
+  if (frameLength < 1) return 0;
+  switch (frameBody[0] & ~(FRAME_TRACE_FLAG | FRAME_ACK_FLAG)) {
+    case FRAME_MOUSE_POSITION: return 2 + 4;
+    case FRAME_CLICK: return 2 + 1;
+    case FRAME_KEY: return 2 + 2;
+    case FRAME_SPECIAL_KEY: return frameLength < 4 ? 0 : 2 + 2 + frameBody[3];
+    case FRAME_COMBO: return frameLength < 3 ? 0 : 2 + 1 + frameBody[2];
+    case FRAME_MOUSE_DELTA: return 2 + 2;
+    case FRAME_MOUSE_DELTA_BATCH: return frameLength < 3 ? 0 : 2 + 1 + 2 * frameBody[2];
+    case FRAME_KEYCODE: return 2 + 2;
+    case FRAME_KEYCODE_COMBO: return frameLength < 3 ? 0 : 2 + 1 + frameBody[2];
+    case FRAME_TEXT: return frameLength < 5 ? 0 : 2 + 3 + frameBody[4];
+    case FRAME_KEY_STATE: return 2 + 2;
+    case FRAME_CHORD: return frameLength < 4 ? 0 : 2 + 2 + frameBody[3];
+    case FRAME_MOUSE_WHEEL: return 2 + 2;
+    case FRAME_ROUTE: return 2 + 2;
+    case FRAME_STATE_SNAPSHOT: return frameLength < 5 ? 0 : 2 + 3 + frameBody[4];
+  }
+  return 0xFFFF;  // unknown type
+}
+
+void copyMessage(const char* text, uint8_t length) {
+  length = min(length, (uint8_t)(sizeof(payload.message) - 1));
+  memcpy(payload.message, text, length);
+  payload.message[length] = 0;
+  payload.length = length;
+}
+
+void setMouseMovement(long x, long y) {
+  eventMessage = "Sending Mouse Movement";
+  receiving = true;  // Start receiving mouse data
+
+  // Convert to int8_t values
+  int8_t xValue = (int8_t)x;
+  int8_t yValue = (int8_t)y;
+
+  // Scale the x and y values (adjust for sensitivity)
+  xValue *= 2;
+  yValue *= 2;
+
+  // Limit xValue and yValue to the int8_t range (-128 to 127) to prevent overflow
+  xValue = constrain(xValue, -128, 127);
+  yValue = constrain(yValue, -128, 127);
+
+  payload.type = 0;  // Mouse movement
+  payload.x = xValue;
+  payload.y = yValue;
+  payload.length = 0;
+}
+
+// Relative movement steps, already split into int8 sized pieces by the host
+void setMouseDeltas(const int8_t* steps, uint8_t count) {
+  eventMessage = "Sending Mouse Movement";
+  receiving = true;  // Start receiving mouse data
+  count = min(count, (uint8_t)(sizeof(payload.message) / 2));
+  payload.type = 5;  // Relative mouse movement
+  payload.x = count;
+  payload.y = 0;
+  memcpy(payload.message, steps, 2 * count);
+  payload.length = 2 * count;
+}
+
+// Click codes: 1/2 left down/up, 3/4 right, 5/6 middle
+void setMouseClick(int button) {
+  eventMessage = "Sending Mouse Click";
+  if (button >= 1 && button <= 6){
+    payload.x = (button + 1) / 2;
+    payload.isPressed = button % 2 == 1;
+  }
+  payload.type = 1;  // Mouse click
+  payload.y = 0;       // Not used
+  payload.length = 0;
+}
+
+void setMouseWheel(int8_t vertical, int8_t horizontal) {
+  eventMessage = "Sending Mouse Wheel";
+  payload.type = 13;  // Mouse wheel
+  payload.x = vertical;
+  payload.y = horizontal;
+  payload.isPressed = false;
+  payload.length = 0;
+}
+
+void setKey(char keyCode, bool isPressed) {
+  eventMessage = "Sending keyboard type";
+  payload.type = 2;  // Keyboard input
+  payload.x = keyCode;  // ASCII code of the key
+  payload.y = 0;        // Not used
+  payload.isPressed = isPressed;
+  payload.length = 0;
+}
+
+void setSpecialKey(const char* name, uint8_t length, bool isPressed) {
+  eventMessage = "Sending Special Key";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 3;  // Special key or string input
+  copyMessage(name, length);
+  payload.x = 0;
+  payload.y = 0;
+  payload.isPressed = isPressed;
+}
+
+// Keys already resolved to Keyboard.h codes by the host, no name lookup needed on either board
+void setKeyCode(uint8_t keyCode, bool isPressed) {
+  eventMessage = "Sending Special Key";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 6;  // Key code
+  payload.x = keyCode;
+  payload.y = 0;
+  payload.isPressed = isPressed;
+  payload.length = 0;
+}
+
+// A key going down or up on the host keyboard, rx keeps it held in between
+void setKeyState(uint8_t keyCode, bool down) {
+  eventMessage = "Sending Key State";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 11;  // Key state
+  payload.x = keyCode;
+  payload.y = 0;
+  payload.isPressed = down;
+  payload.length = 0;
+}
+
+// Modifiers as the bits of the HID modifier byte plus the keys tapped with them
+void setChord(uint8_t modifiers, const uint8_t* keyCodes, uint8_t count) {
+  eventMessage = "Sending Chord";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 12;  // Chord
+  copyMessage((const char*)keyCodes, count);
+  payload.x = modifiers;
+  payload.y = 0;
+  payload.isPressed = true;
+}
+
+void setKeyCodeCombo(const uint8_t* keyCodes, uint8_t count) {
+  eventMessage = "Sending Key Combinations";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 7;  // Key code combination
+  copyMessage((const char*)keyCodes, count);
+  payload.x = 0;
+  payload.y = 0;
+  payload.isPressed = true;
+}
+
+void setCombo(const char* keys, uint8_t length) {
+  eventMessage = "Sending Key Combinations";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 4;  // Special key or string input
+  copyMessage(keys, length);
+  // remoe { and } from the string
+  payload.message[strcspn(payload.message, "{")] = 0;
+  payload.message[strcspn(payload.message, "}")] = 0;
+  payload.length = strlen(payload.message);
+  // serial print the message
+  if(logSerial){
+    Serial.println("message");
+    Serial.println(payload.message);
+  }
+  payload.x = 0;
+  payload.y = 0;
+  payload.isPressed = true;
+}
+
+// Everything rx should hold right now: it presses and releases whatever differs, so a lost
+// key or button up can't leave anything stuck for longer than the host's snapshot interval
+void setStateSnapshot(uint8_t modifiers, uint8_t buttons, const uint8_t* keyCodes, uint8_t count) {
+  eventMessage = "Sending State Snapshot";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 14;  // State snapshot
+  count = min(count, (uint8_t)(sizeof(payload.message) - 2));
+  payload.message[0] = buttons;
+  memcpy(payload.message + 1, keyCodes, count);
+  payload.length = 1 + count;
+  payload.x = modifiers;
+  payload.y = 0;
+  payload.isPressed = false;
+}
+
+// Text chunk typed by rx, which acks it back over the radio
+void setText(uint8_t stream, uint8_t index, const char* text, uint8_t length) {
+  eventMessage = "Sending Text";
+  receiving = false;  // Stop receiving mouse data
+  payload.type = 8;  // Text
+  payload.x = stream;
+  payload.y = index;
+  payload.isPressed = false;
+  copyMessage(text, length);
+}
+
+bool sendPayload(bool logResult) {
+  // Send the payload over the RF24 network
+  RF24NetworkHeader header(targetNode);
+  unsigned long started = micros();
+  bool ok = network.write(header, &payload, PAYLOAD_HEADER_SIZE + payload.length);
+  linkRadioUs += micros() - started;
+  linkWrites++;
+  if (!ok) linkFailures++;
+  if(logResult){
+    if(logSerial) Serial.println(ok ? eventMessage : eventMessage + " -- Failed");
+  }
+  return ok;
+}
+
+// Send a frame back to the host, same layout as the frames it sends us
+void sendReply(uint8_t type, const uint8_t* data, uint8_t length) {
+  uint8_t frame[16] = {FRAME_SYNC, type, replySequence++};
+  memcpy(frame + 3, data, length);
+  frame[3 + length] = crc8(frame + 1, 2 + length);
+  Serial.write(frame, 4 + length);
+}
+
+// Report the fate of a text chunk to the host
+void sendTextAck(uint8_t stream, uint8_t index, uint8_t status) {
+  uint8_t data[3] = {stream, index, status};
+  sendReply(FRAME_TEXT_ACK, data, sizeof(data));
+}
+
+// Report the fate of a key state, click or snapshot frame sent with FRAME_ACK_FLAG
+void sendEventAck(uint8_t seq, uint8_t status) {
+  uint8_t data[2] = {seq, status};
+  sendReply(FRAME_EVENT_ACK, data, sizeof(data));
+}
+
+// Report the radio writes since the last report, and how far behind we are reading the serial port
+void sendLinkStats() {
+  uint16_t radioUs = min(linkRadioUs, 0xFFFFUL);
+  uint8_t data[7] = {(uint8_t)linkWrites, (uint8_t)(linkWrites >> 8),
+                     (uint8_t)linkFailures, (uint8_t)(linkFailures >> 8),
+                     (uint8_t)radioUs, (uint8_t)(radioUs >> 8),
+                     (uint8_t)min(Serial.available(), 0xFF)};
+  sendReply(FRAME_LINK_STATS, data, sizeof(data));
+  linkWrites = 0;
+  linkFailures = 0;
+  linkRadioUs = 0;
+}
+
+uint16_t elapsedMicros(unsigned long since) {
+  return min(micros() - since, 0xFFFFUL);
+}
+
+void sendTrace(uint8_t flags, uint16_t rxUs, uint16_t roundTripUs) {
+  uint8_t data[8] = {traceSeq, flags,
+                     (uint8_t)traceRadioUs, (uint8_t)(traceRadioUs >> 8),
+                     (uint8_t)rxUs, (uint8_t)(rxUs >> 8),
+                     (uint8_t)roundTripUs, (uint8_t)(roundTripUs >> 8)};
+  sendReply(FRAME_TRACE, data, sizeof(data));
+}
+
+// Handle one legacy ASCII command line
+void handleAsciiLine() {
+  String inputString = Serial.readStringUntil('\n');  // Read until newline
+  inputString.trim();  // Remove any extraneous whitespace
+
+  if (inputString.startsWith("M")) {
+    int commaIndex = inputString.indexOf(',');
+
+    // Split the string into x and y parts
+    String xStr = inputString.substring(2, commaIndex);
+    String yStr = inputString.substring(commaIndex + 1);
+    setMouseMovement(xStr.toInt(), yStr.toInt());
+
+  } else if (inputString.startsWith("D,")) {  // Relative movement: D,dx,dy[,dx,dy...]
+    int8_t steps[sizeof(payload.message)];
+    uint8_t count = 0;
+    const char* cursor = inputString.c_str() + 2;
+    char* end;
+    while (count < sizeof(steps)) {
+      long value = strtol(cursor, &end, 10);
+      if (end == cursor) break;
+      steps[count++] = (int8_t)constrain(value, -127L, 127L);
+      cursor = (*end == ',') ? end + 1 : end;
+    }
+    setMouseDeltas(steps, count / 2);
+
+  } else if (inputString.startsWith("C,")) {  // Mouse click: C,button
+    setMouseClick(inputString.substring(2).toInt());
+
+  } else if (inputString.startsWith("W,")) {  // Mouse wheel: W,vertical,horizontal
+    int commaIndex = inputString.indexOf(',', 2);
+    long vertical = inputString.substring(2, commaIndex < 0 ? inputString.length() : commaIndex).toInt();
+    long horizontal = commaIndex < 0 ? 0 : inputString.substring(commaIndex + 1).toInt();
+    setMouseWheel((int8_t)constrain(vertical, -127L, 127L), (int8_t)constrain(horizontal, -127L, 127L));
+
+  // keyboard up
+  } else if (inputString.startsWith("U,")) {
+    setKey(inputString.charAt(2), false);
+
+  // keyboard down
+  } else if (inputString.startsWith("K,")) {  // Keyboard input: K,keycode
+    setKey(inputString.charAt(2), true);
+
+  // special key up
+  } else if (inputString.startsWith("T,")) {  // Keyboard input: K,keycode
+    String name = inputString.substring(2);
+    setSpecialKey(name.c_str(), name.length(), false);
+
+  // special key down
+  } else if (inputString.startsWith("S,")) {
+    String name = inputString.substring(2);
+    setSpecialKey(name.c_str(), name.length(), true);
+
+  }  else if (inputString.startsWith("X,")) {
+    String keys = inputString.substring(2);
+    setCombo(keys.c_str(), keys.length());
+
+  } else if (inputString.startsWith("R,")) {  // Route: R,node
+    targetNode = inputString.substring(2).toInt();
+    return;
+  }
+
+  // if input string does not start with M, D, or W,
+  sendPayload(inputString.startsWith("M") == false && inputString.startsWith("D,") == false && inputString.startsWith("W,") == false);
+}
+
+// Handle one complete binary frame, frameBody holds type, seq and payload
+void handleFrame() {
+  const uint8_t* data = frameBody + 2;
+  uint8_t frameType = frameBody[0] & ~(FRAME_TRACE_FLAG | FRAME_ACK_FLAG);
+  bool traced = frameBody[0] & FRAME_TRACE_FLAG;
+  bool acked = frameBody[0] & FRAME_ACK_FLAG;
+  unsigned long receivedAt = micros();
+  if (frameType == FRAME_ROUTE) {
+    targetNode = data[0] | (data[1] << 8);
+    return;
+  }
+  switch (frameType) {
+    case FRAME_MOUSE_POSITION:
+      setMouseMovement((int16_t)(data[0] | (data[1] << 8)), (int16_t)(data[2] | (data[3] << 8)));
+      break;
+    case FRAME_CLICK:
+      setMouseClick(data[0]);
+      break;
+    case FRAME_KEY:
+      setKey((char)data[0], data[1]);
+      break;
+    case FRAME_SPECIAL_KEY:
+      setSpecialKey((const char*)data + 2, data[1], data[0]);
+      break;
+    case FRAME_COMBO:
+      setCombo((const char*)data + 1, data[0]);
+      break;
+    case FRAME_MOUSE_DELTA:
+      setMouseDeltas((const int8_t*)data, 1);
+      break;
+    case FRAME_MOUSE_DELTA_BATCH:
+      setMouseDeltas((const int8_t*)data + 1, data[0]);
+      break;
+    case FRAME_KEYCODE:
+      setKeyCode(data[0], data[1]);
+      break;
+    case FRAME_KEYCODE_COMBO:
+      setKeyCodeCombo(data + 1, data[0]);
+      break;
+    case FRAME_TEXT:
+      setText(data[0], data[1], (const char*)data + 3, data[2]);
+      break;
+    case FRAME_KEY_STATE:
+      setKeyState(data[0], data[1]);
+      break;
+    case FRAME_CHORD:
+      setChord(data[0], data + 2, data[1]);
+      break;
+    case FRAME_MOUSE_WHEEL:
+      setMouseWheel((int8_t)data[0], (int8_t)data[1]);
+      break;
+    case FRAME_STATE_SNAPSHOT:
+      setStateSnapshot(data[0], data[1], data + 3, data[2]);
+      break;
+  }
+  bool logResult = payload.type != 0 && payload.type != 5 && payload.type != 13;  // don't log mouse movement or scrolling
+  if (traced) payload.type |= PAYLOAD_TRACE_FLAG;
+  if (acked) {
+    payload.type |= PAYLOAD_ACK_FLAG;
+    payload.y = frameBody[1];  // rx acks with the frame's seq
+  }
+  bool ok = sendPayload(logResult);
+  if (frameType == FRAME_TEXT && !ok) {
+    sendTextAck(data[0], data[1], TEXT_RADIO_FAILED);
+  }
+  if (acked && !ok) {
+    sendEventAck(frameBody[1], EVENT_RADIO_FAILED);  // the host sends it again
+  }
+  if (traced) {
+    // The rest of the trace arrives with rx's ack, see loop()
+    traceSeq = frameBody[1];
+    traceReceivedAt = receivedAt;
+    traceRadioUs = elapsedMicros(receivedAt);
+    tracePending = ok;
+    if (!ok) sendTrace(0, 0, 0);
+  }
+}
+
+// Feed one byte received after a FRAME_SYNC into the frame parser
+void readFrameByte(uint8_t value) {
+  frameBody[frameLength++] = value;
+  uint16_t bodyLength = expectedBodyLength();
+  if (bodyLength == 0) return;  // header not complete yet
+  if (bodyLength > FRAME_MAX_BODY) {
+    if(logSerial) Serial.println(F("Dropping frame with unknown type"));
+    inFrame = false;
+    return;
+  }
+  if (frameLength < bodyLength + 1) return;  // wait for the rest of the payload and the crc
+
+  inFrame = false;
+  if (crc8(frameBody, bodyLength) != frameBody[bodyLength]) {
+    if(logSerial) Serial.println(F("Dropping frame with bad checksum"));
+    return;
+  }
+  handleFrame();
+}
+
 void setup() {
   Serial.begin(1000000);
+  Serial.setTimeout(20);  // ASCII lines arrive in one burst at 1Mbaud, don't stall on a partial one
   while (!Serial) {
     // Wait for serial port to connect (only needed on native USB boards)
   }
@@ -45,121 +531,38 @@ void setup() {
 
 void loop() {
   // Check for incoming serial data
-  if (Serial.available()) {
-    String inputString = Serial.readStringUntil('\n');  // Read until newline
-    inputString.trim();  // Remove any extraneous whitespace
-
-    if (inputString.startsWith("M")) {
-      eventMessage = "Sending Mouse Movement";
-      receiving = true;  // Start receiving mouse data
-      int commaIndex = inputString.indexOf(',');
-      
-      // Split the string into x and y parts
-      String xStr = inputString.substring(2, commaIndex);
-      String yStr = inputString.substring(commaIndex + 1);
-
-      // Convert the strings to int8_t values
-      int8_t xValue = (int8_t)xStr.toInt();
-      int8_t yValue = (int8_t)yStr.toInt();
-
-      // Scale the x and y values (adjust for sensitivity)
-      xValue *= 2;
-      yValue *= 2;
-
-      // Limit xValue and yValue to the int8_t range (-128 to 127) to prevent overflow
-      xValue = constrain(xValue, -128, 127);
-      yValue = constrain(yValue, -128, 127);
-
-      payload.type = 0;  // Mouse movement
-      payload.x = xValue;
-      payload.y = yValue;
-      
-    } else if (inputString.startsWith("C,")) {  // Mouse click: C,button
-      eventMessage = "Sending Mouse Click";
-      int button = inputString.substring(2).toInt();
-      if (button == 1){
-        payload.x = 1;
-        payload.isPressed = true;
-      } else if (button == 2){
-        payload.x = 1;
-        payload.isPressed = false;
-      } else if (button == 3){
-        payload.x = 2;
-        payload.isPressed = true;
-      } else if (button == 4){
-        payload.x = 2;
-        payload.isPressed = false;
-      }
-      payload.type = 1;  // Mouse click
-      payload.y = 0;       // Not used
-
-    // keyboard up
-    } else if (inputString.startsWith("U,")) {  
-      eventMessage = "Sending keyboard type";
-      char keyCode = inputString.charAt(2);
-      payload.type = 2;  // Keyboard input
-      payload.x = keyCode;  // ASCII code of the key
-      payload.y = 0;        // Not used
-      payload.isPressed = false;
-
-    // keyboard down
-    } else if (inputString.startsWith("K,")) {  // Keyboard input: K,keycode
-      eventMessage = "Sending keyboard type";
-      char keyCode = inputString.charAt(2);
-      payload.type = 2;  // Keyboard input
-      payload.x = keyCode;  // ASCII code of the key
-      payload.y = 0;        // Not used
-      payload.isPressed = true;
-    
-    // special key up
-    } else if (inputString.startsWith("T,")) {  // Keyboard input: K,keycode
-      eventMessage = "Sending Special Key";
-      receiving = false;  // Stop receiving mouse data
-      payload.type = 3;  // Special key or string input
-      strncpy(payload.message, inputString.substring(2).c_str(), sizeof(payload.message) - 1);
-      payload.x = 0;
-      payload.y = 0;
-      payload.isPressed = false;
-
-    // special key down
-    } else if (inputString.startsWith("S,")) {
-      eventMessage = "Sending Special Key";
-      receiving = false;  // Stop receiving mouse data
-      payload.type = 3;  // Special key or string input
-      strncpy(payload.message, inputString.substring(2).c_str(), sizeof(payload.message) - 1);
-      payload.x = 0;
-      payload.y = 0;
-      payload.isPressed = true;
-
-    }  else if (inputString.startsWith("X,")) {
-      eventMessage = "Sending Key Combinations";
-      receiving = false;  // Stop receiving mouse data
-      payload.type = 4;  // Special key or string input
-      strncpy(payload.message, inputString.substring(2).c_str(), sizeof(payload.message) - 1);
-      // remoe { and } from the string
-      payload.message[strcspn(payload.message, "{")] = 0;
-      payload.message[strcspn(payload.message, "}")] = 0;
-      // serial print the message
-      if(logSerial){ 
-        Serial.println("message");
-        Serial.println(payload.message);
-      }
-      payload.x = 0;
-      payload.y = 0;
-      payload.isPressed = true;
-
-    } 
-
-    // Send the payload over the RF24 network
-    RF24NetworkHeader header(other_node);
-    bool ok = network.write(header, &payload, sizeof(payload));
-    // if input string does not start with M,
-    if(inputString.startsWith("M") == false){
-      if(logSerial) Serial.println(ok ? eventMessage : eventMessage + " -- Failed");
+  while (Serial.available()) {
+    if (inFrame) {
+      readFrameByte(Serial.read());
+    } else if (Serial.peek() == FRAME_SYNC) {
+      Serial.read();
+      inFrame = true;
+      frameLength = 0;
+    } else {
+      handleAsciiLine();
     }
-
   }
 
   // Update the RF24 network regularly
   network.update();
+
+  // Pass text, event and trace acks from rx on to the host
+  while (network.available()) {
+    RF24NetworkHeader header;
+    payload_t reply;
+    network.read(header, &reply, sizeof(reply));
+    if (reply.type == 9) {
+      sendTextAck(reply.x, reply.y, reply.message[0]);
+    } else if (reply.type == 15) {
+      sendEventAck(reply.y, EVENT_APPLIED);
+    } else if (reply.type == 10 && tracePending) {
+      tracePending = false;
+      sendTrace(TRACE_RADIO_OK, (uint8_t)reply.message[0] | ((uint8_t)reply.message[1] << 8), elapsedMicros(traceReceivedAt));
+    }
+  }
+
+  if (linkWrites && millis() - linkStatsAt >= LINK_STATS_INTERVAL) {
+    linkStatsAt = millis();
+    sendLinkStats();
+  }
 }